@@ -0,0 +1,126 @@
+import fnmatch
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+from ollama_api import OllamaClient, normalise_model_name
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchResult:
+    model: str
+    optimal_size: int | None = None
+    saved: bool = False
+    elapsed: float = 0.0
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.saved
+
+
+def select_models(patterns: list[str], installed: list[str]) -> list[str]:
+    """
+    Expand names and shell-style globs against the installed models.
+
+    Patterns without a tag also match ":latest". Order follows the patterns
+    and duplicates are dropped; a plain name that is not installed is kept so
+    that it is reported as a failure rather than silently skipped.
+    """
+    selected: list[str] = []
+    for pattern in patterns:
+        if any(c in pattern for c in "*?["):
+            matches = [
+                name
+                for name in installed
+                if fnmatch.fnmatchcase(name, pattern)
+                or fnmatch.fnmatchcase(name, normalise_model_name(pattern))
+            ]
+            if not matches:
+                logger.warning(f"No installed model matches {pattern}")
+        else:
+            target = normalise_model_name(pattern)
+            matches = [n for n in installed if normalise_model_name(n) == target]
+            matches = matches or [pattern]
+        for name in matches:
+            if name not in selected:
+                selected.append(name)
+    return selected
+
+
+def schedule_models(
+    models: list[str], loaded: list[str], sizes: dict[str, int]
+) -> list[str]:
+    """
+    Order the batch so each model is loaded as few times as possible.
+
+    Every model is probed to completion before the next one starts, so its
+    reloads are only the num_ctx changes the search needs. Models that are
+    already resident go first, since their first probe can reuse the loaded
+    runner; the rest follow smallest first.
+    """
+    resident = {normalise_model_name(name) for name in loaded}
+    first = [m for m in models if normalise_model_name(m) in resident]
+    rest = sorted(
+        (m for m in models if normalise_model_name(m) not in resident),
+        key=lambda m: sizes.get(m, 0),
+    )
+    return first + rest
+
+
+def run_batch(
+    models: list[str],
+    optimise: Callable[[str], tuple[int, bool]],
+    client: OllamaClient | None = None,
+) -> list[BatchResult]:
+    """
+    Optimise every model in order, isolating failures.
+
+    Args:
+        models: Models in the order they should be processed
+        optimise: Searches and saves one model, returning (optimal_size, saved)
+        client: When given, each model is unloaded once it is done so that it
+            does not hold VRAM while the next model is measured
+
+    Returns:
+        One BatchResult per model, in processing order
+    """
+    results = []
+    for index, model in enumerate(models, start=1):
+        logger.info(f"[{index}/{len(models)}] Optimizing {model}")
+        result = BatchResult(model)
+        started = time.monotonic()
+        try:
+            result.optimal_size, result.saved = optimise(model)
+            if not result.saved:
+                result.error = "save failed"
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            logger.error(f"Optimization of {model} failed: {e}")
+            result.error = str(e) or type(e).__name__
+        finally:
+            result.elapsed = time.monotonic() - started
+            results.append(result)
+            if client is not None:
+                try:
+                    client.unload(model)
+                except Exception as e:
+                    logger.debug(f"Could not unload {model}: {e}")
+    return results
+
+
+def format_report(results: list[BatchResult], total_elapsed: float) -> str:
+    width = max([len("MODEL")] + [len(r.model) for r in results])
+    lines = [f"{'MODEL':<{width}}  {'NUM_CTX':>9}  {'TIME':>8}  STATUS"]
+    for r in results:
+        size = str(r.optimal_size) if r.optimal_size is not None else "-"
+        status = "saved" if r.ok else f"FAILED: {r.error}"
+        lines.append(f"{r.model:<{width}}  {size:>9}  {r.elapsed:>7.1f}s  {status}")
+    failed = sum(not r.ok for r in results)
+    lines.append(
+        f"{len(results)} model(s), {failed} failed, total wall-clock {total_elapsed:.1f}s"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import sys
+from dataclasses import asdict, dataclass
+from context_searcher import DEFAULT_TOLERANCE, ContextSearcher
+from kv_estimator import KVCacheEstimator, metadata_from_show
+from ollama_sim import GiB, SimulatedController, SimulatedGPU, SimulatedModel, SimulatedOllama
+
+DEFAULT_MIN_CONTEXT = 4096
+
+# Strategy name -> (ContextSearcher strategy, seed with the KV-cache estimate)
+BENCHMARK_STRATEGIES = {
+    "bisect": ("bisect", False),
+    "interpolate": ("interpolate", False),
+    "bisect+estimate": ("bisect", True),
+    "interpolate+estimate": ("interpolate", True),
+}
+
+BENCHMARK_MODELS = [
+    SimulatedModel("phi4-mini:3.8b", int(2.5 * GiB), layers=32, head_count_kv=8),
+    SimulatedModel("llama3.1:8b", int(4.9 * GiB), layers=32, head_count_kv=8),
+    SimulatedModel(
+        "gemma3:12b", int(8.1 * GiB), layers=48, head_count_kv=8, head_dim=256
+    ),
+    SimulatedModel(
+        "qwen3:30b", int(18.6 * GiB), layers=48, head_count_kv=4, context_length=262144
+    ),
+]
+
+BENCHMARK_GPUS = [
+    SimulatedGPU("8GB", 8 * GiB),
+    SimulatedGPU("12GB", 12 * GiB),
+    SimulatedGPU("16GB", 16 * GiB),
+    SimulatedGPU("24GB", 24 * GiB),
+    SimulatedGPU("48GB", 48 * GiB),
+]
+
+
+@dataclass
+class BenchmarkResult:
+    strategy: str
+    model: str
+    gpu: str
+    probes: int
+    loads: int
+    sim_seconds: float
+    result: int
+    optimum: int
+
+    @property
+    def error(self) -> int:
+        """How far below the true optimum the search stopped (negative = too large)."""
+        return self.optimum - self.result
+
+
+def run_case(
+    strategy: str,
+    model: SimulatedModel,
+    gpu: SimulatedGPU,
+    min_size: int = DEFAULT_MIN_CONTEXT,
+    tolerance: int = DEFAULT_TOLERANCE,
+) -> BenchmarkResult:
+    """Run one search against a fresh simulated daemon."""
+    search_strategy, use_estimate = BENCHMARK_STRATEGIES[strategy]
+    sim = SimulatedOllama(gpu, [model])
+    controller = SimulatedController(sim, model.name)
+    searcher = ContextSearcher(controller, strategy=search_strategy, tolerance=tolerance)
+
+    predicted = None
+    if use_estimate:
+        metadata = metadata_from_show(sim.show(model.name), model.weights_bytes, "f16")
+        predicted = KVCacheEstimator(metadata, gpu.vram_bytes).max_context() or None
+
+    max_size = model.context_length
+    result = searcher.find_optimal_size(min_size, max_size, predicted)
+    return BenchmarkResult(
+        strategy=strategy,
+        model=model.name,
+        gpu=gpu.name,
+        probes=len(searcher.samples),
+        loads=sim.loads,
+        sim_seconds=round(sim.clock, 3),
+        result=result,
+        optimum=sim.optimum(model.name, max_size),
+    )
+
+
+def run_benchmark(
+    strategies: list[str] | None = None,
+    models: list[SimulatedModel] | None = None,
+    gpus: list[SimulatedGPU] | None = None,
+    min_size: int = DEFAULT_MIN_CONTEXT,
+    tolerance: int = DEFAULT_TOLERANCE,
+) -> list[BenchmarkResult]:
+    """
+    Run every strategy over the model x GPU matrix. Combinations where the
+    model cannot hold min_size on the GPU at all are skipped.
+    """
+    results = []
+    for model in models or BENCHMARK_MODELS:
+        for gpu in gpus or BENCHMARK_GPUS:
+            if SimulatedOllama(gpu, [model]).optimum(model.name) < min_size:
+                continue
+            for strategy in strategies or list(BENCHMARK_STRATEGIES):
+                results.append(run_case(strategy, model, gpu, min_size, tolerance))
+    return results
+
+
+def summarise(results: list[BenchmarkResult]) -> dict[str, dict]:
+    """Per-strategy mean probes, mean simulated seconds and worst error."""
+    summary: dict[str, dict] = {}
+    for strategy in dict.fromkeys(r.strategy for r in results):
+        rows = [r for r in results if r.strategy == strategy]
+        summary[strategy] = {
+            "cases": len(rows),
+            "mean_probes": sum(r.probes for r in rows) / len(rows),
+            "mean_sim_seconds": sum(r.sim_seconds for r in rows) / len(rows),
+            "max_error": max(r.error for r in rows),
+            "min_error": min(r.error for r in rows),
+        }
+    return summary
+
+
+def format_table(results: list[BenchmarkResult]) -> str:
+    lines = [
+        f"{'STRATEGY':<22}{'MODEL':<18}{'GPU':<6}{'PROBES':>7}{'SIM TIME':>10}{'RESULT':>9}{'OPTIMUM':>9}{'ERROR':>7}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r.strategy:<22}{r.model:<18}{r.gpu:<6}{r.probes:>7}{r.sim_seconds:>9.1f}s{r.result:>9}{r.optimum:>9}{r.error:>7}"
+        )
+    lines.append("")
+    lines.append(f"{'STRATEGY':<22}{'CASES':>6}{'MEAN PROBES':>13}{'MEAN SIM TIME':>15}{'MAX ERROR':>11}")
+    for strategy, row in summarise(results).items():
+        lines.append(
+            f"{strategy:<22}{row['cases']:>6}{row['mean_probes']:>13.2f}{row['mean_sim_seconds']:>14.1f}s{row['max_error']:>11}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark context search strategies against a simulated Ollama"
+    )
+    parser.add_argument(
+        "--strategy",
+        action="append",
+        choices=list(BENCHMARK_STRATEGIES),
+        help="Strategy to run; may be repeated (default: all)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=int,
+        default=DEFAULT_TOLERANCE,
+        help=f"Search tolerance in tokens (default: {DEFAULT_TOLERANCE})",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print results and summary as JSON"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(args.strategy, tolerance=args.tolerance)
+    if args.json:
+        json.dump(
+            {
+                "results": [asdict(r) | {"error": r.error} for r in results],
+                "summary": summarise(results),
+            },
+            sys.stdout,
+            indent=2,
+        )
+        print()
+    else:
+        print(format_table(results))
+
+
+if __name__ == "__main__":
+    main()
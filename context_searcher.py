@@ -1,8 +1,22 @@
 import logging
 import time
+from dataclasses import dataclass
+from ollama_api import OllamaApiController
 from ollama_controller import OllamaController
+from probe_cache import ProbeCache
+from tracing import span
 
 TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_SEED_MARGIN = 0.1
+DEFAULT_TOLERANCE = 1000
+STRATEGIES = ("bisect", "interpolate")
+OBJECTIVES = ("fit", "throughput")
+DEFAULT_CURVE_POINTS = 5
+DEFAULT_THROUGHPUT_TOLERANCE = 5.0
+# First gallop step away from a warm-start hint, as a fraction of the hint
+DEFAULT_GALLOP_STEP = 0.01
+# Placement of a probe that fits on the GPU but eats into the requested headroom
+OVER_HEADROOM = "OVER_HEADROOM"
 
 
 def _log(message: str) -> None:
@@ -12,17 +26,77 @@ def _log(message: str) -> None:
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class ProbeSample:
+    """What the daemon reported after loading the model at num_ctx."""
+
+    num_ctx: int
+    processor: str | None
+    size: int | None = None
+    gpu_fraction: float | None = None
+    elapsed: float | None = None
+    cached: bool = False
+    prompt_tps: float | None = None
+    eval_tps: float | None = None
+    aggregate_tps: float | None = None
+    # Daemon-side phase durations of the probe request, in seconds
+    load_seconds: float | None = None
+    prompt_eval_seconds: float | None = None
+    eval_seconds: float | None = None
+    error: str | None = None
+
+
 class ContextSearcher:
-    def __init__(self, controller: OllamaController) -> None:
+    def __init__(
+        self,
+        controller: OllamaController | OllamaApiController,
+        seed_margin: float = DEFAULT_SEED_MARGIN,
+        strategy: str = "bisect",
+        tolerance: int = DEFAULT_TOLERANCE,
+        cache: ProbeCache | None = None,
+        fingerprint: str | None = None,
+        deadline: float | None = None,
+        options: dict | None = None,
+        max_bytes: int | None = None,
+    ) -> None:
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown search strategy: {strategy}")
         self.controller = controller
+        self.seed_margin = seed_margin
+        self.strategy = strategy
+        self.tolerance = tolerance
+        self.samples: list[ProbeSample] = []
+        # Probe results are only reusable when we know what they were measured on
+        self.cache = cache if fingerprint else None
+        self.fingerprint = fingerprint
+        if fingerprint and options:
+            self.fingerprint += "|" + ",".join(
+                f"{name}={options[name]}" for name in sorted(options)
+            )
+        # time.monotonic() after which no new probe is started
+        self.deadline = deadline
+        # Further options, such as num_batch, held fixed for every probe
+        self.options = options or {}
+        # Largest loaded size that still leaves the requested VRAM headroom free
+        self.max_bytes = max_bytes
 
-    def find_optimal_size(self, min_size: int, max_size: int) -> int:
+    def find_optimal_size(
+        self,
+        min_size: int,
+        max_size: int,
+        predicted: int | None = None,
+        hint: int | None = None,
+    ) -> int:
         """
-        Implements the binary search algorithm to find the optimal context size.
+        Search for the largest context size that fits entirely on GPU.
 
         Args:
             min_size: The minimum context size to search from
             max_size: The maximum context size to search to
+            predicted: Estimated largest size that fits on GPU. When given, the
+                search starts from a narrow bracket around it instead of max_size
+            hint: A previously optimal size. When given, the search gallops out
+                from it to bracket the boundary; takes precedence over predicted
 
         Returns:
             The optimal context size that fits entirely on GPU
@@ -30,14 +104,35 @@ class ContextSearcher:
         logger.info(f"Starting context optimization search")
         logger.info(f"Model: {self.controller.model_name}")
         logger.info(f"Search range: {min_size} to {max_size}")
+        logger.info(f"Strategy: {self.strategy}, tolerance: {self.tolerance}")
+
+        low, high, last_good_size = self._cached_bracket(min_size, max_size)
+        if low > max_size:
+            _log(f"Maximum size {max_size} is cached as fitting on GPU")
+            return max_size
+        if low > min_size and (high - low) < self.tolerance:
+            _log(f"Cached probes already resolve the search: {last_good_size}")
+            return last_good_size
+        if (low, high) != (min_size, max_size):
+            _log(f"Cached probes narrow the search range to {low} to {high}")
+            if hint is not None and low <= hint <= high:
+                return self._gallop_search(low, high, hint, last_good_size)
+            if predicted is not None and low <= predicted < high:
+                return self._seeded_search(low, high, predicted, last_good_size)
+            return self._search(low, high, last_good_size)
+
+        if hint is not None:
+            hint = min(max(hint, min_size), max_size)
+            return self._gallop_search(min_size, max_size, hint, min_size)
+
+        if predicted is not None and min_size <= predicted < max_size:
+            return self._seeded_search(min_size, max_size, predicted, min_size)
 
         logger.info(f"Trying maximum size {max_size} first as optimal size")
 
         # Set the maximum context size and attempt to run with it
-        success, monitor_results = self.controller.set_context(max_size)
-        if success:
-            # Monitor validation already provides processor info
-            processor = monitor_results.get("processor", "NOT_FOUND")
+        processor = self._probe(max_size)
+        if processor is not None:
             _log(f"Model processor for max size {max_size}: {processor}")
 
             # If the maximum size works correctly on GPU, use it as optimal size
@@ -50,37 +145,403 @@ class ContextSearcher:
             _log(f"Failed to set maximum size {max_size}, continuing to binary search")
 
         # If maximum size doesn't work, fall back to binary search with proper crash handling
-        low = min_size
-        high = max_size
-        last_good_size = min_size
+        return self._search(min_size, max_size, min_size)
+
+    def _cached_bracket(self, min_size: int, max_size: int) -> tuple[int, int, int]:
+        """
+        Narrow [min_size, max_size] using cached probes for this fingerprint.
+
+        Returns:
+            (low, high, last_good_size) for the remaining search
+        """
+        if self.cache is None:
+            return (min_size, max_size, min_size)
+
+        known = {
+            size: self._placement(entry.get("processor"), entry.get("size"))
+            for size, entry in self.cache.entries_for(self.fingerprint).items()
+        }
+        fits = [
+            size
+            for size, processor in known.items()
+            if min_size <= size <= max_size and processor == "100% GPU"
+        ]
+        last_good_size = max(fits, default=min_size)
+        spills = [
+            size
+            for size, processor in known.items()
+            if last_good_size < size <= max_size
+            and processor in ("CPU", "MIXED", OVER_HEADROOM)
+        ]
+        low = last_good_size + 1 if fits else min_size
+        high = min(spills, default=max_size + 1) - 1
+        return (low, high, last_good_size)
+
+    def _seeded_search(
+        self, min_size: int, max_size: int, predicted: int, last_good_size: int
+    ) -> int:
+        """
+        Confirm an estimated boundary with real probes at the edges of a narrow
+        bracket around it, then search only the part of the range that is left.
+        """
+        margin = max(int(predicted * self.seed_margin), 1)
+        lower = max(min_size, predicted - margin)
+        upper = min(max_size, predicted + margin)
+        _log(f"Estimated maximum size {predicted}, probing bracket {lower} to {upper}")
+
+        if self._probe(lower) != "100% GPU":
+            _log(f"Lower bracket size {lower} does not fit, searching below it")
+            return self._search(min_size, lower - 1, last_good_size)
+
+        if self._probe(upper) == "100% GPU":
+            _log(f"Upper bracket size {upper} fits, searching above it")
+            return self._search(upper + 1, max_size, upper)
+
+        return self._search(lower + 1, upper - 1, lower)
+
+    def _gallop_search(
+        self, min_size: int, max_size: int, hint: int, last_good_size: int
+    ) -> int:
+        """
+        Warm start from a known-good size: step away from the hint with
+        doubling strides until the boundary is bracketed, then refine inside
+        the bracket only.
+        """
+        step = max(int(hint * DEFAULT_GALLOP_STEP), self.tolerance)
+        _log(f"Warm start from {hint}, galloping with an initial step of {step}")
+
+        if self._probe(hint) == "100% GPU":
+            low, high, last_good_size = hint + 1, max_size, hint
+            while low <= max_size:
+                candidate = min(hint + step, max_size)
+                if self._probe(candidate) != "100% GPU":
+                    high = candidate - 1
+                    break
+                last_good_size, low = candidate, candidate + 1
+                if candidate == max_size:
+                    _log(f"Maximum size {max_size} fits on GPU")
+                    return max_size
+                step *= 2
+        else:
+            low, high = min_size, hint - 1
+            while high >= min_size:
+                candidate = max(hint - step, min_size)
+                if self._probe(candidate) == "100% GPU":
+                    last_good_size, low = candidate, candidate + 1
+                    break
+                high = candidate - 1
+                step *= 2
+
+        _log(f"Boundary bracketed between {low} and {high}")
+        if low > high or (high - low) < self.tolerance:
+            _log(f"Warm start completed, optimal size: {last_good_size}")
+            return last_good_size
+        if self.strategy == "interpolate":
+            return self._interpolation_search(low, high, last_good_size)
+        return self._binary_search(low, high, last_good_size, bounded=True)
+
+    def _search(self, low: int, high: int, last_good_size: int) -> int:
+        if self.strategy == "interpolate":
+            return self._interpolation_search(low, high, last_good_size)
+        return self._binary_search(low, high, last_good_size)
+
+    def _probe(self, size: int, use_cache: bool = True) -> str | None:
+        """Set the context size and return the reported processor, or None on failure."""
+        with span("probe", model=self.controller.model_name, num_ctx=size) as record:
+            processor = self._run_probe(size, use_cache)
+            record["outcome"] = processor or "failed"
+            record["cached"] = self.samples[-1].cached if self.samples else False
+            return processor
+
+    def _probe_many(self, sizes: list[int], use_cache: bool = True) -> dict[int, str | None]:
+        """Probe several sizes; the processor reported for each one."""
+        return {size: self._probe(size, use_cache) for size in sizes}
+
+    def _run_probe(self, size: int, use_cache: bool) -> str | None:
+        if use_cache:
+            cached = self._cached_probe(size)
+            if cached is not None:
+                return cached
+
+        self._check_deadline()
+        success, monitor_results, elapsed = self._measure(self.controller, size)
+        return self._record(size, success, monitor_results, elapsed)
+
+    def _cached_probe(self, size: int) -> str | None:
+        """The cached processor for size, recorded as a sample, or None on a miss."""
+        if self.cache is None:
+            return None
+        entry = self.cache.get(self.fingerprint, size)
+        if entry is None:
+            return None
+        processor = self._placement(entry["processor"], entry.get("size"))
+        _log(f"Using cached result for size {size}: {processor}")
+        self.samples.append(
+            ProbeSample(
+                size,
+                processor,
+                entry.get("size"),
+                entry.get("gpu_fraction"),
+                entry.get("elapsed"),
+                cached=True,
+                prompt_tps=entry.get("prompt_tps"),
+                eval_tps=entry.get("eval_tps"),
+                aggregate_tps=entry.get("aggregate_tps"),
+            )
+        )
+        return processor
+
+    def _placement(self, processor: str | None, size: int | None) -> str | None:
+        """The processor label, or OVER_HEADROOM if a GPU-resident size exceeds max_bytes."""
+        if (
+            self.max_bytes is not None
+            and processor == "100% GPU"
+            and size
+            and size > self.max_bytes
+        ):
+            return OVER_HEADROOM
+        return processor
+
+    def _check_deadline(self) -> None:
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise TimeoutError(
+                f"Search time budget exhausted after {len(self.samples)} probe(s)"
+            )
+
+    def _measure(self, controller, size: int) -> tuple[bool, dict, float]:
+        """Run one probe on controller: (success, monitor results, elapsed seconds)."""
+        started = time.monotonic()
+        if self.options:
+            success, monitor_results = controller.set_context(size, self.options)
+        else:
+            success, monitor_results = controller.set_context(size)
+        return (success, monitor_results, time.monotonic() - started)
+
+    def _record(
+        self, size: int, success: bool, monitor_results: dict, elapsed: float
+    ) -> str | None:
+        """Store a measured probe as a sample and in the cache; its processor."""
+        if not success:
+            error = monitor_results.get("error") or "probe failed"
+            self.samples.append(ProbeSample(size, None, elapsed=elapsed, error=error))
+            return None
+        # The cache keeps the daemon's reading; headroom is applied on top of it
+        processor = monitor_results.get("processor") or "NOT_FOUND"
+        sample = ProbeSample(
+            size,
+            self._placement(processor, monitor_results.get("size")),
+            monitor_results.get("size"),
+            monitor_results.get("gpu_fraction"),
+            elapsed,
+            prompt_tps=monitor_results.get("prompt_tps"),
+            eval_tps=monitor_results.get("eval_tps"),
+            aggregate_tps=monitor_results.get("aggregate_tps"),
+            load_seconds=monitor_results.get("load_seconds"),
+            prompt_eval_seconds=monitor_results.get("prompt_eval_seconds"),
+            eval_seconds=monitor_results.get("eval_seconds"),
+        )
+        self.samples.append(sample)
+
+        if self.cache is not None and processor != "NOT_FOUND":
+            self.cache.put(
+                self.fingerprint,
+                size,
+                {
+                    "processor": processor,
+                    "size": sample.size,
+                    "gpu_fraction": sample.gpu_fraction,
+                    "elapsed": elapsed,
+                    "prompt_tps": sample.prompt_tps,
+                    "eval_tps": sample.eval_tps,
+                    "aggregate_tps": sample.aggregate_tps,
+                },
+            )
+        return sample.processor
 
-        _log(f"Starting binary search with range {min_size} to {max_size}")
+    def _binary_search(
+        self, low: int, high: int, last_good_size: int, bounded: bool = False
+    ) -> int:
+        """
+        Bisect on the processor label. When bounded, also stop once a failed
+        probe leaves the bracket narrower than the tolerance.
+        """
+        _log(f"Starting binary search with range {low} to {high}")
 
-        while low <= high:
+        while low <= high and not (bounded and (high - low) < self.tolerance):
             mid = (low + high) // 2
             _log(f"Testing context size: {mid}")
 
-            success, monitor_results = self.controller.set_context(mid)
-            if not success:
+            processor = self._probe(mid)
+            if processor is None:
                 _log(f"Failed to set context size {mid}, skipping...")
                 high = mid - 1
                 continue
 
-            processor = monitor_results.get("processor", "NOT_FOUND")
             _log(f"Model processor for size {mid}: {processor}")
 
             if processor == "100% GPU":
                 last_good_size = mid
                 low = mid + 1
 
-                if (high - low) < 1000:
+                if (high - low) < self.tolerance:
                     _log("Early exit condition met, stopping search")
                     break
             elif processor == "CPU" or processor == "MIXED":
                 high = mid - 1
+            elif processor == OVER_HEADROOM:
+                _log(f"Size {mid} fits on GPU but is over the headroom, trying smaller size")
+                high = mid - 1
             else:
                 _log(f"Model processor not found for size {mid}, trying smaller size")
                 high = mid - 1
 
         _log(f"Binary search completed, optimal size: {last_good_size}")
         return last_good_size
+
+    def fits(self, size: int) -> bool:
+        """
+        Whether a probe of this run or the cache saw size entirely on the GPU.
+        The search falls back to min_size unprobed when nothing fits.
+        """
+        if any(s.num_ctx == size and s.processor == "100% GPU" for s in self.samples):
+            return True
+        if self.cache is None:
+            return False
+        entry = self.cache.get(self.fingerprint, size)
+        return (
+            entry is not None
+            and self._placement(entry.get("processor"), entry.get("size")) == "100% GPU"
+        )
+
+    def throughput_curve(self) -> list[ProbeSample]:
+        """
+        GPU-resident probes measured in this run with a decode rate, one per
+        size, smallest first. Cached rates are left out: they may come from a
+        run that measured differently.
+        """
+        by_size = {
+            s.num_ctx: s
+            for s in self.samples
+            if s.processor == "100% GPU" and s.eval_tps and not s.cached
+        }
+        return [by_size[size] for size in sorted(by_size)]
+
+    def select_by_throughput(
+        self,
+        min_size: int,
+        max_size: int,
+        points: int = DEFAULT_CURVE_POINTS,
+        tolerance_pct: float = DEFAULT_THROUGHPUT_TOLERANCE,
+    ) -> int:
+        """
+        Measure decode tokens/sec across [min_size, max_size] and pick the
+        largest size whose rate is within tolerance_pct of the peak.
+
+        Args:
+            min_size: Smallest size on the curve
+            max_size: Largest size on the curve, normally the GPU boundary
+            points: Number of evenly spaced sizes to measure
+            tolerance_pct: Allowed decode slowdown from the peak, in percent
+
+        Returns:
+            The chosen context size, or max_size if nothing could be measured
+        """
+        if points > 1 and max_size > min_size:
+            step = (max_size - min_size) / (points - 1)
+            sizes = sorted({int(min_size + i * step) for i in range(points)})
+        else:
+            sizes = [max_size]
+
+        measured = {s.num_ctx for s in self.throughput_curve()}
+        missing = [size for size in sizes if size not in measured]
+        if missing:
+            _log(f"Measuring throughput at context sizes: {missing}")
+            self._probe_many(missing, use_cache=False)
+
+        curve = [s for s in self.throughput_curve() if min_size <= s.num_ctx <= max_size]
+        if not curve:
+            _log("No throughput measurements available, keeping the largest size")
+            return max_size
+
+        peak = max(s.eval_tps for s in curve)
+        floor = peak * (1 - tolerance_pct / 100)
+        chosen = max(s.num_ctx for s in curve if s.eval_tps >= floor)
+        _log(
+            f"Peak decode rate {peak:.1f} tokens/s, choosing {chosen} "
+            f"(largest size within {tolerance_pct:g}% of peak)"
+        )
+        return chosen
+
+    def _predict_boundary(self) -> int | None:
+        """
+        Fit loaded size against num_ctx over the probes so far and solve for
+        the num_ctx at which the model would just fill the VRAM it was given.
+
+        The VRAM capacity is taken from offloaded probes (size x GPU fraction)
+        and is a slight underestimate, since layers are offloaded whole.
+        """
+        points = [(s.num_ctx, s.size) for s in self.samples if s.size]
+        offloaded = [
+            s.size * s.gpu_fraction
+            for s in self.samples
+            if s.size and s.gpu_fraction is not None and s.gpu_fraction < 1.0
+        ]
+        if not (offloaded or self.max_bytes) or len({x for x, _ in points}) < 2:
+            return None
+
+        fitted = [s.size for s in self.samples if s.size and s.processor == "100% GPU"]
+        capacity = max(offloaded + fitted) if offloaded else self.max_bytes
+        if self.max_bytes is not None:
+            capacity = min(capacity, self.max_bytes)
+
+        n = len(points)
+        mean_x = sum(x for x, _ in points) / n
+        mean_y = sum(y for _, y in points) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in points)
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        if slope <= 0:
+            return None
+        intercept = mean_y - slope * mean_x
+        return int((capacity - intercept) / slope)
+
+    def _interpolation_search(self, low: int, high: int, last_good_size: int) -> int:
+        """
+        Search by solving the fitted size-vs-context line for the VRAM limit.
+        Falls back to a midpoint when there is nothing to fit yet, and after
+        any predicted or stepped probe that did not fit.
+        """
+        _log(f"Starting interpolation search with range {low} to {high}")
+        overshoot = 0
+        bisect_next = False
+
+        while low <= high and (high - low) >= self.tolerance:
+            predicted = None if bisect_next else self._predict_boundary()
+
+            if predicted is None:
+                candidate = (low + high) // 2
+                bisect_next = False
+            elif predicted < low + self.tolerance:
+                # The fit says the boundary is at or just past the known-good
+                # size: step over it with a growing stride to close the bracket.
+                candidate = min(high, low + self.tolerance * 2**overshoot - 1)
+                overshoot += 1
+                bisect_next = True
+            else:
+                candidate = min(predicted, high)
+                overshoot = 0
+                bisect_next = True
+
+            _log(f"Testing context size: {candidate}")
+            processor = self._probe(candidate)
+            _log(f"Model processor for size {candidate}: {processor}")
+
+            if processor == "100% GPU":
+                last_good_size = candidate
+                low = candidate + 1
+                bisect_next = False
+            else:
+                high = candidate - 1
+                overshoot = 0
+
+        _log(f"Interpolation search completed, optimal size: {last_good_size}")
+        return last_good_size
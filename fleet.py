@@ -0,0 +1,198 @@
+import contextlib
+import http.client
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+from isolation import Isolation
+from ollama_api import OllamaApiController, OllamaApiError, OllamaClient, model_digest
+from tracing import span
+
+TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_FINGERPRINT_TIMEOUT = 10
+UNKNOWN_GPU = "unknown"
+
+logger = logging.getLogger(__name__)
+
+
+def _log(message: str) -> None:
+    logger.info(f"[{time.strftime(TIMEFORMAT)}] {message}")
+
+
+@dataclass
+class FleetHost:
+    """One Ollama host of the fleet and what happened to it."""
+
+    host: str
+    gpu: str = UNKNOWN_GPU
+    version: str | None = None
+    digest: str | None = None
+    # "searched" for the host a group was optimised on, "applied" for the rest
+    role: str | None = None
+    num_ctx: int | None = None
+    processor: str | None = None
+    saved: bool = False
+    elapsed: float = 0.0
+    error: str | None = None
+
+    @property
+    def group(self) -> str:
+        digest = (self.digest or "").removeprefix("sha256:")[:12] or "-"
+        # Without a label nothing says two hosts share hardware
+        gpu = f"{self.gpu}@{self.host}" if self.gpu == UNKNOWN_GPU else self.gpu
+        return f"{gpu}|ollama {self.version}|{digest}"
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.saved
+
+
+def parse_fleet_host(text: str) -> tuple[str, str]:
+    """
+    Split a HOST[=GPU] fleet entry. The GPU label names the hardware, for
+    example "RTX4090-24GB"; hosts are only grouped together when it matches,
+    and an unlabelled host is searched on its own.
+    """
+    host, _, gpu = text.partition("=")
+    if not host:
+        raise ValueError(f"expected HOST[=GPU], got '{text}'")
+    return (host, gpu or UNKNOWN_GPU)
+
+
+class Fleet:
+    """
+    Optimises one model across many Ollama hosts.
+
+    Hosts are grouped by GPU label, Ollama version and model digest. The
+    optimise callback searches and saves on one host, returning (num_ctx,
+    saved, placement at num_ctx). One search runs per group, concurrently across groups, and its result is
+    applied to the other hosts of the group after a single probe at that
+    size confirms it stays on the GPU there. With isolate, every other model
+    on a host is unloaded around that probe and loaded again after it; the
+    optimise callback isolates its own search.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        hosts: list[tuple[str, str]],
+        optimise: Callable[[FleetHost], tuple[int, bool, str | None]],
+        fingerprint_timeout: float = DEFAULT_FINGERPRINT_TIMEOUT,
+        isolate: bool = False,
+    ) -> None:
+        self.model_name = model_name
+        self.hosts = [FleetHost(host, gpu) for host, gpu in dict(hosts).items()]
+        self.optimise = optimise
+        self.fingerprint_timeout = fingerprint_timeout
+        self.isolate = isolate
+
+    def fingerprint(self, member: FleetHost) -> None:
+        """Read the daemon version and model digest of a host."""
+        client = OllamaClient(member.host)
+        try:
+            member.version = client.version(timeout=self.fingerprint_timeout)
+            member.digest = model_digest(client, self.model_name)
+            if member.digest is None:
+                member.error = f"{self.model_name} is not installed"
+        except (OllamaApiError, OSError, http.client.HTTPException) as e:
+            member.error = f"unreachable: {e}"
+        finally:
+            client.close()
+
+    def groups(self) -> dict[str, list[FleetHost]]:
+        """Reachable hosts that have the model, by group."""
+        groups: dict[str, list[FleetHost]] = {}
+        for member in self.hosts:
+            if member.error is None:
+                groups.setdefault(member.group, []).append(member)
+        return groups
+
+    def run(self) -> list[FleetHost]:
+        with ThreadPoolExecutor(max_workers=len(self.hosts) or 1) as executor:
+            list(executor.map(self.fingerprint, self.hosts))
+
+        groups = self.groups()
+        _log(f"{len(self.hosts)} host(s) in {len(groups)} group(s)")
+        if groups:
+            with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                list(executor.map(self._run_group, groups.values()))
+        return self.hosts
+
+    def _run_group(self, members: list[FleetHost]) -> None:
+        searched, rest = members[0], members[1:]
+        started = time.monotonic()
+        with span("fleet.search", host=searched.host, group=searched.group) as record:
+            searched.role = "searched"
+            try:
+                searched.num_ctx, searched.saved, searched.processor = self.optimise(searched)
+                if not searched.saved:
+                    searched.error = "save failed"
+                elif searched.processor not in (None, "100% GPU"):
+                    searched.error = f"search result: {searched.processor}"
+            except Exception as e:
+                searched.error = str(e) or type(e).__name__
+            searched.elapsed = time.monotonic() - started
+            record["num_ctx"] = searched.num_ctx
+
+        if searched.num_ctx is None:
+            for member in rest:
+                member.error = f"search on {searched.host} failed"
+            return
+        _log(
+            f"Group {searched.group}: num_ctx {searched.num_ctx}, "
+            f"applying to {len(rest)} host(s)"
+        )
+        if rest:
+            with ThreadPoolExecutor(max_workers=len(rest)) as executor:
+                list(executor.map(lambda m: self._apply(m, searched.num_ctx), rest))
+
+    def _apply(self, member: FleetHost, num_ctx: int) -> None:
+        """Probe num_ctx once on the host and save it there if it stays on the GPU."""
+        member.role = "applied"
+        member.num_ctx = num_ctx
+        started = time.monotonic()
+        client = OllamaClient(member.host)
+        controller = OllamaApiController(self.model_name, host=member.host)
+        controller.probe_mode = "minimal"
+        isolation = (
+            Isolation(client, exclude=[self.model_name])
+            if self.isolate
+            else contextlib.nullcontext()
+        )
+        try:
+            with isolation, span("fleet.apply", host=member.host, num_ctx=num_ctx) as record:
+                success, results = controller.set_context(num_ctx)
+                member.processor = results.get("processor") if success else None
+                record["outcome"] = member.processor or "failed"
+                if member.processor != "100% GPU":
+                    member.error = f"check probe: {member.processor or 'failed'}"
+                else:
+                    member.saved = controller.save_model(num_ctx)
+                    if not member.saved:
+                        member.error = "save failed"
+        except (OllamaApiError, OSError, http.client.HTTPException) as e:
+            member.error = f"isolation failed: {e}"
+        finally:
+            controller.close()
+            client.close()
+            member.elapsed = time.monotonic() - started
+
+
+def format_fleet_report(model_name: str, hosts: list[FleetHost]) -> str:
+    width = max([len("HOST")] + [len(m.host) for m in hosts])
+    group_width = max([len("GROUP")] + [len(m.group) for m in hosts])
+    lines = [
+        f"Fleet results for {model_name}:",
+        f"{'HOST':<{width}}  {'GROUP':<{group_width}}  {'ROLE':<8}  {'NUM_CTX':>8}  "
+        f"{'PLACEMENT':<9}  {'TIME':>8}  STATUS",
+    ]
+    for m in hosts:
+        status = "saved" if m.ok else f"FAILED: {m.error}"
+        lines.append(
+            f"{m.host:<{width}}  {m.group:<{group_width}}  {m.role or '-':<8}  "
+            f"{m.num_ctx or '-':>8}  {m.processor or '-':<9}  {m.elapsed:>7.1f}s  {status}"
+        )
+    saved = sum(1 for m in hosts if m.ok)
+    lines.append(f"{saved} of {len(hosts)} host(s) saved")
+    return "\n".join(lines)
@@ -0,0 +1,374 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from kv_estimator import ModelMetadata, detect_kv_cache_type, metadata_from_show
+
+logger = logging.getLogger(__name__)
+
+
+GGUF_MAGIC = b"GGUF"
+GGUF_VERSIONS = (2, 3)
+DEFAULT_REGISTRY = "registry.ollama.ai"
+DEFAULT_NAMESPACE = "library"
+DEFAULT_TAG = "latest"
+MODEL_MEDIA_TYPE = "application/vnd.ollama.image.model"
+DEFAULT_MAX_ENTRIES = 256
+CACHE_VERSION = 1
+# Bytes mapped for the first attempt at the header; doubled while too short
+HEADER_MAP_BYTES = 16 * 1024**2
+# Arrays longer than this (token lists, merges) are skipped instead of decoded
+MAX_ARRAY_ITEMS = 4096
+
+# GGUF metadata value types: struct format of the scalar types
+_SCALAR_FORMATS = {
+    0: "<B",  # uint8
+    1: "<b",  # int8
+    2: "<H",  # uint16
+    3: "<h",  # int16
+    4: "<I",  # uint32
+    5: "<i",  # int32
+    6: "<f",  # float32
+    7: "<?",  # bool
+    10: "<Q",  # uint64
+    11: "<q",  # int64
+    12: "<d",  # float64
+}
+_TYPE_STRING = 8
+_TYPE_ARRAY = 9
+
+# ggml tensor types: (elements per block, bytes per block)
+GGML_TYPE_SIZES = {
+    0: (1, 4),  # F32
+    1: (1, 2),  # F16
+    2: (32, 18),  # Q4_0
+    3: (32, 20),  # Q4_1
+    6: (32, 22),  # Q5_0
+    7: (32, 24),  # Q5_1
+    8: (32, 34),  # Q8_0
+    9: (32, 36),  # Q8_1
+    10: (256, 84),  # Q2_K
+    11: (256, 110),  # Q3_K
+    12: (256, 144),  # Q4_K
+    13: (256, 176),  # Q5_K
+    14: (256, 210),  # Q6_K
+    15: (256, 292),  # Q8_K
+    16: (256, 66),  # IQ2_XXS
+    17: (256, 74),  # IQ2_XS
+    18: (256, 98),  # IQ3_XXS
+    19: (256, 50),  # IQ1_S
+    20: (32, 18),  # IQ4_NL
+    21: (256, 110),  # IQ3_S
+    22: (256, 82),  # IQ2_S
+    23: (256, 136),  # IQ4_XS
+    24: (1, 1),  # I8
+    25: (1, 2),  # I16
+    26: (1, 4),  # I32
+    27: (1, 8),  # I64
+    28: (1, 8),  # F64
+    29: (256, 56),  # IQ1_M
+    30: (1, 2),  # BF16
+    34: (256, 54),  # TQ1_0
+    35: (256, 66),  # TQ2_0
+}
+
+
+def default_models_dir() -> str:
+    return os.environ.get("OLLAMA_MODELS") or os.path.expanduser("~/.ollama/models")
+
+
+def default_cache_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "optimise-ollama-model", "metadata.json")
+
+
+@dataclass
+class GGUFTensor:
+    name: str
+    shape: list[int]
+    ggml_type: int
+    offset: int
+
+    @property
+    def n_bytes(self) -> int | None:
+        """Size of the tensor data, or None for an unknown ggml type."""
+        sizes = GGML_TYPE_SIZES.get(self.ggml_type)
+        if sizes is None:
+            return None
+        elements = 1
+        for dim in self.shape:
+            elements *= dim
+        block_elements, block_bytes = sizes
+        return -(-elements // block_elements) * block_bytes
+
+
+@dataclass
+class GGUFFile:
+    """The header of a GGUF file: metadata key-values and tensor infos."""
+
+    version: int
+    metadata: dict = field(default_factory=dict)
+    tensors: list[GGUFTensor] = field(default_factory=list)
+
+    @property
+    def architecture(self) -> str | None:
+        return self.metadata.get("general.architecture")
+
+    @property
+    def weights_bytes(self) -> int:
+        return sum(tensor.n_bytes or 0 for tensor in self.tensors)
+
+
+class _Truncated(ValueError):
+    pass
+
+
+class _HeaderReader:
+    """Sequential little-endian reads from a buffer, touching only the bytes read."""
+
+    def __init__(self, buffer) -> None:
+        self.buffer = buffer
+        self.pos = 0
+
+    def _skip(self, size: int) -> int:
+        start, self.pos = self.pos, self.pos + size
+        if self.pos > len(self.buffer):
+            raise _Truncated("GGUF header is truncated")
+        return start
+
+    def _take(self, size: int):
+        start = self._skip(size)
+        return self.buffer[start : self.pos]
+
+    def scalar(self, fmt: str):
+        return struct.unpack(fmt, self._take(struct.calcsize(fmt)))[0]
+
+    def string(self) -> str:
+        length = self.scalar("<Q")
+        return self._take(length).decode("utf-8", errors="replace")
+
+    def skip_string(self) -> None:
+        self._skip(self.scalar("<Q"))
+
+    def value(self, value_type: int):
+        fmt = _SCALAR_FORMATS.get(value_type)
+        if fmt is not None:
+            return self.scalar(fmt)
+        if value_type == _TYPE_STRING:
+            return self.string()
+        if value_type == _TYPE_ARRAY:
+            item_type = self.scalar("<I")
+            count = self.scalar("<Q")
+            if count > MAX_ARRAY_ITEMS:
+                self.skip_array(item_type, count)
+                return None
+            return [self.value(item_type) for _ in range(count)]
+        raise ValueError(f"Unknown GGUF value type {value_type}")
+
+    def skip_array(self, item_type: int, count: int) -> None:
+        fmt = _SCALAR_FORMATS.get(item_type)
+        if fmt is not None:
+            self._skip(struct.calcsize(fmt) * count)
+        elif item_type == _TYPE_STRING:
+            for _ in range(count):
+                self.skip_string()
+        else:
+            for _ in range(count):
+                self.value(item_type)
+
+
+def parse_gguf(buffer) -> GGUFFile:
+    """
+    Parse the header of a GGUF v2/v3 file from a buffer.
+
+    Raises:
+        ValueError: if the buffer is not a supported GGUF header
+    """
+    reader = _HeaderReader(buffer)
+    if reader._take(4) != GGUF_MAGIC:
+        raise ValueError("Not a GGUF file")
+    version = reader.scalar("<I")
+    if version not in GGUF_VERSIONS:
+        raise ValueError(f"Unsupported GGUF version {version}")
+    tensor_count = reader.scalar("<Q")
+    kv_count = reader.scalar("<Q")
+
+    gguf = GGUFFile(version)
+    for _ in range(kv_count):
+        key = reader.string()
+        value = reader.value(reader.scalar("<I"))
+        if value is not None:
+            gguf.metadata[key] = value
+    for _ in range(tensor_count):
+        name = reader.string()
+        n_dims = reader.scalar("<I")
+        shape = [reader.scalar("<Q") for _ in range(n_dims)]
+        ggml_type = reader.scalar("<I")
+        offset = reader.scalar("<Q")
+        gguf.tensors.append(GGUFTensor(name, shape, ggml_type, offset))
+    return gguf
+
+
+def read_gguf(path: str) -> GGUFFile:
+    """
+    Read the header of a GGUF file.
+
+    Only the start of the file is memory-mapped, and the mapping is doubled
+    until the header fits, so the weights that follow are never read.
+    """
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        length = min(HEADER_MAP_BYTES, file_size)
+        while True:
+            with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as mapped:
+                try:
+                    return parse_gguf(mapped)
+                except _Truncated:
+                    if length >= file_size:
+                        raise
+            length = min(length * 2, file_size)
+
+
+def manifest_path(model_name: str, models_dir: str | None = None) -> str:
+    """Path of a model's manifest in the local Ollama store."""
+    parts = model_name.split("/")
+    parts[-1], _, tag = parts[-1].partition(":")
+    if len(parts) == 1:
+        parts = [DEFAULT_REGISTRY, DEFAULT_NAMESPACE] + parts
+    elif len(parts) == 2:
+        parts = [DEFAULT_REGISTRY] + parts
+    return os.path.join(
+        models_dir or default_models_dir(), "manifests", *parts, tag or DEFAULT_TAG
+    )
+
+
+def resolve_blob(model_name: str, models_dir: str | None = None) -> tuple[str, str] | None:
+    """
+    Find the GGUF blob of a model in the local Ollama store.
+
+    Returns:
+        (digest, blob path), or None if the model is not stored locally
+    """
+    models_dir = models_dir or default_models_dir()
+    try:
+        with open(manifest_path(model_name, models_dir)) as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.debug(f"No local manifest for {model_name}: {e}")
+        return None
+    digest = next(
+        (
+            layer.get("digest")
+            for layer in manifest.get("layers", [])
+            if layer.get("mediaType") == MODEL_MEDIA_TYPE
+        ),
+        None,
+    )
+    if not digest:
+        return None
+    path = os.path.join(models_dir, "blobs", digest.replace(":", "-"))
+    return (digest, path) if os.path.exists(path) else None
+
+
+def metadata_from_gguf(gguf: GGUFFile, kv_cache_type: str | None = None) -> ModelMetadata:
+    """
+    Build ModelMetadata from a GGUF header.
+
+    /api/show reports model_info under the same keys as the GGUF metadata,
+    so the header is read the same way.
+    """
+    return metadata_from_show({"model_info": gguf.metadata}, gguf.weights_bytes, kv_cache_type)
+
+
+class MetadataCache:
+    """
+    On-disk cache of model metadata keyed by blob digest.
+
+    Blobs are content-addressed, so an entry never goes stale; the oldest
+    entries are dropped once max_entries is reached.
+    """
+
+    def __init__(self, path: str | None = None, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable metadata cache {self.path}: {e}")
+            return
+        if data.get("version") != CACHE_VERSION:
+            return
+        self._entries.update(data.get("entries", {}))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, digest: str) -> dict | None:
+        return self._entries.get(digest)
+
+    def put(self, digest: str, entry: dict) -> None:
+        self._entries[digest] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.save()
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": CACHE_VERSION, "entries": self._entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write metadata cache {self.path}: {e}")
+
+
+def read_model_metadata(
+    model_name: str,
+    models_dir: str | None = None,
+    cache: MetadataCache | None = None,
+    kv_cache_type: str | None = None,
+) -> ModelMetadata | None:
+    """
+    Metadata of a locally stored model, read without the Ollama daemon.
+
+    Returns:
+        The metadata, or None if the model is not in the local store or its
+        header cannot be used for an estimate
+    """
+    blob = resolve_blob(model_name, models_dir)
+    if blob is None:
+        return None
+    digest, path = blob
+
+    entry = cache.get(digest) if cache is not None else None
+    if entry is None:
+        try:
+            metadata = metadata_from_gguf(read_gguf(path))
+        except (OSError, ValueError) as e:
+            logger.info(f"Could not read the GGUF header of {model_name}: {e}")
+            return None
+        entry = {
+            "block_count": metadata.block_count,
+            "head_count_kv": metadata.head_count_kv,
+            "key_length": metadata.key_length,
+            "value_length": metadata.value_length,
+            "weights_bytes": metadata.weights_bytes,
+            "context_length": metadata.context_length,
+        }
+        if cache is not None:
+            cache.put(digest, entry)
+
+    return ModelMetadata(**entry, kv_cache_type=kv_cache_type or detect_kv_cache_type())
@@ -0,0 +1,133 @@
+import http.client
+import logging
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from ollama_api import OllamaApiError, OllamaClient, normalise_model_name
+from tracing import span
+
+TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+# Unloading is asynchronous; wait this long for the models to leave /api/ps
+UNLOAD_TIMEOUT = 30.0
+UNLOAD_POLL_INTERVAL = 0.25
+# An expiry further away than this means the model was loaded with keep_alive -1
+KEEP_ALIVE_FOREVER_AFTER = 365 * 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+def _log(message: str) -> None:
+    logger.info(f"[{time.strftime(TIMEFORMAT)}] {message}")
+
+
+@dataclass
+class ResidentModel:
+    """A model that was loaded before the search, and how to load it again."""
+
+    name: str
+    context_length: int | None = None
+    # Seconds it had left, -1 to stay loaded, None for the daemon default
+    keep_alive: int | None = None
+
+
+def keep_alive_from(expires_at: str | None, now: datetime | None = None) -> int | None:
+    """
+    The keep_alive that reproduces an /api/ps expires_at timestamp.
+
+    Ollama reports RFC 3339 times with up to nanosecond precision, which
+    datetime only parses to microseconds.
+    """
+    if not expires_at:
+        return None
+    text = re.sub(r"(\.\d{6})\d+", r"\1", expires_at.replace("Z", "+00:00"))
+    try:
+        expires = datetime.fromisoformat(text)
+    except ValueError:
+        logger.debug(f"Unparseable expires_at: {expires_at}")
+        return None
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    remaining = (expires - (now or datetime.now(timezone.utc))).total_seconds()
+    if remaining > KEEP_ALIVE_FOREVER_AFTER:
+        return -1
+    return max(int(remaining), 1)
+
+
+class Isolation:
+    """
+    Context manager that measures with no other model taking VRAM.
+
+    On entry the loaded models are recorded with their context and remaining
+    keep_alive and then unloaded. On exit, also after an error or Ctrl-C,
+    they are loaded again as they were. The models being tuned are left
+    alone, since the search reloads them anyway.
+    """
+
+    def __init__(
+        self,
+        client: OllamaClient,
+        exclude: list[str] | None = None,
+        unload_timeout: float = UNLOAD_TIMEOUT,
+    ) -> None:
+        self.client = client
+        self.exclude = {normalise_model_name(name) for name in exclude or []}
+        self.unload_timeout = unload_timeout
+        self.resident: list[ResidentModel] = []
+
+    def __enter__(self) -> "Isolation":
+        with span("isolation.unload") as record:
+            self.resident = [
+                ResidentModel(
+                    normalise_model_name(entry.get("name", "")),
+                    entry.get("context_length") or None,
+                    keep_alive_from(entry.get("expires_at")),
+                )
+                for entry in self.client.ps()
+                if normalise_model_name(entry.get("name", "")) not in self.exclude
+            ]
+            record["models"] = len(self.resident)
+            try:
+                for model in self.resident:
+                    _log(f"Unloading {model.name} for an isolated measurement")
+                    self.client.unload(model.name)
+                self._wait_unloaded()
+            except BaseException:
+                self.restore()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.restore()
+        return False
+
+    def _wait_unloaded(self) -> None:
+        names = {model.name for model in self.resident}
+        deadline = time.monotonic() + self.unload_timeout
+        while names:
+            loaded = {normalise_model_name(e.get("name", "")) for e in self.client.ps()}
+            if not names & loaded:
+                return
+            if time.monotonic() > deadline:
+                still = ", ".join(sorted(names & loaded))
+                logger.warning(f"Still loaded after unloading: {still}")
+                return
+            time.sleep(UNLOAD_POLL_INTERVAL)
+
+    def restore(self) -> list[str]:
+        """Load every recorded model again; returns the ones that failed."""
+        failed = []
+        with span("isolation.restore", models=len(self.resident)) as record:
+            for model in self.resident:
+                options = {"num_ctx": model.context_length} if model.context_length else None
+                try:
+                    self.client.generate(
+                        model.name, "", options=options, keep_alive=model.keep_alive
+                    )
+                    _log(f"Restored {model.name}")
+                except (OllamaApiError, OSError, http.client.HTTPException) as e:
+                    logger.error(f"Could not restore {model.name}: {e}")
+                    failed.append(model.name)
+            record["outcome"] = f"{len(failed)} failed" if failed else "restored"
+        self.resident = []
+        return failed
@@ -0,0 +1,193 @@
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from context_searcher import (
+    DEFAULT_THROUGHPUT_TOLERANCE,
+    DEFAULT_TOLERANCE,
+    ContextSearcher,
+    ProbeSample,
+)
+from ollama_api import OllamaApiController
+from probe_cache import ProbeCache
+from tracing import span
+
+TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_MEASURE_TOKENS = 128
+
+logger = logging.getLogger(__name__)
+
+
+def _log(message: str) -> None:
+    logger.info(f"[{time.strftime(TIMEFORMAT)}] {message}")
+
+
+@dataclass
+class Trial:
+    """The largest GPU-resident context for one parameter set, and its speed there."""
+
+    server: str
+    options: dict = field(default_factory=dict)
+    num_ctx: int = 0
+    processor: str | None = None
+    prompt_tps: float | None = None
+    eval_tps: float | None = None
+    probes: int = 0
+
+    @property
+    def objectives(self) -> tuple[float, float, float]:
+        return (self.num_ctx, self.eval_tps or 0.0, self.prompt_tps or 0.0)
+
+
+def dominates(a: Trial, b: Trial) -> bool:
+    """Whether a is at least as good as b on every objective and better on one."""
+    return all(x >= y for x, y in zip(a.objectives, b.objectives)) and (
+        a.objectives != b.objectives
+    )
+
+
+def pareto_front(trials: list[Trial]) -> list[Trial]:
+    """
+    GPU-resident trials not dominated on context size, decode and prompt
+    tokens/sec, largest context first.
+    """
+    fitting = [t for t in trials if t.processor == "100% GPU"]
+    front = [t for t in fitting if not any(dominates(o, t) for o in fitting)]
+    return sorted(front, key=lambda t: t.objectives, reverse=True)
+
+
+def select_trial(
+    front: list[Trial], tolerance_pct: float = DEFAULT_THROUGHPUT_TOLERANCE
+) -> Trial:
+    """The largest context on the front whose decode rate is within tolerance_pct of the peak."""
+    peak = max((t.eval_tps or 0.0) for t in front)
+    floor = peak * (1 - tolerance_pct / 100)
+    return max(
+        (t for t in front if (t.eval_tps or 0.0) >= floor),
+        key=lambda t: t.objectives,
+    )
+
+
+def parameter_grid(grid: dict[str, list]) -> list[dict]:
+    """Every combination of the grid's values, in the order given."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+class JointSearcher:
+    """
+    Searches num_ctx jointly with further parameters.
+
+    Per-request options such as num_batch form a grid that is searched on
+    every server. Daemon-wide settings (KV cache type, flash attention)
+    cannot be changed per request, so each configuration is a separate
+    server with its own controller. For every combination the largest
+    GPU-resident num_ctx is found, warm-started from the previous
+    combination's boundary, and throughput is measured there.
+    """
+
+    def __init__(
+        self,
+        controllers: dict[str, OllamaApiController],
+        grid: dict[str, list] | None = None,
+        strategy: str = "bisect",
+        tolerance: int = DEFAULT_TOLERANCE,
+        measure_tokens: int = DEFAULT_MEASURE_TOKENS,
+        cache: ProbeCache | None = None,
+        fingerprints: dict[str, str | None] | None = None,
+        deadline: float | None = None,
+        max_bytes: int | None = None,
+    ) -> None:
+        self.controllers = controllers
+        self.grid = grid or {}
+        self.strategy = strategy
+        self.tolerance = tolerance
+        self.measure_tokens = measure_tokens
+        self.cache = cache
+        self.fingerprints = fingerprints or {}
+        self.deadline = deadline
+        self.max_bytes = max_bytes
+        # Every probe of every trial, with the server and options it ran with
+        self.samples: list[tuple[str, dict, ProbeSample]] = []
+
+    def run(self, min_size: int, max_size: int) -> list[Trial]:
+        trials = []
+        for server, controller in self.controllers.items():
+            hint = None
+            for options in parameter_grid(self.grid):
+                with span("joint.trial", server=server, **options) as record:
+                    trial = self._trial(server, controller, options, min_size, max_size, hint)
+                    record["num_ctx"] = trial.num_ctx
+                    record["outcome"] = trial.processor or "failed"
+                _log(
+                    f"{server} {options or ''}: num_ctx {trial.num_ctx}, "
+                    f"{trial.eval_tps or 0:.1f} decode tokens/s, {trial.probes} probe(s)"
+                )
+                trials.append(trial)
+                if trial.processor == "100% GPU":
+                    hint = trial.num_ctx
+        return trials
+
+    def _trial(
+        self,
+        server: str,
+        controller: OllamaApiController,
+        options: dict,
+        min_size: int,
+        max_size: int,
+        hint: int | None,
+    ) -> Trial:
+        searcher = ContextSearcher(
+            controller,
+            strategy=self.strategy,
+            tolerance=self.tolerance,
+            cache=self.cache,
+            fingerprint=self.fingerprints.get(server),
+            deadline=self.deadline,
+            options=options,
+            max_bytes=self.max_bytes,
+        )
+        try:
+            num_ctx = searcher.find_optimal_size(min_size, max_size, hint=hint)
+        finally:
+            self.samples.extend((server, dict(options), s) for s in searcher.samples)
+
+        previous = controller.measure_tokens
+        controller.measure_tokens = self.measure_tokens
+        try:
+            success, results = controller.set_context(num_ctx, options)
+        finally:
+            controller.measure_tokens = previous
+        if not success:
+            results = {}
+        return Trial(
+            server,
+            dict(options),
+            num_ctx,
+            # A size over the headroom must not be chosen however it placed
+            searcher._placement(results.get("processor"), results.get("size")),
+            results.get("prompt_tps"),
+            results.get("eval_tps"),
+            len(searcher.samples) + 1,
+        )
+
+
+def format_trials(
+    model_name: str, trials: list[Trial], front: list[Trial], chosen: Trial | None
+) -> str:
+    """Every trial, with the Pareto front marked '*' and the chosen set '>'."""
+    width = max([len("SERVER")] + [len(t.server) for t in trials])
+    lines = [
+        f"Joint search for {model_name}:",
+        f"   {'SERVER':<{width}}  {'OPTIONS':<20}  {'NUM_CTX':>9}  {'PROMPT TOK/S':>12}  {'DECODE TOK/S':>12}",
+    ]
+    for t in trials:
+        mark = ">" if t is chosen else ("*" if t in front else " ")
+        options = ",".join(f"{k}={v}" for k, v in t.options.items()) or "-"
+        prompt = f"{t.prompt_tps:.1f}" if t.prompt_tps else "-"
+        decode = f"{t.eval_tps:.1f}" if t.eval_tps else "-"
+        placement = "" if t.processor == "100% GPU" else f"  ({t.processor or 'failed'})"
+        lines.append(
+            f" {mark} {t.server:<{width}}  {options:<20}  {t.num_ctx:>9}  {prompt:>12}  {decode:>12}{placement}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,159 @@
+import logging
+import os
+import subprocess
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+TIMEOUT_SMI = 10
+
+# Bytes per cached element for each OLLAMA_KV_CACHE_TYPE. The quantised types
+# store blocks of 32 values plus an f16 scale.
+KV_CACHE_BYTES = {
+    "f16": 2.0,
+    "q8_0": 34 / 32,
+    "q4_0": 18 / 32,
+}
+DEFAULT_KV_CACHE_TYPE = "f16"
+
+# Compute graph, CUDA context and other allocations that do not scale with
+# num_ctx. Deliberately conservative so the prediction errs on the small side.
+DEFAULT_OVERHEAD_BYTES = 768 * 1024**2
+
+
+@dataclass
+class ModelMetadata:
+    """The subset of model metadata that determines KV-cache size."""
+
+    block_count: int
+    head_count_kv: int | list[int]
+    key_length: int
+    value_length: int
+    weights_bytes: int
+    context_length: int | None = None
+    kv_cache_type: str = DEFAULT_KV_CACHE_TYPE
+
+    def kv_bytes_per_token(self) -> float:
+        """Bytes of K and V cache allocated for every token of num_ctx."""
+        if isinstance(self.head_count_kv, list):
+            kv_heads = sum(self.head_count_kv)
+        else:
+            kv_heads = self.head_count_kv * self.block_count
+        element_bytes = KV_CACHE_BYTES.get(self.kv_cache_type)
+        if element_bytes is None:
+            raise ValueError(f"Unknown KV cache type: {self.kv_cache_type}")
+        return kv_heads * (self.key_length + self.value_length) * element_bytes
+
+
+def metadata_from_show(
+    show: dict, weights_bytes: int, kv_cache_type: str | None = None
+) -> ModelMetadata:
+    """
+    Build ModelMetadata from an /api/show response.
+
+    Args:
+        show: The decoded /api/show response; only "model_info" is used
+        weights_bytes: Size of the model weights, e.g. from /api/tags
+        kv_cache_type: KV cache dtype, defaults to $OLLAMA_KV_CACHE_TYPE or f16
+
+    Returns:
+        The parsed metadata
+
+    Raises:
+        ValueError: If the architecture keys needed for the estimate are missing
+    """
+    info = show.get("model_info") or {}
+    arch = info.get("general.architecture")
+    if not arch:
+        raise ValueError("model_info has no general.architecture")
+
+    def key(name: str):
+        return info.get(f"{arch}.{name}")
+
+    block_count = key("block_count")
+    head_count = key("attention.head_count")
+    head_count_kv = key("attention.head_count_kv") or head_count
+    embedding_length = key("embedding_length")
+    if not block_count or not head_count_kv:
+        raise ValueError(f"model_info is missing {arch} block or head counts")
+
+    head_dim = None
+    if head_count and embedding_length:
+        heads = max(head_count) if isinstance(head_count, list) else head_count
+        head_dim = embedding_length // heads
+    key_length = key("attention.key_length") or head_dim
+    value_length = key("attention.value_length") or head_dim
+    if not key_length or not value_length:
+        raise ValueError(f"model_info is missing {arch} head dimensions")
+
+    return ModelMetadata(
+        block_count=block_count,
+        head_count_kv=head_count_kv,
+        key_length=key_length,
+        value_length=value_length,
+        weights_bytes=weights_bytes,
+        context_length=key("context_length"),
+        kv_cache_type=kv_cache_type or detect_kv_cache_type(),
+    )
+
+
+def detect_kv_cache_type() -> str:
+    """Return the KV cache type the local daemon is configured with."""
+    cache_type = os.environ.get("OLLAMA_KV_CACHE_TYPE", "").strip().lower()
+    return cache_type if cache_type in KV_CACHE_BYTES else DEFAULT_KV_CACHE_TYPE
+
+
+def detect_vram_budget() -> int | None:
+    """Total VRAM across all NVIDIA GPUs in bytes, or None if it cannot be read."""
+    try:
+        result = subprocess.run(
+            [
+                "nvidia-smi",
+                "--query-gpu=memory.total",
+                "--format=csv,noheader,nounits",
+            ],
+            capture_output=True,
+            text=True,
+            timeout=TIMEOUT_SMI,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"nvidia-smi unavailable: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        total_mib = sum(int(line) for line in result.stdout.split())
+    except ValueError:
+        return None
+    return total_mib * 1024**2 if total_mib > 0 else None
+
+
+class KVCacheEstimator:
+    """Predicts loaded model size as a function of num_ctx."""
+
+    def __init__(
+        self,
+        metadata: ModelMetadata,
+        vram_budget: int,
+        overhead_bytes: int = DEFAULT_OVERHEAD_BYTES,
+    ) -> None:
+        self.metadata = metadata
+        self.vram_budget = vram_budget
+        self.overhead_bytes = overhead_bytes
+
+    def estimate_bytes(self, num_ctx: int) -> int:
+        """Predicted VRAM needed to hold the model fully on GPU at num_ctx."""
+        kv_bytes = self.metadata.kv_bytes_per_token() * num_ctx
+        return int(self.metadata.weights_bytes + self.overhead_bytes + kv_bytes)
+
+    def max_context(self) -> int:
+        """Largest num_ctx predicted to fit within the VRAM budget (0 if none)."""
+        free = self.vram_budget - self.metadata.weights_bytes - self.overhead_bytes
+        per_token = self.metadata.kv_bytes_per_token()
+        if free <= 0 or per_token <= 0:
+            return 0
+        predicted = int(free // per_token)
+        if self.metadata.context_length:
+            predicted = min(predicted, self.metadata.context_length)
+        return predicted
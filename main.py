@@ -1,24 +1,85 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
+import http.client
 import logging
 import subprocess
 import sys
 import re
 import time
+from kv_estimator import (
+    KV_CACHE_BYTES,
+    KVCacheEstimator,
+    ModelMetadata,
+    detect_kv_cache_type,
+    detect_vram_budget,
+    metadata_from_show,
+)
+from ollama_api import (
+    PROBE_MODES,
+    OllamaApiController,
+    OllamaApiError,
+    OllamaClient,
+    is_local_host,
+    normalise_model_name,
+    parse_parameters,
+)
 from ollama_controller import OllamaController
-from context_searcher import ContextSearcher
+from gguf_reader import MetadataCache, read_model_metadata
+from isolation import Isolation
+from fleet import UNKNOWN_GPU, Fleet, FleetHost, format_fleet_report, parse_fleet_host
+from tracing import TRACER
+from placement_sampler import DEFAULT_STABLE_SAMPLES
+from parallel_search import EndpointPool, ParallelContextSearcher
+from joint_search import JointSearcher, format_trials, pareto_front, select_trial
+from report import EXIT_CANCELLED, EXIT_FAILED, EXIT_OK, OptimiseReport, format_json
+from packing import Packer, PackItem, format_packing, parse_pack_spec
+from validation import DEFAULT_FILL_LEVELS, StressValidator, format_fill_curve
+from watch import DEFAULT_METRICS_PORT, DEFAULT_WATCH_INTERVAL, MetricsServer, Regression, Watcher
+from probe_cache import ProbeCache, detect_gpu_fingerprint, make_fingerprint
+from batch import format_report, run_batch, schedule_models, select_models
+from context_searcher import (
+    DEFAULT_CURVE_POINTS,
+    DEFAULT_THROUGHPUT_TOLERANCE,
+    DEFAULT_TOLERANCE,
+    OBJECTIVES,
+    STRATEGIES,
+    ContextSearcher,
+    ProbeSample,
+)
 
 TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
 DEFAULT_MIN_CONTEXT = 4096
 DEFAULT_MAX_CONTEXT = 1000000
 TIMEOUT_SHOW = 30
+DEFAULT_MEASURE_TOKENS = 128
 
 logger = logging.getLogger(__name__)
 
 
-def get_model_context_length(model_name: str) -> int | None:
-    """Get the maximum context length for a given model"""
+def remote_context_length(model_name: str, host: str) -> int | None:
+    """The trained context length /api/show reports on a host."""
+    client = OllamaClient(host)
+    try:
+        info = client.show(model_name).get("model_info") or {}
+    except Exception:
+        return None
+    finally:
+        client.close()
+    return next((v for k, v in info.items() if k.endswith(".context_length")), None)
+
+
+def get_model_context_length(model_name: str, host: str | None = None) -> int | None:
+    """
+    Get the maximum context length for a given model. The local model store
+    is only read when host is this machine; a remote daemon is asked instead.
+    """
+    if not is_local_host(host):
+        return remote_context_length(model_name, host)
+    metadata = read_model_metadata(model_name, cache=MetadataCache())
+    if metadata is not None and metadata.context_length:
+        return metadata.context_length
     try:
         result = subprocess.run(
             ["ollama", "show", model_name],
@@ -35,10 +96,759 @@ def get_model_context_length(model_name: str) -> int | None:
         return None
 
 
-def main() -> None:
+def read_daemon_metadata(
+    model_name: str, kv_cache_type: str, host: str | None = None
+) -> ModelMetadata | None:
+    """Model metadata from the daemon's /api/tags and /api/show."""
+    client = OllamaClient(host)
+    try:
+        target = normalise_model_name(model_name)
+        weights_bytes = next(
+            (
+                entry["size"]
+                for entry in client.tags()
+                if normalise_model_name(entry.get("name", "")) == target
+            ),
+            None,
+        )
+        if weights_bytes is None:
+            logger.info(f"Model {model_name} not found in /api/tags")
+            return None
+        metadata = metadata_from_show(
+            client.show(model_name), weights_bytes, kv_cache_type
+        )
+    except Exception as e:
+        logger.info(f"Could not read model metadata for estimate: {e}")
+        return None
+    finally:
+        client.close()
+
+    return metadata
+
+
+def estimate_max_context(
+    model_name: str,
+    vram_budget: int | None,
+    kv_cache_type: str,
+    host: str | None = None,
+) -> int | None:
+    """Predict the largest GPU-resident context from model metadata, if possible."""
+    if vram_budget is None:
+        # This machine's VRAM says nothing about a remote daemon's GPU
+        vram_budget = detect_vram_budget() if is_local_host(host) else None
+        if vram_budget is None:
+            logger.info("VRAM budget unknown, skipping context size estimate")
+            return None
+
+    # The local model store answers without the daemon; a remote --host may
+    # have different models under the same name
+    metadata = None
+    if is_local_host(host):
+        metadata = read_model_metadata(
+            model_name, cache=MetadataCache(), kv_cache_type=kv_cache_type
+        )
+    if metadata is None:
+        metadata = read_daemon_metadata(model_name, kv_cache_type, host)
+    if metadata is None:
+        return None
+
+    estimator = KVCacheEstimator(metadata, vram_budget)
+    predicted = estimator.max_context()
+    logger.info(
+        f"Estimated maximum context {predicted} for a VRAM budget of {vram_budget / 1024**3:.1f} GiB"
+    )
+    return predicted or None
+
+
+def get_saved_context(model_name: str, host: str | None = None) -> int | None:
+    """The num_ctx parameter a model was saved with, if any."""
+    client = OllamaClient(host)
+    try:
+        num_ctx = parse_parameters(client.show(model_name).get("parameters", "")).get(
+            "num_ctx"
+        )
+    except Exception as e:
+        logger.info(f"Could not read the saved parameters of {model_name}: {e}")
+        return None
+    finally:
+        client.close()
+    return num_ctx if isinstance(num_ctx, int) else None
+
+
+def resolve_fingerprint(
+    model_name: str, host: str | None = None, gpu: str | None = None
+) -> str | None:
+    """
+    Fingerprint the model digest, daemon version and GPUs for the probe cache.
+    A remote daemon's GPUs cannot be detected locally and are given as gpu;
+    without it the cache is disabled for that host.
+    """
+    if gpu is None and not is_local_host(host):
+        logger.info(
+            f"GPU of {host} unknown, probe cache disabled; pass --gpu-label to enable it"
+        )
+        return None
+    client = OllamaClient(host)
+    try:
+        target = normalise_model_name(model_name)
+        digest = next(
+            (
+                entry.get("digest")
+                for entry in client.tags()
+                if normalise_model_name(entry.get("name", "")) == target
+            ),
+            None,
+        )
+        version = client.version()
+    except Exception as e:
+        logger.info(f"Could not fingerprint {model_name}, probe cache disabled: {e}")
+        return None
+    finally:
+        client.close()
+
+    if not digest:
+        logger.info(f"No digest for {model_name}, probe cache disabled")
+        return None
+    return make_fingerprint(digest, version or "unknown", gpu or detect_gpu_fingerprint())
+
+
+def format_throughput_curve(model_name: str, curve: list[ProbeSample], chosen: int) -> str:
+    lines = [
+        f"Throughput curve for {model_name}:",
+        f"{'NUM_CTX':>9}  {'PROMPT TOK/S':>12}  {'DECODE TOK/S':>12}",
+    ]
+    for sample in curve:
+        prompt = f"{sample.prompt_tps:.1f}" if sample.prompt_tps else "-"
+        marker = "  <- chosen" if sample.num_ctx == chosen else ""
+        lines.append(
+            f"{sample.num_ctx:>9}  {prompt:>12}  {sample.eval_tps:>12.1f}{marker}"
+        )
+    return "\n".join(lines)
+
+
+def format_parallel_rate(samples: list[ProbeSample], num_ctx: int, parallel: int) -> str:
+    """The aggregate decode rate measured at num_ctx under concurrent load."""
+    rates = [
+        s.aggregate_tps for s in samples if s.num_ctx == num_ctx and s.aggregate_tps
+    ]
+    if not rates:
+        return f"No aggregate decode rate measured at num_ctx {num_ctx}"
+    return (
+        f"Aggregate decode rate with {parallel} concurrent requests at num_ctx "
+        f"{num_ctx}: {rates[-1]:.1f} tokens/s"
+    )
+
+
+def resolve_max_context(model_name: str, host: str | None = None) -> int:
+    """The model's trained context length, or the default upper bound."""
+    return get_model_context_length(model_name, host) or DEFAULT_MAX_CONTEXT
+
+
+def probed_hosts(args: argparse.Namespace) -> list[str | None]:
+    """The daemons a search of one model probes, None being $OLLAMA_HOST."""
+    if args.endpoints:
+        return list(args.endpoints)
+    if args.server_config:
+        return [host for _, host in args.server_config]
+    return [args.host]
+
+
+def vram_budget_bytes(args: argparse.Namespace) -> int | None:
+    """
+    --vram-budget in bytes, or the VRAM detected on this machine when every
+    probed daemon runs on it.
+    """
+    if args.vram_budget is not None:
+        return int(args.vram_budget * 1024**3)
+    if not all(is_local_host(host) for host in probed_hosts(args)):
+        return None
+    return detect_vram_budget()
+
+
+def headroom_limit(args: argparse.Namespace) -> int | None:
+    """
+    Largest loaded size that leaves --headroom GiB of VRAM free, or None
+    without --headroom.
+
+    Raises:
+        ValueError: if the VRAM budget is unknown
+    """
+    if not args.headroom:
+        return None
+    budget = vram_budget_bytes(args)
+    if budget is None:
+        raise ValueError("--headroom needs the VRAM budget; pass --vram-budget")
+    return budget - int(args.headroom * 1024**3)
+
+
+@contextlib.contextmanager
+def isolated(args: argparse.Namespace, models: list[str]):
+    """With --isolate, unload every other model for the block and restore them after."""
+    if not args.isolate:
+        yield
+        return
+    client = OllamaClient(args.host)
+    try:
+        with Isolation(client, exclude=models):
+            yield
+    finally:
+        client.close()
+
+
+def optimise_model(
+    model_name: str,
+    args: argparse.Namespace,
+    max_size: int,
+    client: OllamaClient | None = None,
+    report: OptimiseReport | None = None,
+) -> tuple[int, bool]:
+    """
+    Search for and save the optimal context size of one model.
+
+    Args:
+        model_name: The model to optimize
+        args: Parsed command line options shared by every model
+        max_size: Upper bound of the search for this model
+        client: Shared API client for the api backend
+        report: When given, filled in with the probes and the decision
+
+    Returns:
+        (optimal_size, saved)
+    """
+    if args.min > max_size:
+        raise ValueError(
+            f"Minimum context size {args.min} exceeds the maximum {max_size}"
+        )
+    if args.num_batch or args.server_config:
+        return optimise_joint(model_name, args, max_size, report=report)
+
+    # Before any controller is opened, so that an unknown budget leaks nothing
+    max_bytes = headroom_limit(args)
+    logger.info(f"Initializing Ollama controller for model: {model_name}")
+    host = args.host
+    if args.endpoints:
+        controller = EndpointPool(model_name, args.endpoints)
+        healthy = controller.check_health()
+        if not healthy:
+            controller.close()
+            raise RuntimeError(f"No healthy Ollama endpoint has {model_name}")
+        logger.info(f"Probing on {len(healthy)} endpoint(s) in parallel")
+        host = healthy[0].host
+        probe_controllers = controller.controllers
+    elif args.backend == "api":
+        controller = OllamaApiController(model_name, host=args.host, client=client)
+        probe_controllers = [controller]
+    else:
+        controller = OllamaController(model_name)
+        probe_controllers = [controller]
+    for probe_controller in probe_controllers:
+        probe_controller.probe_mode = args.probe_mode
+        if args.parallel > 1:
+            probe_controller.parallel = args.parallel
+        if args.objective == "throughput":
+            probe_controller.measure_tokens = args.measure_tokens
+        if args.settle:
+            probe_controller.enable_settling(args.settle_samples, args.settle_window)
+
+    cache = None
+    fingerprint = None
+    if not args.no_cache:
+        fingerprint = resolve_fingerprint(model_name, host=host, gpu=args.gpu_label)
+        if fingerprint:
+            cache = ProbeCache(args.cache_path)
+            # The same model on the same GPU places differently per KV cache type
+            fingerprint += f"|kv={args.kv_cache_type}"
+            if args.parallel > 1:
+                # Placement under concurrent load is a different measurement
+                fingerprint += f"|parallel={args.parallel}"
+
+    searcher_class = ParallelContextSearcher if args.endpoints else ContextSearcher
+    searcher = searcher_class(
+        controller,
+        strategy=args.strategy,
+        tolerance=args.tolerance,
+        cache=cache,
+        fingerprint=fingerprint,
+        deadline=(
+            time.monotonic() + args.model_timeout if args.model_timeout else None
+        ),
+        max_bytes=max_bytes,
+    )
+
+    try:
+        logger.info(f"Starting optimization for model: {model_name}")
+        logger.info(f"Searching context size range: {args.min} to {max_size}")
+
+        hint = args.hint
+        if args.from_previous:
+            hint = get_saved_context(model_name, host=host)
+            if hint is None:
+                logger.info(f"{model_name} has no saved num_ctx, searching from scratch")
+            else:
+                logger.info(f"Warm start from the saved num_ctx {hint}")
+
+        predicted = None
+        if not args.no_estimate and hint is None:
+            vram_budget = (
+                int(args.vram_budget * 1024**3) if args.vram_budget else None
+            )
+            predicted = estimate_max_context(
+                model_name, vram_budget, args.kv_cache_type, host=host
+            )
+
+        if report is not None:
+            report.predicted, report.hint = predicted, hint
+        optimal_size = searcher.find_optimal_size(
+            args.min, max_size, predicted, hint=hint
+        )
+        if not searcher.fits(optimal_size):
+            raise RuntimeError(
+                f"No context size from {args.min} to {max_size} fit entirely on the GPU"
+            )
+        logger.info(f"Optimal context size found: {optimal_size}")
+
+        if args.objective == "throughput":
+            optimal_size = searcher.select_by_throughput(
+                args.min,
+                optimal_size,
+                points=args.curve_points,
+                tolerance_pct=args.throughput_tolerance,
+            )
+            print(
+                format_throughput_curve(
+                    model_name, searcher.throughput_curve(), optimal_size
+                )
+            )
+
+        if args.parallel > 1:
+            print(format_parallel_rate(searcher.samples, optimal_size, args.parallel))
+
+        if args.validate:
+            # An endpoint excluded by the health checks would fail every fill
+            validator = StressValidator(
+                controller.healthy[0].controller if args.endpoints else controller,
+                levels=tuple(level / 100 for level in args.fill_levels),
+                min_step=args.tolerance,
+            )
+            try:
+                optimal_size = validator.run(optimal_size, args.min)
+            finally:
+                print(format_fill_curve(model_name, validator.results))
+
+        logger.info("Saving optimized model...")
+        if report is not None:
+            report.num_ctx = optimal_size
+        return (optimal_size, controller.save_model(optimal_size))
+
+    except KeyboardInterrupt:
+        if cache is not None:
+            logger.warning(
+                f"{sum(not s.cached for s in searcher.samples)} new probe(s) recorded in {cache.path}, rerun to resume"
+            )
+        raise
+    finally:
+        if report is not None:
+            report.record_probes(searcher.samples)
+        logger.info("Closing controller...")
+        controller.close()
+        logger.info("Controller closed.")
+
+
+def optimise_report(
+    model_name: str,
+    args: argparse.Namespace,
+    max_size: int,
+    client: OllamaClient | None = None,
+) -> OptimiseReport:
+    """
+    Run optimise_model and return its report instead of raising.
+
+    An error or Ctrl-C ends the run with a report recording it, so the
+    probes made until then are never lost.
+    """
+    report = OptimiseReport(
+        normalise_model_name(model_name),
+        args.strategy,
+        args.objective,
+        args.min,
+        max_size,
+    )
+    started = time.monotonic()
+    try:
+        report.num_ctx, report.saved = optimise_model(
+            model_name, args, max_size, client=client, report=report
+        )
+    except KeyboardInterrupt:
+        report.cancelled = True
+        report.error = "cancelled"
+    except Exception as e:
+        report.error = str(e) or type(e).__name__
+    finally:
+        report.elapsed = time.monotonic() - started
+    return report
+
+
+def optimise(model_name: str, **options) -> OptimiseReport:
+    """
+    Optimise one model in-process, as ``--model`` on the command line does.
+
+    Options take the command line options by their argparse names, for
+    example ``host="gpu-1:11434", strategy="interpolate", validate=True``.
+    The API backend is the default here. Options are checked as on the
+    command line; failures of the run itself are reported in the returned
+    report, not raised.
+
+    Raises:
+        TypeError: for an option the command line does not have
+        ValueError: for an invalid option value or combination
+    """
+    args = build_parser().parse_args(["--model", model_name, "--backend", "api"])
+    for name, value in options.items():
+        if name == "model" or not hasattr(args, name):
+            raise TypeError(f"Unknown option: {name}")
+        setattr(args, name, value)
+    if args.watch is not None or args.pack or args.fleet or args.models or args.all:
+        raise ValueError("optimise() runs a single model")
+    check_args(args)
+    max_size = args.max or resolve_max_context(model_name, args.host)
+    if args.min > max_size:
+        raise ValueError(
+            f"Minimum context size {args.min} exceeds the maximum {max_size}"
+        )
+    with isolated(args, [model_name]):
+        return optimise_report(model_name, args, max_size)
+
+
+def parse_server_config(text: str) -> tuple[str, str]:
+    """Split a --server-config NAME=HOST value."""
+    name, sep, host = text.partition("=")
+    if not sep or not name or not host:
+        raise argparse.ArgumentTypeError(f"expected NAME=HOST, got '{text}'")
+    return (name, host)
+
+
+def optimise_joint(
+    model_name: str,
+    args: argparse.Namespace,
+    max_size: int,
+    report: OptimiseReport | None = None,
+) -> tuple[int, bool]:
+    """
+    Search num_ctx jointly with num_batch and the daemon configurations
+    given with --server-config, print the Pareto front and save the chosen
+    parameter set. When given, report is filled in with every probe and
+    the chosen set.
+
+    Returns:
+        (optimal_size, saved)
+    """
+    max_bytes = headroom_limit(args)
+    servers = dict(args.server_config or [("default", args.host)])
+    controllers = {
+        name: OllamaApiController(model_name, host=host) for name, host in servers.items()
+    }
+    for controller in controllers.values():
+        controller.probe_mode = args.probe_mode
+        controller.parallel = args.parallel
+        if args.settle:
+            controller.enable_settling(args.settle_samples, args.settle_window)
+
+    cache = None
+    fingerprints = {}
+    if not args.no_cache:
+        fingerprints = {
+            name: resolve_fingerprint(model_name, host=host) for name, host in servers.items()
+        }
+        # Daemons on one machine share a GPU fingerprint but differ in their
+        # configuration (KV cache type, flash attention), so key each by name
+        fingerprints = {
+            name: fingerprint
+            and (
+                f"{fingerprint}|server={name}@{servers[name]}"
+                if args.server_config
+                else f"{fingerprint}|kv={args.kv_cache_type}"
+            )
+            for name, fingerprint in fingerprints.items()
+        }
+        if args.parallel > 1:
+            fingerprints = {
+                name: fingerprint and f"{fingerprint}|parallel={args.parallel}"
+                for name, fingerprint in fingerprints.items()
+            }
+        if any(fingerprints.values()):
+            cache = ProbeCache(args.cache_path)
+
+    searcher = JointSearcher(
+        controllers,
+        {"num_batch": args.num_batch} if args.num_batch else {},
+        strategy=args.strategy,
+        tolerance=args.tolerance,
+        measure_tokens=args.measure_tokens,
+        cache=cache,
+        fingerprints=fingerprints,
+        deadline=(
+            time.monotonic() + args.model_timeout if args.model_timeout else None
+        ),
+        max_bytes=max_bytes,
+    )
+    try:
+        trials = searcher.run(args.min, max_size)
+        front = pareto_front(trials)
+        chosen = select_trial(front, args.throughput_tolerance) if front else None
+        print(format_trials(model_name, trials, front, chosen))
+        if chosen is None:
+            raise RuntimeError(f"No parameter set keeps {model_name} on the GPU")
+        if len(servers) > 1:
+            logger.info(
+                f"The chosen parameters need the daemon configuration of '{chosen.server}'"
+            )
+        if report is not None:
+            report.num_ctx, report.options = chosen.num_ctx, dict(chosen.options)
+            report.server = chosen.server
+        saved = controllers[chosen.server].save_model(chosen.num_ctx, chosen.options)
+        return (chosen.num_ctx, saved)
+    finally:
+        if report is not None:
+            for server, options, sample in searcher.samples:
+                report.record_probes([sample], {"server": server, **options})
+        for controller in controllers.values():
+            controller.close()
+
+
+def parse_pack_item(text: str) -> PackItem:
+    """Parse a --pack MODEL=MIN,TARGET[,WEIGHT] value."""
+    try:
+        return parse_pack_spec(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def run_pack_mode(args: argparse.Namespace) -> None:
+    """Fit every model given with --pack on the GPU together and save them."""
+    capacity = vram_budget_bytes(args)
+    if capacity is None:
+        print("Error: VRAM budget unknown; pass --vram-budget")
+        sys.exit(1)
+    capacity -= int((args.headroom or 0) * 1024**3)
+
+    client = OllamaClient(args.host)
+    packer = Packer(client, args.pack, capacity)
+    try:
+        with isolated(args, [item.model for item in args.pack]):
+            assignment = packer.pack()
+        saved = packer.save()
+    except KeyboardInterrupt:
+        logger.warning("Operation cancelled by user")
+        sys.exit(130)
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except (OllamaApiError, OSError, http.client.HTTPException) as e:
+        logger.error(f"Packing failed, Ollama request error: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+    logger.info(f"Packed {len(assignment)} model(s) in {packer.rounds} round(s)")
+    print(format_packing(args.pack, saved))
+    if not all(saved.values()):
+        sys.exit(1)
+
+
+def run_watch_mode(args: argparse.Namespace) -> None:
+    """Poll the loaded models, serve them as Prometheus metrics and flag offload regressions."""
+    client = OllamaClient(args.host)
+
+    def reoptimise(regression: Regression) -> None:
+        logger.info(f"Re-optimising {regression.model}")
+        try:
+            optimal_size, saved = optimise_model(
+                regression.model,
+                args,
+                args.max or resolve_max_context(regression.model, args.host),
+                client=client if args.backend == "api" else None,
+            )
+            logger.info(f"{regression.model}: num_ctx {optimal_size}, saved: {saved}")
+        except Exception as e:
+            logger.error(f"Re-optimising {regression.model} failed: {e}")
+
+    watcher = Watcher(
+        client,
+        args.watch_interval,
+        patterns=args.watch,
+        on_regression=reoptimise if args.reoptimise else None,
+    )
+    server = None
+    if args.metrics_port:
+        server = MetricsServer(watcher, args.metrics_port).start()
+        logger.info(f"Serving metrics at http://{server.host}/metrics")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        if server is not None:
+            server.stop()
+        client.close()
+
+
+def parse_fleet_entry(text: str) -> tuple[str, str]:
+    """Parse a --fleet HOST[=GPU] value."""
+    try:
+        return parse_fleet_host(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def run_fleet_mode(args: argparse.Namespace) -> None:
+    """Optimise --model once per group of identical --fleet hosts and apply it to the rest."""
+
+    def optimise(member: FleetHost) -> tuple[int, bool, str | None]:
+        host_args = argparse.Namespace(**{**vars(args), "host": member.host})
+        if member.gpu != UNKNOWN_GPU:
+            host_args.gpu_label = member.gpu
+        max_size = args.max or resolve_max_context(args.model, member.host)
+        with isolated(host_args, [args.model]):
+            report = optimise_report(args.model, host_args, max_size)
+        if report.cancelled:
+            raise KeyboardInterrupt
+        if report.error:
+            raise RuntimeError(report.error)
+        processor = next(
+            (p.placement for p in reversed(report.probes) if p.num_ctx == report.num_ctx),
+            None,
+        )
+        return (report.num_ctx, report.saved, processor)
+
+    fleet = Fleet(args.model, args.fleet, optimise, isolate=args.isolate)
+    try:
+        hosts = fleet.run()
+    except KeyboardInterrupt:
+        logger.warning("Operation cancelled by user")
+        sys.exit(130)
+
+    print(format_fleet_report(args.model, hosts))
+    if not all(member.ok for member in hosts):
+        sys.exit(1)
+
+
+def run_batch_mode(args: argparse.Namespace) -> list[OptimiseReport]:
+    """Optimize every selected model in one run, print a summary and return the reports."""
+    client = OllamaClient(args.host)
+    try:
+        installed = {entry["name"]: entry.get("size", 0) for entry in client.tags()}
+        loaded = [entry.get("name", "") for entry in client.ps()]
+    except Exception as e:
+        print(f"Error: Could not list models from the Ollama daemon: {e}")
+        sys.exit(1)
+
+    patterns = ["*"] if args.all else args.models
+    models = schedule_models(select_models(patterns, list(installed)), loaded, installed)
+    if not models:
+        print("Error: No models selected")
+        sys.exit(1)
+
+    logger.info(f"Batch of {len(models)} model(s): {', '.join(models)}")
+    reports = []
+
+    def optimise_one(model: str) -> tuple[int, bool]:
+        report = optimise_report(
+            model,
+            args,
+            args.max or resolve_max_context(model, args.host),
+            client=client if args.backend == "api" else None,
+        )
+        reports.append(report)
+        if report.cancelled:
+            raise KeyboardInterrupt
+        if report.error:
+            raise RuntimeError(report.error)
+        return (report.num_ctx, report.saved)
+
+    started = time.monotonic()
+    try:
+        with isolated(args, models):
+            results = run_batch(models, optimise_one, client=client)
+    except KeyboardInterrupt:
+        logger.warning("Operation cancelled by user")
+        sys.exit(130)
+    finally:
+        client.close()
+
+    print(format_report(results, time.monotonic() - started))
+    return reports
+
+
+def run_single_mode(args: argparse.Namespace) -> OptimiseReport:
+    """Optimize the model given with --model and return the report."""
+    # Set default max context length based on model if not provided
+    if args.max is None:
+        args.max = resolve_max_context(args.model, args.host)
+
+    if args.min > args.max:
+        print("Error: Minimum context size cannot be greater than maximum context size")
+        sys.exit(1)
+
+    with isolated(args, [args.model]):
+        report = optimise_report(args.model, args, args.max)
+    if report.cancelled:
+        logger.warning("Operation cancelled by user")
+    elif report.error:
+        logger.error(f"Error occurred: {report.error}")
+    elif report.saved:
+        logger.info(f"Model saved successfully with context size {report.num_ctx}")
+    else:
+        logger.error("Failed to save the model")
+    return report
+
+
+def write_traces(args: argparse.Namespace) -> None:
+    """Export the recorded spans and print the per-phase summary."""
+    if not TRACER.events:
+        return
+    if args.trace_chrome:
+        TRACER.export_chrome(args.trace_chrome)
+        logger.info(f"Wrote Chrome trace to {args.trace_chrome}")
+    if args.trace_jsonl:
+        TRACER.export_jsonl(args.trace_jsonl)
+        logger.info(f"Wrote JSON lines trace to {args.trace_jsonl}")
+    print(TRACER.format_summary())
+
+
+def exit_code(reports: list[OptimiseReport]) -> int:
+    """The exit code of a run: the single model's, or failure if any model failed."""
+    if len(reports) == 1:
+        return reports[0].exit_code
+    if any(report.cancelled for report in reports):
+        return EXIT_CANCELLED
+    return EXIT_OK if all(report.ok for report in reports) else EXIT_FAILED
+
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Ollama Context Optimizer")
-    parser.add_argument(
-        "--model", required=True, help="The name of the Ollama model to optimize"
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--model", help="The name of the Ollama model to optimize")
+    selection.add_argument(
+        "--models",
+        nargs="+",
+        metavar="MODEL",
+        help="Optimize several models in one run; names may be shell-style globs (e.g. 'qwen3*')",
+    )
+    selection.add_argument(
+        "--all", action="store_true", help="Optimize every installed model"
+    )
+    selection.add_argument(
+        "--pack",
+        type=parse_pack_item,
+        nargs="+",
+        metavar="MODEL=MIN,TARGET[,WEIGHT]",
+        help="Keep these models on the GPU together, giving the spare VRAM to the highest weight per byte (api backend)",
+    )
+    selection.add_argument(
+        "--watch",
+        nargs="*",
+        metavar="MODEL",
+        help="Keep polling the loaded models and flag these (names or globs; default: all) when they leave the GPU",
     )
     parser.add_argument(
         "--min",
@@ -51,51 +861,332 @@ def main() -> None:
         type=int,
         help="Maximum context size to search to (default: model context length or 1000000)",
     )
+    parser.add_argument(
+        "--backend",
+        choices=["cli", "api"],
+        default="cli",
+        help="Probe through an interactive 'ollama run' session (cli) or the Ollama REST API (api) (default: cli)",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=STRATEGIES,
+        default="bisect",
+        help="Search strategy: plain bisection or interpolation on the reported model size (default: bisect)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=int,
+        default=DEFAULT_TOLERANCE,
+        help=f"Stop once the search bracket is narrower than this many tokens (default: {DEFAULT_TOLERANCE})",
+    )
+    parser.add_argument(
+        "--objective",
+        choices=OBJECTIVES,
+        default="fit",
+        help="Pick the largest size on GPU (fit) or the largest size close to peak decode speed (throughput) (default: fit)",
+    )
+    parser.add_argument(
+        "--throughput-tolerance",
+        type=float,
+        default=DEFAULT_THROUGHPUT_TOLERANCE,
+        help=f"Decode slowdown from the peak allowed by the throughput objective, in percent (default: {DEFAULT_THROUGHPUT_TOLERANCE:g})",
+    )
+    parser.add_argument(
+        "--curve-points",
+        type=int,
+        default=DEFAULT_CURVE_POINTS,
+        help=f"Sizes measured for the throughput curve (default: {DEFAULT_CURVE_POINTS})",
+    )
+    parser.add_argument(
+        "--measure-tokens",
+        type=int,
+        default=DEFAULT_MEASURE_TOKENS,
+        help=f"Tokens decoded per probe by the throughput objective (default: {DEFAULT_MEASURE_TOKENS})",
+    )
+    warm_start = parser.add_mutually_exclusive_group()
+    warm_start.add_argument(
+        "--hint",
+        type=int,
+        metavar="N",
+        help="Start from a known-good context size and gallop out from it to the new boundary",
+    )
+    warm_start.add_argument(
+        "--from-previous",
+        action="store_true",
+        help="Start from the num_ctx the model is currently saved with",
+    )
+    parser.add_argument(
+        "--probe-mode",
+        choices=PROBE_MODES,
+        default="full",
+        help="Generate a reply on every probe (full) or only load the model at the new size (minimal) (default: full)",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Probe under N concurrent generate requests and report the aggregate decode rate; run the daemon with OLLAMA_NUM_PARALLEL=N (api backend) (default: 1)",
+    )
+    parser.add_argument(
+        "--settle",
+        action="store_true",
+        help="Sample placement in the background after each probe and wait until it settles",
+    )
+    parser.add_argument(
+        "--settle-samples",
+        type=int,
+        default=DEFAULT_STABLE_SAMPLES,
+        help=f"Identical placement readings that count as settled (default: {DEFAULT_STABLE_SAMPLES})",
+    )
+    parser.add_argument(
+        "--settle-window",
+        type=float,
+        help="Also count placement as settled once it is unchanged for this many seconds",
+    )
+    parser.add_argument(
+        "--num-batch",
+        type=int,
+        nargs="+",
+        metavar="N",
+        help="Search num_ctx jointly with these num_batch values and print the context vs throughput Pareto front (api backend)",
+    )
+    parser.add_argument(
+        "--server-config",
+        type=parse_server_config,
+        action="append",
+        metavar="NAME=HOST",
+        help="A daemon running one KV cache type / flash attention configuration, searched as one more dimension; may be repeated (api backend)",
+    )
+    parser.add_argument(
+        "--vram-budget",
+        type=float,
+        help="VRAM available to the model in GiB (default: detected with nvidia-smi)",
+    )
+    parser.add_argument(
+        "--isolate",
+        action="store_true",
+        help="Unload every other model before the search and load them again afterwards",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Fill the chosen size with synthetic prompts before saving it, and step down if it leaves the GPU (api backend)",
+    )
+    parser.add_argument(
+        "--fill-levels",
+        type=float,
+        nargs="+",
+        metavar="PCT",
+        default=[level * 100 for level in DEFAULT_FILL_LEVELS],
+        help="Context fill levels --validate sends prompts at, in percent (default: 25 50 90 100)",
+    )
+    parser.add_argument(
+        "--headroom",
+        type=float,
+        metavar="GiB",
+        help="Keep this much of the VRAM budget free: sizes that leave less count as not fitting",
+    )
+    parser.add_argument(
+        "--kv-cache-type",
+        choices=sorted(KV_CACHE_BYTES),
+        default=detect_kv_cache_type(),
+        help="KV cache type used by the daemon (default: $OLLAMA_KV_CACHE_TYPE or f16)",
+    )
+    parser.add_argument(
+        "--no-estimate",
+        action="store_true",
+        help="Do not seed the search with a KV-cache memory estimate",
+    )
+    parser.add_argument(
+        "--cache-path",
+        help="Probe result cache file (default: $XDG_CACHE_HOME/optimise-ollama-model/probes.json)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor record cached probe results",
+    )
+    parser.add_argument(
+        "--model-timeout",
+        type=float,
+        help="Stop probing a model after this many seconds (default: no limit)",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the report of the run (every probe and the decision) as JSON on stdout",
+    )
+    parser.add_argument(
+        "--trace-chrome",
+        metavar="PATH",
+        help="Write per-phase timings as a Chrome trace-event file (chrome://tracing, Perfetto)",
+    )
+    parser.add_argument(
+        "--trace-jsonl",
+        metavar="PATH",
+        help="Write per-phase timings as JSON lines",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=DEFAULT_WATCH_INTERVAL,
+        help=f"Seconds between /api/ps polls in watch mode (default: {DEFAULT_WATCH_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=DEFAULT_METRICS_PORT,
+        help=f"Port for the Prometheus /metrics endpoint in watch mode, 0 to disable (default: {DEFAULT_METRICS_PORT})",
+    )
+    parser.add_argument(
+        "--reoptimise",
+        action="store_true",
+        help="In watch mode, re-optimise a model when it leaves the GPU",
+    )
+    parser.add_argument(
+        "--host",
+        help="Ollama API address for --backend api (default: $OLLAMA_HOST or 127.0.0.1:11434)",
+    )
+    parser.add_argument(
+        "--fleet",
+        type=parse_fleet_entry,
+        nargs="+",
+        metavar="HOST[=GPU]",
+        help="Optimise --model once per group of hosts with the same GPU label, Ollama version and model digest, and apply the result to the rest of each group (api backend)",
+    )
+    parser.add_argument(
+        "--gpu-label",
+        help="GPU description for the probe cache fingerprint when --host is a remote daemon (default: detected with nvidia-smi)",
+    )
+    parser.add_argument(
+        "--endpoints",
+        nargs="+",
+        metavar="HOST",
+        help="Probe several sizes at once on these Ollama hosts with identical GPUs (api backend)",
+    )
 
-    args = parser.parse_args()
+    return parser
 
-    # Set default max context length based on model if not provided
-    if args.max is None:
-        model_max = get_model_context_length(args.model)
-        if model_max:
-            args.max = model_max
-        else:
-            args.max = 1000000  # Default fallback
-
-    # Validate arguments
-    if args.min <= 0 or args.max <= 0:
-        print("Error: Minimum and maximum context sizes must be positive integers")
-        sys.exit(1)
 
-    if args.min > args.max:
-        print("Error: Minimum context size cannot be greater than maximum context size")
-        sys.exit(1)
+def check_args(args: argparse.Namespace) -> None:
+    """
+    Check option values and combinations that argparse cannot.
 
-    logger.info(f"Initializing Ollama controller for model: {args.model}")
-    controller = OllamaController(args.model)
-    searcher = ContextSearcher(controller)
+    Raises:
+        ValueError: describing the first invalid option
+    """
+    if args.min <= 0 or (args.max is not None and args.max <= 0):
+        raise ValueError("Minimum and maximum context sizes must be positive integers")
 
-    try:
-        logger.info(f"Starting optimization for model: {args.model}")
-        logger.info(f"Searching context size range: {args.min} to {args.max}")
+    if args.tolerance <= 0:
+        raise ValueError("Tolerance must be a positive integer")
 
-        optimal_size = searcher.find_optimal_size(args.min, args.max)
-        logger.info(f"Optimal context size found: {optimal_size}")
+    if args.objective == "throughput" and args.backend != "api":
+        raise ValueError("The throughput objective needs the timing fields of --backend api")
 
-        logger.info("Saving optimized model...")
-        if controller.save_model(optimal_size):
-            logger.info(f"Model saved successfully with context size {optimal_size}")
-        else:
-            logger.error("Failed to save the model")
+    if args.host and args.backend != "api":
+        # `ollama run` and its save go to $OLLAMA_HOST whatever --host says
+        raise ValueError("--host needs --backend api; set OLLAMA_HOST for the cli backend")
 
-    except KeyboardInterrupt:
-        logger.warning("Operation cancelled by user")
-    except Exception as e:
-        logger.error(f"Error occurred: {e}")
-    finally:
-        logger.info("Closing controller...")
-        controller.close()
-        logger.info("Controller closed.")
+    if args.hint is not None and args.hint <= 0:
+        raise ValueError("--hint must be a positive integer")
+
+    if (args.num_batch or args.server_config) and (
+        args.backend != "api" or args.endpoints
+    ):
+        raise ValueError("--num-batch and --server-config need --backend api without --endpoints")
+
+    if args.pack and (args.backend != "api" or args.endpoints):
+        raise ValueError("--pack needs --backend api without --endpoints")
+
+    if args.headroom is not None and args.headroom < 0:
+        raise ValueError("--headroom must not be negative")
+
+    hosts = probed_hosts(args) + [host for host, _ in args.fleet or []]
+    if (
+        (args.headroom or args.pack)
+        and args.vram_budget is None
+        and not all(is_local_host(host) for host in hosts)
+    ):
+        raise ValueError(
+            "--headroom and --pack need --vram-budget for a remote Ollama host"
+        )
+
+    if args.headroom and vram_budget_bytes(args) is None:
+        raise ValueError("--headroom needs the VRAM budget; pass --vram-budget")
+
+    if args.isolate and args.watch is not None:
+        raise ValueError("--isolate does not apply to --watch")
+
+    if args.watch_interval <= 0:
+        raise ValueError("--watch-interval must be positive")
+
+    if args.fleet and (not args.model or args.backend != "api" or args.endpoints):
+        raise ValueError("--fleet needs --model and --backend api without --endpoints")
+
+    if args.endpoints and args.backend != "api":
+        raise ValueError("--endpoints needs --backend api")
+
+    if args.parallel <= 0:
+        raise ValueError("--parallel must be a positive integer")
+
+    if args.parallel > 1 and (args.backend != "api" or args.probe_mode == "minimal"):
+        raise ValueError("--parallel needs --backend api and full probes")
+
+    if args.settle_samples <= 0:
+        raise ValueError("Settle samples must be a positive integer")
+
+    if args.objective == "throughput" and args.probe_mode == "minimal":
+        raise ValueError("The throughput objective needs full probes to time the decode")
+
+    if args.curve_points <= 0 or args.measure_tokens <= 0:
+        raise ValueError("Curve points and measure tokens must be positive integers")
+
+    if args.validate and (args.backend != "api" or args.num_batch or args.server_config):
+        raise ValueError("--validate needs --backend api and applies to the num_ctx search only")
+
+    if args.json and (args.watch is not None or args.pack or args.fleet):
+        raise ValueError("--json applies to --model, --models and --all runs")
+
+    if any(not 0 < level <= 100 for level in args.fill_levels):
+        raise ValueError("Fill levels must be percentages above 0 and at most 100")
+
+    if args.max is not None and args.min > args.max:
+        raise ValueError("Minimum context size cannot be greater than maximum context size")
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    try:
+        check_args(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    reports = None
+    # With --json, stdout carries only the report; the tables go to stderr
+    output = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    with output:
+        try:
+            if args.watch is not None:
+                run_watch_mode(args)
+            elif args.pack:
+                run_pack_mode(args)
+            elif args.fleet:
+                run_fleet_mode(args)
+            elif args.models or args.all:
+                reports = run_batch_mode(args)
+            else:
+                reports = [run_single_mode(args)]
+        finally:
+            write_traces(args)
+
+    if reports is None:
+        return
+    if args.json:
+        print(format_json(reports if args.models or args.all else reports[0]))
+    sys.exit(exit_code(reports))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,589 @@
+import http.client
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+from placement_sampler import (
+    DEFAULT_INTERVAL,
+    DEFAULT_SETTLE_TIMEOUT,
+    DEFAULT_STABLE_SAMPLES,
+    PlacementSampler,
+)
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_HOST = "127.0.0.1:11434"
+DEFAULT_PORT = 11434
+LOCAL_HOSTNAMES = ("127.0.0.1", "localhost", "::1", "0.0.0.0")
+
+TIMEOUT_REQUEST = 120
+TIMEOUT_SET = 120
+TIMEOUT_PS = 30
+TIMEOUT_CREATE = 300
+
+MEASURE_PROMPT = "Write a short story about a lighthouse keeper."
+
+# "full" probes generate a reply; "minimal" probes only load the model
+PROBE_MODES = ("full", "minimal")
+PROBE_KEEP_ALIVE = "5m"
+
+# Tokens each concurrent request decodes when probing under parallel load
+PARALLEL_PREDICT_TOKENS = 64
+# Seconds between placement checks while concurrent requests run
+UNDER_LOAD_INTERVAL = 0.25
+
+
+class OllamaApiError(Exception):
+    """Raised when the Ollama daemon answers a request with an error."""
+
+
+def normalise_model_name(model_name: str) -> str:
+    """Return the model name with the implicit ":latest" tag made explicit."""
+    if ":" in model_name.rsplit("/", 1)[-1]:
+        return model_name
+    return f"{model_name}:latest"
+
+
+def generation_rates(response: dict) -> dict:
+    """
+    Tokens/sec for the prompt-eval and decode phases of a generate response,
+    from its token counts and nanosecond durations.
+    """
+    rates = {}
+    for phase, key in (("prompt_eval", "prompt_tps"), ("eval", "eval_tps")):
+        count = response.get(f"{phase}_count")
+        duration = response.get(f"{phase}_duration")
+        rates[key] = count / (duration / 1e9) if count and duration else None
+    return rates
+
+
+def phase_timings(response: dict) -> dict:
+    """Seconds the daemon spent loading, evaluating the prompt and decoding."""
+    return {
+        f"{phase}_seconds": response[f"{phase}_duration"] / 1e9
+        if response.get(f"{phase}_duration") is not None
+        else None
+        for phase in ("load", "prompt_eval", "eval")
+    }
+
+
+def parse_parameters(text: str) -> dict:
+    """
+    Parse the "parameters" text of /api/show (one ``name value`` pair per
+    line) into the map /api/create accepts. Repeated names and ``stop``
+    become lists.
+    """
+    parameters: dict = {}
+    for line in text.splitlines():
+        name, _, raw = line.strip().partition(" ")
+        raw = raw.strip()
+        if not name or not raw:
+            continue
+        if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+            value = raw[1:-1]
+        else:
+            value = raw
+            for convert in (int, float):
+                try:
+                    value = convert(raw)
+                    break
+                except ValueError:
+                    pass
+        if name in parameters or name == "stop":
+            existing = parameters.get(name, [])
+            parameters[name] = (existing if isinstance(existing, list) else [existing]) + [value]
+        else:
+            parameters[name] = value
+    return parameters
+
+
+def model_digest(client: "OllamaClient", model_name: str) -> str | None:
+    """The digest /api/tags lists for an installed model."""
+    target = normalise_model_name(model_name)
+    for entry in client.tags():
+        if normalise_model_name(entry.get("name", "")) == target:
+            return entry.get("digest")
+    return None
+
+
+def save_parameters(client: "OllamaClient", model_name: str, updates: dict) -> dict:
+    """
+    Re-create a model from itself with updated parameters through
+    /api/create. Existing parameters are kept and the updated ones replaced,
+    and nothing is rebuilt when every update is already in place.
+
+    Returns:
+        dict: {"changed": bool, "digest": str or None, "seconds": float}
+    """
+    started = time.monotonic()
+    with span("save_model.show"):
+        show = client.show(model_name)
+    parameters = parse_parameters(show.get("parameters", ""))
+    changed = any(parameters.get(name) != value for name, value in updates.items())
+    if changed:
+        parameters.update(updates)
+        with span("save_model.create", **updates):
+            client.create(
+                {"model": model_name, "from": model_name, "parameters": parameters}
+            )
+    return {
+        "changed": changed,
+        "digest": model_digest(client, model_name),
+        "seconds": time.monotonic() - started,
+    }
+
+
+def log_save(model_name: str, context_size: int, result: dict) -> None:
+    if result["changed"]:
+        logger.info(
+            f"Successfully created model {model_name} with context size {context_size} "
+            f"in {result['seconds']:.1f}s, digest {result['digest']}"
+        )
+    else:
+        logger.info(
+            f"{model_name} already has context size {context_size}, "
+            f"skipped rebuild (digest {result['digest']})"
+        )
+
+
+def _gpu_fraction(reading: dict) -> float:
+    fraction = reading.get("gpu_fraction")
+    return 1.0 if fraction is None else fraction
+
+
+def processor_from_sizes(size: int, size_vram: int) -> str | None:
+    """Map the SIZE/VRAM pair reported by /api/ps to the ``ollama ps`` labels."""
+    if size <= 0:
+        return None
+    if size_vram >= size:
+        return "100% GPU"
+    if size_vram <= 0:
+        return "CPU"
+    return "MIXED"
+
+
+def is_local_host(host: str | None) -> bool:
+    """Whether host (default $OLLAMA_HOST) is a daemon on this machine."""
+    return OllamaClient(host).host in LOCAL_HOSTNAMES
+
+
+class OllamaClient:
+    """
+    Minimal JSON client for the Ollama REST API.
+
+    A single HTTP/1.1 connection is kept open and reused for every request, so
+    a probe costs one round-trip instead of a process spawn.
+    """
+
+    def __init__(self, host: str | None = None, timeout: float = TIMEOUT_REQUEST) -> None:
+        host = host or os.environ.get("OLLAMA_HOST") or DEFAULT_HOST
+        if "://" not in host:
+            host = f"http://{host}"
+        parts = urlsplit(host)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported Ollama host scheme: {parts.scheme}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self._conn: http.client.HTTPConnection | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.scheme}://{self.host}:{self.port}"
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._conn is None:
+            if self.scheme == "https":
+                self._conn = http.client.HTTPSConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+            else:
+                self._conn = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+        return self._conn
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        payload: dict | None = None,
+        timeout: float | None = None,
+    ) -> dict:
+        """
+        Send a request and decode the JSON response.
+
+        A connection dropped by the server between requests is re-opened once;
+        any other transport error is propagated to the caller.
+        """
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {"Connection": "keep-alive"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+
+        for attempt in range(2):
+            conn = self._connection()
+            conn.timeout = timeout or self.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(conn.timeout)
+            try:
+                logger.debug(f"{method} {self.base_url}{path}")
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (
+                http.client.RemoteDisconnected,
+                ConnectionResetError,
+                BrokenPipeError,
+            ):
+                self.close()
+                if attempt:
+                    raise
+                logger.debug("Keep-alive connection dropped, reconnecting")
+            except Exception:
+                self.close()
+                raise
+
+        if response.will_close:
+            self.close()
+
+        try:
+            decoded = json.loads(data) if data else {}
+        except json.JSONDecodeError:
+            decoded = {"error": data.decode(errors="replace")}
+
+        if response.status >= 400:
+            error = decoded.get("error") if isinstance(decoded, dict) else decoded
+            raise OllamaApiError(
+                f"{method} {path} failed with HTTP {response.status}: {error}"
+            )
+        return decoded
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        options: dict | None = None,
+        keep_alive: str | int | None = None,
+        timeout: float | None = None,
+    ) -> dict:
+        payload: dict = {"model": model, "prompt": prompt, "stream": False}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return self.request("POST", "/api/generate", payload, timeout=timeout)
+
+    def unload(self, model: str, timeout: float | None = TIMEOUT_PS) -> dict:
+        """Evict a model from memory immediately."""
+        return self.request(
+            "POST", "/api/generate", {"model": model, "keep_alive": 0}, timeout=timeout
+        )
+
+    def ps(self, timeout: float | None = TIMEOUT_PS) -> list[dict]:
+        return self.request("GET", "/api/ps", timeout=timeout).get("models", [])
+
+    def show(self, model: str, timeout: float | None = None) -> dict:
+        return self.request("POST", "/api/show", {"model": model}, timeout=timeout)
+
+    def version(self, timeout: float | None = TIMEOUT_PS) -> str:
+        return self.request("GET", "/api/version", timeout=timeout).get("version", "")
+
+    def tags(self, timeout: float | None = TIMEOUT_PS) -> list[dict]:
+        return self.request("GET", "/api/tags", timeout=timeout).get("models", [])
+
+    def create(self, payload: dict, timeout: float | None = TIMEOUT_CREATE) -> dict:
+        payload = {"stream": False, **payload}
+        return self.request("POST", "/api/create", payload, timeout=timeout)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            finally:
+                self._conn = None
+
+
+class OllamaApiController:
+    """
+    Probe backend that drives the Ollama REST API instead of an ``ollama run``
+    PTY. It exposes the same interface as ``OllamaController`` so that
+    ``ContextSearcher`` can use either one.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        host: str | None = None,
+        client: OllamaClient | None = None,
+    ) -> None:
+        self.model_name = model_name
+        # When set, every probe decodes this many tokens from MEASURE_PROMPT so
+        # that the reported tokens/sec are comparable between sizes
+        self.measure_tokens: int | None = None
+        # Seconds a probe may take to load the model and reply
+        self.timeout: float = TIMEOUT_SET
+        # Outcome of the last save_model(), see save_parameters()
+        self.last_save: dict | None = None
+        # One of PROBE_MODES
+        self.probe_mode = "full"
+        # Concurrent generate requests per probe, each on its own connection
+        self.parallel = 1
+        self._worker_clients: list[OllamaClient] = []
+        # A shared client keeps one pooled connection across several models
+        self._owns_client = client is None
+        self.client = client or OllamaClient(host)
+        # Background placement sampler, see enable_settling()
+        self.sampler: PlacementSampler | None = None
+        self.settle_options: dict = {}
+        self._sampler_client: OllamaClient | None = None
+
+    def enable_settling(
+        self,
+        stable_samples: int = DEFAULT_STABLE_SAMPLES,
+        window: float | None = None,
+        interval: float = DEFAULT_INTERVAL,
+        timeout: float = DEFAULT_SETTLE_TIMEOUT,
+    ) -> None:
+        """
+        Read placement from a background /api/ps sampler after each probe and
+        wait until it has settled, instead of trusting a single reading.
+        """
+        # The sampler thread polls over its own connection
+        self._sampler_client = OllamaClient(self.client.base_url, timeout=TIMEOUT_PS)
+        self.sampler = PlacementSampler(
+            lambda: self._monitor_context(self._sampler_client), interval
+        )
+        self.settle_options = {
+            "stable_samples": stable_samples,
+            "window": window,
+            "timeout": timeout,
+        }
+
+    def set_context(self, size: int, options: dict | None = None) -> tuple[bool, dict]:
+        """
+        Load the model at num_ctx ``size`` and report its placement.
+
+        Args:
+            size: The context size to probe
+            options: Further per-request options, such as num_batch
+        """
+        with span("set_context", num_ctx=size, **(options or {})) as record:
+            success, monitor_results = self._set_context(size, options)
+            record["outcome"] = (
+                (monitor_results["processor"] or "not_found") if success else "failed"
+            )
+            return (success, monitor_results)
+
+    def _set_context(self, size: int, extra_options: dict | None) -> tuple[bool, dict]:
+        options = {**(extra_options or {}), "num_ctx": size}
+        keep_alive = None
+        if self.parallel > 1:
+            prompt = MEASURE_PROMPT
+            options["num_predict"] = self.measure_tokens or PARALLEL_PREDICT_TOKENS
+        elif self.measure_tokens:
+            prompt = MEASURE_PROMPT
+            options["num_predict"] = self.measure_tokens
+        elif self.probe_mode == "minimal":
+            # An empty prompt loads the model at num_ctx without generating
+            prompt = ""
+            keep_alive = PROBE_KEEP_ALIVE
+        else:
+            prompt = "Hello"
+        with span("set_context.generate", num_ctx=size, mode=self.probe_mode) as record:
+            try:
+                logger.debug(f"Generating with num_ctx {size}")
+                under_load = None
+                if self.parallel > 1:
+                    response, under_load = self._generate_concurrently(prompt, options)
+                else:
+                    response = self.client.generate(
+                        self.model_name,
+                        prompt,
+                        options=options,
+                        keep_alive=keep_alive,
+                        timeout=self.timeout,
+                    )
+            except (OllamaApiError, OSError, http.client.HTTPException) as e:
+                logger.warning(f"Generate request failed for num_ctx {size}: {e}")
+                record["outcome"] = f"error: {e}"
+                return (
+                    False,
+                    {
+                        "context_size": None,
+                        "processor": None,
+                        "success": False,
+                        "error": str(e) or type(e).__name__,
+                    },
+                )
+            # The daemon reports how much of the request was spent loading
+            record["load_seconds"] = response.get("load_duration", 0) / 1e9
+
+        if self.sampler is not None:
+            monitor_results = self._settled_context(since=time.monotonic())
+        else:
+            monitor_results = self.monitor_context()
+        if under_load is not None and (
+            not monitor_results["success"]
+            or _gpu_fraction(under_load) < _gpu_fraction(monitor_results)
+        ):
+            logger.debug(f"Placement under load was worse: {under_load['processor']}")
+            monitor_results = under_load
+        if monitor_results["success"]:
+            logger.debug(
+                f"Context size match: {monitor_results['context_size'] == size}, Expected: {size}, Actual: {monitor_results['context_size']}, Processor: {monitor_results['processor']}"
+            )
+            monitor_results.update(generation_rates(response))
+            monitor_results.update(phase_timings(response))
+            if "aggregate_tps" in response:
+                monitor_results["aggregate_tps"] = response["aggregate_tps"]
+            return (True, monitor_results)
+
+        logger.debug("Monitor validation failed, returning success without results")
+        return (True, {"context_size": None, "processor": None, "success": False})
+
+    def _generate_concurrently(self, prompt: str, options: dict) -> tuple[dict, dict | None]:
+        """
+        Send ``parallel`` identical generate requests at once, each over its
+        own connection, and check placement while they run.
+
+        The model is loaded with the same options first, so the reload a new
+        num_ctx triggers is not counted against the aggregate rate. That rate
+        is the decoded tokens over the longest decode of the requests, which
+        ran side by side.
+
+        Returns:
+            (the first response plus "aggregate_tps", the placement with the
+            least of the model on the GPU seen under load, or None)
+        """
+        while len(self._worker_clients) < self.parallel:
+            self._worker_clients.append(OllamaClient(self.client.base_url))
+
+        warm = self.client.generate(self.model_name, "", options=options, timeout=self.timeout)
+
+        started = time.monotonic()
+        worst = None
+        with ThreadPoolExecutor(max_workers=self.parallel) as executor:
+            futures = [
+                executor.submit(
+                    client.generate,
+                    self.model_name,
+                    prompt,
+                    options=options,
+                    timeout=self.timeout,
+                )
+                for client in self._worker_clients[: self.parallel]
+            ]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=UNDER_LOAD_INTERVAL)
+                if not pending:
+                    break
+                reading = self._monitor_context()
+                if reading["success"] and (
+                    worst is None or _gpu_fraction(reading) < _gpu_fraction(worst)
+                ):
+                    worst = reading
+            responses = [future.result() for future in futures]
+        elapsed = time.monotonic() - started
+
+        tokens = sum(r.get("eval_count", 0) for r in responses)
+        decode = max((r.get("eval_duration") or 0 for r in responses), default=0) / 1e9
+        seconds = decode or elapsed
+        response = dict(responses[0])
+        response["load_duration"] = warm.get("load_duration", 0) + max(
+            (r.get("load_duration") or 0 for r in responses), default=0
+        )
+        response["aggregate_tps"] = tokens / seconds if tokens and seconds > 0 else None
+        return (response, worst)
+
+    def monitor_context(self) -> dict:
+        """
+        Query /api/ps and report the placement of the target model.
+
+        Returns:
+            dict: {"context_size": int or None, "processor": str or None, "success": bool}
+            plus "size" (bytes) and "gpu_fraction" (0.0-1.0) when the model is found
+        """
+        with span("monitor_context") as record:
+            monitor_result = self._monitor_context()
+            record["outcome"] = monitor_result["processor"] or "not_found"
+            record["context_size"] = monitor_result["context_size"]
+            return monitor_result
+
+    def _settled_context(self, since: float) -> dict:
+        with span("monitor_context.settle") as record:
+            # Sample only while this probe settles, not for the whole run
+            try:
+                reading = self.sampler.wait_stable(since, **self.settle_options)
+            finally:
+                self.sampler.stop()
+            monitor_result = (
+                dict(reading)
+                if reading
+                else {"context_size": None, "processor": None, "success": False}
+            )
+            record["outcome"] = monitor_result["processor"] or "not_found"
+            record["samples"] = len(self.sampler.samples(since))
+            return monitor_result
+
+    def _monitor_context(self, client: OllamaClient | None = None) -> dict:
+        try:
+            models = (client or self.client).ps()
+        except (OllamaApiError, OSError, http.client.HTTPException) as e:
+            logger.error(f"Exception in monitor_context: {e}")
+            return {"context_size": None, "processor": None, "success": False}
+
+        target = normalise_model_name(self.model_name)
+        for entry in models:
+            names = {entry.get("name", ""), entry.get("model", "")}
+            if target not in {normalise_model_name(n) for n in names if n}:
+                continue
+
+            logger.debug(f"Monitor found model: {entry}")
+            context_size = entry.get("context_length")
+            size = int(entry.get("size", 0))
+            size_vram = int(entry.get("size_vram", 0))
+            return {
+                "context_size": context_size if isinstance(context_size, int) else None,
+                "processor": processor_from_sizes(size, size_vram),
+                "success": True,
+                "size": size or None,
+                "gpu_fraction": min(size_vram / size, 1.0) if size else None,
+            }
+
+        logger.debug("Model not found in /api/ps output")
+        return {"context_size": None, "processor": None, "success": False}
+
+    def save_model(self, context_size: int, options: dict | None = None) -> bool:
+        with span("save_model", num_ctx=context_size) as record:
+            try:
+                logger.info(f"Saving {self.model_name} with num_ctx {context_size}")
+                self.last_save = save_parameters(
+                    self.client,
+                    self.model_name,
+                    {**(options or {}), "num_ctx": context_size},
+                )
+            except (OllamaApiError, OSError, http.client.HTTPException) as e:
+                logger.error(f"Exception during save_model: {e}")
+                record["outcome"] = "failed"
+                return False
+            log_save(self.model_name, context_size, self.last_save)
+            record["outcome"] = "saved" if self.last_save["changed"] else "unchanged"
+            record["digest"] = self.last_save["digest"]
+            return True
+
+    def close(self) -> None:
+        if self.sampler is not None:
+            self.sampler.stop()
+            self._sampler_client.close()
+        for client in self._worker_clients:
+            client.close()
+        if self._owns_client:
+            self.client.close()
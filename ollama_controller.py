@@ -1,10 +1,22 @@
+import http.client
 import logging
-import os
 import pexpect
 import re
 import subprocess
-import tempfile
 import time
+from ollama_api import (
+    OllamaApiError,
+    OllamaClient,
+    log_save,
+    save_parameters,
+)
+from placement_sampler import (
+    DEFAULT_INTERVAL,
+    DEFAULT_SETTLE_TIMEOUT,
+    DEFAULT_STABLE_SAMPLES,
+    PlacementSampler,
+)
+from tracing import span
 
 TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
 TIMEFORMAT_SHORT = "%Y-%d %H:%M:%S"
@@ -15,50 +27,170 @@ logger = logging.getLogger(__name__)
 TIMEOUT_RUN = 120
 TIMEOUT_SET = 120
 TIMEOUT_PSEND = 30
-TIMEOUT_CREATE = 300
 TIMEOUT_EXIT = 5
 
+# `ollama ps` prints sizes with decimal (1000-based) units
+SIZE_UNITS = {"B": 1, "KB": 1000, "MB": 1000**2, "GB": 1000**3, "TB": 1000**4}
+
+
+def parse_size(text: str) -> int | None:
+    """Convert a SIZE column value such as "2.4 GB" to bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B)\s*", text, re.IGNORECASE)
+    if not match:
+        return None
+    try:
+        return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+    except ValueError:
+        return None
+
+
+def parse_gpu_fraction(processor: str) -> float | None:
+    """
+    Extract the share of the model held in VRAM from a PROCESSOR column value,
+    e.g. "100% GPU" -> 1.0, "100% CPU" -> 0.0, "23%/77% CPU/GPU" -> 0.77.
+    """
+    match = re.fullmatch(r"\s*([\d%/]+)\s+([A-Z/]+)\s*", processor, re.IGNORECASE)
+    if not match:
+        return None
+    percents = match.group(1).split("/")
+    devices = match.group(2).upper().split("/")
+    if len(percents) != len(devices):
+        return None
+    try:
+        shares = {
+            device: int(percent.rstrip("%")) / 100
+            for percent, device in zip(percents, devices)
+        }
+    except ValueError:
+        return None
+    if "GPU" in shares:
+        return shares["GPU"]
+    return 1.0 - shares["CPU"] if "CPU" in shares else None
+
 
 class OllamaController:
     def __init__(self, model_name: str) -> None:
         self.model_name = model_name
         self.monitor_process = None
+        # Outcome of the last save_model(), see save_parameters()
+        self.last_save: dict | None = None
+        # In "minimal" mode replies are cut to one token
+        self.probe_mode = "full"
+        self._reply_limited = False
+        # Background placement sampler, see enable_settling()
+        self.sampler: PlacementSampler | None = None
+        self.settle_options: dict = {}
         self.child = pexpect.spawn(f"ollama run {model_name}", timeout=TIMEOUT_RUN)
         self.child.expect([">%%", ">>> "])  # Expect the actual prompt
 
-    def set_context(self, size: int) -> tuple[bool, dict]:
-        try:
-            command = f"/set parameter num_ctx {size}"
-            logger.debug(f"Sending to interactive shell: {command}")
-            self.child.sendline(command)
+    def enable_settling(
+        self,
+        stable_samples: int = DEFAULT_STABLE_SAMPLES,
+        window: float | None = None,
+        interval: float = DEFAULT_INTERVAL,
+        timeout: float = DEFAULT_SETTLE_TIMEOUT,
+    ) -> None:
+        """
+        Read placement from a background `ollama ps` sampler after each probe
+        and wait until it has settled, instead of trusting a single reading.
+        """
+        self.sampler = PlacementSampler(self._monitor_context, interval)
+        self.settle_options = {
+            "stable_samples": stable_samples,
+            "window": window,
+            "timeout": timeout,
+        }
+
+    def set_context(self, size: int, options: dict | None = None) -> tuple[bool, dict]:
+        """
+        Set num_ctx to ``size`` in the interactive session, force a reload
+        and report the placement.
 
-            try:
-                response = self.child.expect([">%%", ">>>"], timeout=TIMEOUT_SET)
-                logger.debug(f"Received response: {self.child.after}")
-            except pexpect.TIMEOUT:
-                logger.warning(f"Timeout waiting for response to: {command}")
-                return (
-                    False,
-                    {"context_size": None, "processor": None, "success": False},
-                )
+        Args:
+            size: The context size to probe
+            options: Further parameters to /set first, such as num_batch
+        """
+        with span("set_context", num_ctx=size, **(options or {})) as record:
+            success, monitor_results = self._set_context(size, options)
+            record["outcome"] = (
+                (monitor_results["processor"] or "not_found") if success else "failed"
+            )
+            return (success, monitor_results)
 
-            test_message = "Hello"
-            logger.debug(f"Sending to interactive shell: {test_message}")
-            self.child.sendline(test_message)
+    def _limit_reply(self) -> bool:
+        """Cap replies at one token for the rest of the session."""
+        with span("set_context.limit_reply") as record:
+            if not self._set_parameter("num_predict", 1):
+                record["outcome"] = "timeout"
+                return False
+        self._reply_limited = True
+        return True
 
-            try:
-                response2 = self.child.expect(
-                    [">%%", r">>>\s+\S+"], timeout=TIMEOUT_SET
-                )
-                logger.debug(f"Received test response: {self.child.after}")
-            except pexpect.TIMEOUT:
-                logger.warning(f"Timeout waiting for response to: {test_message}")
-                return (
-                    False,
-                    {"context_size": None, "processor": None, "success": False},
-                )
+    def _set_parameter(self, name: str, value) -> bool:
+        command = f"/set parameter {name} {value}"
+        logger.debug(f"Sending to interactive shell: {command}")
+        self.child.sendline(command)
+        try:
+            self.child.expect([">%%", ">>>"], timeout=TIMEOUT_SET)
+        except pexpect.TIMEOUT:
+            logger.warning(f"Timeout waiting for response to: {command}")
+            return False
+        return True
+
+    def _set_context(self, size: int, options: dict | None = None) -> tuple[bool, dict]:
+        try:
+            if self.probe_mode == "minimal" and not self._reply_limited:
+                if not self._limit_reply():
+                    return (
+                        False,
+                        {"context_size": None, "processor": None, "success": False},
+                    )
+
+            for name, value in (options or {}).items():
+                if not self._set_parameter(name, value):
+                    return (
+                        False,
+                        {"context_size": None, "processor": None, "success": False},
+                    )
+
+            command = f"/set parameter num_ctx {size}"
+            with span("set_context.set_parameter", num_ctx=size) as record:
+                logger.debug(f"Sending to interactive shell: {command}")
+                self.child.sendline(command)
+
+                try:
+                    response = self.child.expect([">%%", ">>>"], timeout=TIMEOUT_SET)
+                    logger.debug(f"Received response: {self.child.after}")
+                except pexpect.TIMEOUT:
+                    logger.warning(f"Timeout waiting for response to: {command}")
+                    record["outcome"] = "timeout"
+                    return (
+                        False,
+                        {"context_size": None, "processor": None, "success": False},
+                    )
 
-            monitor_results = self.monitor_context()
+            test_message = "Hello"
+            with span("set_context.generate", num_ctx=size) as record:
+                logger.debug(f"Sending to interactive shell: {test_message}")
+                self.child.sendline(test_message)
+
+                try:
+                    response2 = self.child.expect(
+                        [">%%", r">>>\s+\S+"], timeout=TIMEOUT_SET
+                    )
+                    logger.debug(f"Received test response: {self.child.after}")
+                except pexpect.TIMEOUT:
+                    logger.warning(f"Timeout waiting for response to: {test_message}")
+                    record["outcome"] = "timeout"
+                    return (
+                        False,
+                        {"context_size": None, "processor": None, "success": False},
+                    )
+
+            if self.sampler is not None:
+                monitor_results = self._settled_context(since=time.monotonic())
+            else:
+                monitor_results = self.monitor_context()
             if monitor_results and monitor_results["success"]:
                 context_size_match = monitor_results["context_size"] == size
                 logger.debug(
@@ -84,7 +216,31 @@ class OllamaController:
 
         Returns:
             dict: {"context_size": int or None, "processor": str or None, "success": bool}
+            plus "size" (bytes) and "gpu_fraction" (0.0-1.0) when the model is found
         """
+        with span("monitor_context") as record:
+            monitor_result = self._monitor_context()
+            record["outcome"] = monitor_result["processor"] or "not_found"
+            record["context_size"] = monitor_result["context_size"]
+            return monitor_result
+
+    def _settled_context(self, since: float) -> dict:
+        with span("monitor_context.settle") as record:
+            # Sample only while this probe settles, not for the whole run
+            try:
+                reading = self.sampler.wait_stable(since, **self.settle_options)
+            finally:
+                self.sampler.stop()
+            monitor_result = (
+                dict(reading)
+                if reading
+                else {"context_size": None, "processor": None, "success": False}
+            )
+            record["outcome"] = monitor_result["processor"] or "not_found"
+            record["samples"] = len(self.sampler.samples(since))
+            return monitor_result
+
+    def _monitor_context(self) -> dict:
         try:
             logger.debug("Spawning monitor subprocess for ollama ps")
             result = subprocess.run(
@@ -117,6 +273,11 @@ class OllamaController:
                         logger.debug(f"Context size: {context_size_part}")
                         logger.debug(f"Processor: {processor_part}")
 
+                        monitor_result["size"] = parse_size(" ".join(parts[2:4]))
+                        monitor_result["gpu_fraction"] = parse_gpu_fraction(
+                            processor_part
+                        )
+
                         try:
                             context_size = int(context_size_part)
                             monitor_result["context_size"] = context_size
@@ -150,63 +311,33 @@ class OllamaController:
             logger.error(f"Exception in monitor_context: {e}")
             return {"context_size": None, "processor": None, "success": False}
 
-    def save_model(self, context_size: int) -> bool:
-        modelfile_path: str | None = None
-
-        try:
-            logger.info(f"Retrieving modelfile for {self.model_name}")
-            result = subprocess.run(
-                ["ollama", "show", "--modelfile", self.model_name],
-                capture_output=True,
-                text=True,
-                check=True,
-            )
-            original_modelfile = result.stdout
-            logger.info(f"Successfully retrieved modelfile for {self.model_name}")
-
-            new_modelfile_content = (
-                f"{original_modelfile.strip()}\nPARAMETER num_ctx {context_size}\n"
-            )
-
-            with tempfile.NamedTemporaryFile(
-                mode="w", delete=False, suffix=".modelfile"
-            ) as tmpfile:
-                tmpfile.write(new_modelfile_content)
-                modelfile_path = tmpfile.name
-
-            logger.info(f"Wrote temporary modelfile to {modelfile_path}")
-
-            create_command = f"ollama create {self.model_name} -f {modelfile_path}"
-            logger.info(f"Running: {create_command}")
-
-            child = pexpect.spawn(create_command, timeout=TIMEOUT_CREATE)
-            child.expect(pexpect.EOF)
-            child.close()
-
-            os.remove(modelfile_path)
-            modelfile_path = None
-
-            if child.exitstatus == 0:
-                logger.info(
-                    f"Successfully created model {self.model_name} with context size {context_size}"
+    def save_model(self, context_size: int, options: dict | None = None) -> bool:
+        """
+        Save the context size through the REST API of the daemon the CLI
+        talks to ($OLLAMA_HOST), keeping the model's other parameters.
+        """
+        with span("save_model", num_ctx=context_size) as record:
+            client = OllamaClient()
+            try:
+                logger.info(f"Saving {self.model_name} with num_ctx {context_size}")
+                self.last_save = save_parameters(
+                    client, self.model_name, {**(options or {}), "num_ctx": context_size}
                 )
-                return True
-            else:
-                error_output = child.before.decode() if child.before else "No output"
-                logger.error(f"'ollama create' failed. Output: {error_output}")
+            except (OllamaApiError, OSError, http.client.HTTPException) as e:
+                logger.error(f"Exception during save_model: {e}")
+                record["outcome"] = "failed"
                 return False
-
-        except (
-            pexpect.ExceptionPexpect,
-            subprocess.CalledProcessError,
-            Exception,
-        ) as e:
-            logger.error(f"Exception during save_model: {e}")
-            if modelfile_path and os.path.exists(modelfile_path):
-                os.remove(modelfile_path)
-            return False
+            finally:
+                client.close()
+            log_save(self.model_name, context_size, self.last_save)
+            record["outcome"] = "saved" if self.last_save["changed"] else "unchanged"
+            record["digest"] = self.last_save["digest"]
+            return True
 
     def close(self) -> None:
+        if self.sampler is not None:
+            self.sampler.stop()
+
         if self.monitor_process is not None and self.monitor_process.poll() is None:
             logger.warning("Killing monitor subprocess")
             self.monitor_process.kill()
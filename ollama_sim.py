@@ -0,0 +1,478 @@
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from kv_estimator import KV_CACHE_BYTES
+from ollama_api import normalise_model_name, processor_from_sizes
+
+logger = logging.getLogger(__name__)
+
+
+GiB = 1024**3
+DEFAULT_REPLY_TOKENS = 24
+DEFAULT_NUM_BATCH = 512
+DEFAULT_KEEP_ALIVE = 300
+
+
+@dataclass
+class SimulatedModel:
+    """A model whose loaded size grows linearly with num_ctx."""
+
+    name: str
+    weights_bytes: int
+    layers: int = 32
+    head_count_kv: int = 8
+    head_dim: int = 128
+    overhead_bytes: int = 512 * 1024**2
+    context_length: int = 131072
+    decode_tps: float = 60.0
+    prompt_tps: float = 1500.0
+    digest: str = ""
+    parameters: dict = field(default_factory=dict)
+    # Scratch VRAM per prompt token being processed. A long prompt can push
+    # a model that fits when idle past the free VRAM, and it then spills.
+    prefill_bytes_per_token: int = 0
+
+    def __post_init__(self) -> None:
+        self.name = normalise_model_name(self.name)
+        if not self.digest:
+            seed = f"{self.name}:{self.weights_bytes}".encode()
+            self.digest = f"sha256:{hashlib.sha256(seed).hexdigest()}"
+
+    def parameters_text(self) -> str:
+        """Parameters in the /api/show "parameters" format."""
+        lines = []
+        for name, value in self.parameters.items():
+            for item in value if isinstance(value, list) else [value]:
+                rendered = f'"{item}"' if isinstance(item, str) else item
+                lines.append(f"{name:<30} {rendered}")
+        return "\n".join(lines)
+
+    @property
+    def kv_bytes_per_token(self) -> int:
+        # K and V for every layer, stored as f16
+        return self.layers * self.head_count_kv * self.head_dim * 2 * 2
+
+    def model_info(self) -> dict:
+        """Architecture metadata in the /api/show "model_info" format."""
+        return {
+            "general.architecture": "llama",
+            "llama.block_count": self.layers,
+            "llama.attention.head_count": self.head_count_kv * 4,
+            "llama.attention.head_count_kv": self.head_count_kv,
+            "llama.embedding_length": self.head_count_kv * 4 * self.head_dim,
+            "llama.context_length": self.context_length,
+        }
+
+    def graph_bytes(self, num_batch: int = DEFAULT_NUM_BATCH, flash_attention: bool = False) -> int:
+        """Compute buffers, which grow with the batch size."""
+        graph = self.overhead_bytes * num_batch // DEFAULT_NUM_BATCH
+        return graph // 2 if flash_attention else graph
+
+    def kv_bytes_per_token_as(self, kv_cache_type: str) -> int:
+        return int(self.kv_bytes_per_token * KV_CACHE_BYTES[kv_cache_type] / 2)
+
+    def size_at(
+        self,
+        num_ctx: int,
+        num_batch: int = DEFAULT_NUM_BATCH,
+        kv_cache_type: str = "f16",
+        flash_attention: bool = False,
+    ) -> int:
+        return (
+            self.weights_bytes
+            + self.graph_bytes(num_batch, flash_attention)
+            + self.kv_bytes_per_token_as(kv_cache_type) * num_ctx
+        )
+
+
+@dataclass
+class SimulatedGPU:
+    name: str
+    vram_bytes: int
+    load_bytes_per_sec: float = 2 * GiB
+    load_fixed_seconds: float = 2.0
+    cpu_slowdown: float = 10.0
+
+
+@dataclass
+class LoadedModel:
+    model: SimulatedModel
+    num_ctx: int
+    size: int
+    size_vram: int
+    options: dict = field(default_factory=dict)
+    expires_at: str = ""
+
+
+def expires_at(keep_alive: str | int | float | None) -> str:
+    """The /api/ps expires_at of a model loaded now with keep_alive."""
+    if keep_alive is None:
+        seconds = DEFAULT_KEEP_ALIVE
+    elif isinstance(keep_alive, str):
+        units = {"s": 1, "m": 60, "h": 3600}
+        seconds = float(keep_alive[:-1]) * units[keep_alive[-1]]
+    else:
+        seconds = float(keep_alive)
+    if seconds < 0:
+        # Ollama reports "forever" as a date centuries away
+        return "2318-01-01T00:00:00Z"
+    expires = datetime.now(timezone.utc) + timedelta(seconds=seconds)
+    return expires.isoformat(timespec="microseconds")
+
+
+class SimulatedOllama:
+    """
+    Deterministic stand-in for an Ollama daemon on one GPU.
+
+    Loading a model at a new num_ctx costs a reload, and anything that does
+    not fit in free VRAM is offloaded to the CPU a whole layer at a time.
+    Time is tracked on a simulated clock instead of being slept. The KV cache
+    type, flash attention and the number of parallel slots (each with its own
+    num_ctx of KV cache) are daemon-wide, like OLLAMA_KV_CACHE_TYPE,
+    OLLAMA_FLASH_ATTENTION and OLLAMA_NUM_PARALLEL.
+    """
+
+    def __init__(
+        self,
+        gpu: SimulatedGPU,
+        models: list[SimulatedModel],
+        version: str = "0.12.0",
+        kv_cache_type: str = "f16",
+        flash_attention: bool = False,
+        num_parallel: int = 1,
+    ) -> None:
+        self.gpu = gpu
+        self.models = {m.name: m for m in models}
+        self.version = version
+        self.kv_cache_type = kv_cache_type
+        self.flash_attention = flash_attention
+        self.num_parallel = num_parallel
+        self.loaded: dict[str, LoadedModel] = {}
+        self.clock = 0.0
+        self.loads = 0
+        self.creates = 0
+        self._lock = threading.Lock()
+
+    def optimum(
+        self,
+        model_name: str,
+        max_size: int | None = None,
+        num_batch: int = DEFAULT_NUM_BATCH,
+    ) -> int:
+        """The largest num_ctx that fits entirely in VRAM on an idle GPU."""
+        model = self.models[normalise_model_name(model_name)]
+        free = (
+            self.gpu.vram_bytes
+            - model.weights_bytes
+            - model.graph_bytes(num_batch, self.flash_attention)
+        )
+        per_token = model.kv_bytes_per_token_as(self.kv_cache_type) * self.num_parallel
+        best = max(free // per_token, 0)
+        return min(best, max_size) if max_size is not None else best
+
+    def _placement(
+        self, model: SimulatedModel, num_ctx: int, num_batch: int
+    ) -> tuple[int, int]:
+        size = model.size_at(
+            num_ctx * self.num_parallel, num_batch, self.kv_cache_type, self.flash_attention
+        )
+        used = sum(
+            entry.size_vram
+            for name, entry in self.loaded.items()
+            if name != model.name
+        )
+        free = max(self.gpu.vram_bytes - used, 0)
+        if size <= free:
+            return (size, size)
+        layer = size / model.layers
+        return (size, int(int(free // layer) * layer))
+
+    def load(self, model_name: str, options: dict | None = None) -> LoadedModel:
+        """Load (or reuse) a model and return its placement."""
+        options = options or {}
+        name = normalise_model_name(model_name)
+        model = self.models.get(name)
+        if model is None:
+            raise KeyError(f"model '{model_name}' not found")
+        num_ctx = int(options.get("num_ctx", 4096))
+        num_batch = int(options.get("num_batch", DEFAULT_NUM_BATCH))
+
+        entry = self.loaded.get(name)
+        if entry is not None and entry.num_ctx == num_ctx and entry.options == options:
+            return entry
+
+        self.loaded.pop(name, None)
+        size, size_vram = self._placement(model, num_ctx, num_batch)
+        self.clock += self.gpu.load_fixed_seconds + size / self.gpu.load_bytes_per_sec
+        self.loads += 1
+        entry = LoadedModel(model, num_ctx, size, size_vram, dict(options))
+        self.loaded[name] = entry
+        return entry
+
+    def unload(self, model_name: str) -> None:
+        self.loaded.pop(normalise_model_name(model_name), None)
+
+    def generate(
+        self,
+        model_name: str,
+        prompt: str,
+        options: dict | None = None,
+        keep_alive: str | int | None = None,
+    ) -> dict:
+        with self._lock:
+            clock = self.clock
+            entry = self.load(model_name, options)
+            entry.expires_at = expires_at(keep_alive)
+            load_seconds = self.clock - clock
+            # Prompts longer than the context are truncated, as Ollama does
+            prompt_tokens = min(len(prompt.split()), entry.num_ctx) if prompt else 0
+            self._prefill(entry, prompt_tokens)
+            gpu_fraction = entry.size_vram / entry.size
+            slowdown = gpu_fraction + (1 - gpu_fraction) * self.gpu.cpu_slowdown
+            decode_tps = entry.model.decode_tps / slowdown
+            # Larger batches prefill faster, with diminishing returns
+            num_batch = int(entry.options.get("num_batch", DEFAULT_NUM_BATCH))
+            prompt_tps = (
+                entry.model.prompt_tps * (num_batch / DEFAULT_NUM_BATCH) ** 0.5 / slowdown
+            )
+
+            prompt_tokens = max(prompt_tokens, 1) if prompt else 0
+            eval_tokens = int((options or {}).get("num_predict", DEFAULT_REPLY_TOKENS))
+            if not prompt:
+                eval_tokens = 0
+            prompt_seconds = prompt_tokens / prompt_tps
+            eval_seconds = eval_tokens / decode_tps
+            self.clock += prompt_seconds + eval_seconds
+
+            return {
+                "model": entry.model.name,
+                "response": "Hello! " * (eval_tokens // 2) if eval_tokens else "",
+                "done": True,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * 1e9),
+                "eval_count": eval_tokens,
+                "eval_duration": int(eval_seconds * 1e9),
+                "load_duration": int(load_seconds * 1e9),
+            }
+
+    def _prefill(self, entry: LoadedModel, prompt_tokens: int) -> None:
+        """Spill whole layers if the prompt's scratch memory does not fit."""
+        scratch = entry.model.prefill_bytes_per_token * prompt_tokens
+        if not scratch:
+            return
+        used = sum(e.size_vram for e in self.loaded.values() if e is not entry)
+        free = max(self.gpu.vram_bytes - used - scratch, 0)
+        if entry.size_vram > free:
+            layer = entry.size / entry.model.layers
+            entry.size_vram = int(int(free // layer) * layer)
+
+    def ps(self) -> list[dict]:
+        """Loaded models in the /api/ps format."""
+        return [
+            {
+                "name": entry.model.name,
+                "model": entry.model.name,
+                "size": entry.size,
+                "size_vram": entry.size_vram,
+                "digest": entry.model.digest,
+                "context_length": entry.num_ctx,
+                "expires_at": entry.expires_at or expires_at(None),
+            }
+            for entry in self.loaded.values()
+        ]
+
+    def ps_text(self) -> str:
+        """Loaded models in the `ollama ps` table format."""
+        lines = ["NAME    ID    SIZE    PROCESSOR    CONTEXT    UNTIL"]
+        for entry in self.loaded.values():
+            gpu = round(100 * entry.size_vram / entry.size)
+            if gpu >= 100:
+                processor = "100% GPU"
+            elif gpu <= 0:
+                processor = "100% CPU"
+            else:
+                processor = f"{100 - gpu}%/{gpu}% CPU/GPU"
+            lines.append(
+                f"{entry.model.name}    {entry.model.digest[7:19]}    "
+                f"{entry.size / 1000**3:.1f} GB    {processor}    {entry.num_ctx}    "
+                "4 minutes from now"
+            )
+        return "\n".join(lines)
+
+    def show(self, model_name: str) -> dict:
+        model = self.models.get(normalise_model_name(model_name))
+        if model is None:
+            raise KeyError(f"model '{model_name}' not found")
+        return {
+            "model_info": model.model_info(),
+            "parameters": model.parameters_text(),
+            "details": {},
+        }
+
+    def create(self, model_name: str, source: str, parameters: dict) -> None:
+        """Re-create a model from itself with a new parameter set."""
+        if normalise_model_name(model_name) != normalise_model_name(source):
+            raise KeyError(f"copying '{source}' to another name is not simulated")
+        model = self.models.get(normalise_model_name(source))
+        if model is None:
+            raise KeyError(f"model '{source}' not found")
+        with self._lock:
+            model.parameters = dict(parameters)
+            self.creates += 1
+            seed = json.dumps([model.name, model.weights_bytes, model.parameters], sort_keys=True)
+            model.digest = f"sha256:{hashlib.sha256(seed.encode()).hexdigest()}"
+
+    def tags(self) -> list[dict]:
+        return [
+            {"name": m.name, "model": m.name, "size": m.weights_bytes, "digest": m.digest}
+            for m in self.models.values()
+        ]
+
+
+class SimulatedController:
+    """
+    In-process controller over a SimulatedOllama, with the same interface as
+    OllamaController and OllamaApiController.
+    """
+
+    def __init__(self, sim: SimulatedOllama, model_name: str) -> None:
+        self.sim = sim
+        self.model_name = model_name
+
+    def set_context(self, size: int, options: dict | None = None) -> tuple[bool, dict]:
+        try:
+            self.sim.generate(self.model_name, "Hello", {**(options or {}), "num_ctx": size})
+        except KeyError as e:
+            logger.warning(f"Simulated generate failed: {e}")
+            return (False, {"context_size": None, "processor": None, "success": False})
+        return (True, self.monitor_context())
+
+    def monitor_context(self) -> dict:
+        target = normalise_model_name(self.model_name)
+        for entry in self.sim.ps():
+            if entry["name"] == target:
+                return {
+                    "context_size": entry["context_length"],
+                    "processor": processor_from_sizes(entry["size"], entry["size_vram"]),
+                    "success": True,
+                    "size": entry["size"],
+                    "gpu_fraction": entry["size_vram"] / entry["size"],
+                }
+        return {"context_size": None, "processor": None, "success": False}
+
+    def save_model(self, context_size: int) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class _SimulatedOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this every keep-alive
+    # response waits on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        sim = self.server.sim
+        self.server.requests.append((self.command, self.path, None))
+        if self.path == "/api/ps":
+            self._reply(200, {"models": sim.ps()})
+        elif self.path == "/api/tags":
+            self._reply(200, {"models": sim.tags()})
+        elif self.path == "/api/version":
+            self._reply(200, {"version": sim.version})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        sim = self.server.sim
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append((self.command, self.path, payload))
+        model = payload.get("model", "")
+
+        if self.path == "/api/generate":
+            if payload.get("keep_alive") == 0 and not payload.get("prompt"):
+                sim.unload(model)
+                self._reply(200, {"model": model, "done": True, "done_reason": "unload"})
+                return
+            if self.server.generate_delay:
+                time.sleep(self.server.generate_delay)
+            try:
+                response = sim.generate(
+                    model,
+                    payload.get("prompt", ""),
+                    payload.get("options"),
+                    payload.get("keep_alive"),
+                )
+            except KeyError as e:
+                self._reply(404, {"error": str(e)})
+                return
+            self._reply(200, response)
+        elif self.path == "/api/show":
+            try:
+                self._reply(200, sim.show(model))
+            except KeyError as e:
+                self._reply(404, {"error": str(e)})
+        elif self.path == "/api/create":
+            try:
+                sim.create(model, payload.get("from", ""), payload.get("parameters", {}))
+            except KeyError as e:
+                self._reply(400, {"error": str(e)})
+                return
+            self._reply(200, {"status": "success"})
+        else:
+            self._reply(404, {"error": "not found"})
+
+
+class SimulatedOllamaServer(ThreadingHTTPServer):
+    """Serves a SimulatedOllama over the Ollama REST API on a local port."""
+
+    daemon_threads = True
+
+    def __init__(
+        self, sim: SimulatedOllama, port: int = 0, generate_delay: float = 0.0
+    ) -> None:
+        super().__init__(("127.0.0.1", port), _SimulatedOllamaHandler)
+        self.sim = sim
+        # Wall-clock seconds each generate request stalls, to mimic a slow host
+        self.generate_delay = generate_delay
+        self.requests: list[tuple] = []
+        self._thread: threading.Thread | None = None
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "SimulatedOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def handle_error(self, request, client_address) -> None:
+        # A client that timed out has gone away before the reply
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
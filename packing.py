@@ -0,0 +1,249 @@
+import http.client
+import logging
+import time
+from dataclasses import dataclass
+from ollama_api import (
+    OllamaApiController,
+    OllamaApiError,
+    OllamaClient,
+    normalise_model_name,
+    processor_from_sizes,
+)
+from tracing import span
+
+TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+PACK_KEEP_ALIVE = "10m"
+DEFAULT_MAX_ROUNDS = 5
+# Assigned contexts are rounded down to a multiple of this
+DEFAULT_GRANULARITY = 256
+# Capacity given up per failed round when the overflow cannot be measured
+FALLBACK_SHRINK = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def _log(message: str) -> None:
+    logger.info(f"[{time.strftime(TIMEFORMAT)}] {message}")
+
+
+@dataclass
+class PackItem:
+    """One model to keep resident, with the context range it may be given."""
+
+    model: str
+    min_ctx: int
+    target_ctx: int
+    weight: float = 1.0
+    # Fitted loaded size: intercept + slope * num_ctx bytes
+    intercept: float | None = None
+    slope: float | None = None
+    num_ctx: int = 0
+
+    def size_at(self, num_ctx: int) -> float:
+        return self.intercept + self.slope * num_ctx
+
+
+def parse_pack_spec(text: str) -> PackItem:
+    """Parse a ``MODEL=MIN,TARGET[,WEIGHT]`` packing spec."""
+    model, sep, rest = text.partition("=")
+    fields = rest.split(",")
+    if not sep or not model or len(fields) not in (2, 3):
+        raise ValueError(f"expected MODEL=MIN,TARGET[,WEIGHT], got '{text}'")
+    min_ctx, target_ctx = int(fields[0]), int(fields[1])
+    weight = float(fields[2]) if len(fields) == 3 else 1.0
+    if not 0 < min_ctx <= target_ctx or weight <= 0:
+        raise ValueError(f"need 0 < MIN <= TARGET and WEIGHT > 0 in '{text}'")
+    return PackItem(model, min_ctx, target_ctx, weight)
+
+
+def fit_line(points: list[tuple[int, int]]) -> tuple[float, float]:
+    """Least-squares (intercept, slope) of loaded size against num_ctx."""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return (mean_y, 0.0)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return (mean_y - slope * mean_x, max(slope, 0.0))
+
+
+def allocate(
+    items: list[PackItem], capacity: float, granularity: int = DEFAULT_GRANULARITY
+) -> dict[str, int]:
+    """
+    Assign each model a num_ctx in [min_ctx, target_ctx] that maximises the
+    weighted total context within capacity bytes.
+
+    Every model starts at its minimum; the spare bytes then go to the models
+    with the most weight per byte of KV cache first, which is optimal for a
+    linear objective with box constraints.
+
+    Raises:
+        ValueError: if the models do not fit even at their minimum contexts
+    """
+    spare = capacity - sum(item.size_at(item.min_ctx) for item in items)
+    if spare < 0:
+        raise ValueError(
+            f"The models need {-spare / 1024**3:.2f} GiB more than the capacity "
+            "at their minimum contexts"
+        )
+
+    assignment = {item.model: item.min_ctx for item in items}
+    by_value = sorted(
+        items,
+        key=lambda item: item.weight / item.slope if item.slope else float("inf"),
+        reverse=True,
+    )
+    for item in by_value:
+        room = item.target_ctx - item.min_ctx
+        if item.slope:
+            room = min(room, int(spare // item.slope))
+        grown = item.min_ctx + room
+        if grown < item.target_ctx:
+            grown = max(item.min_ctx, grown - grown % granularity)
+        assignment[item.model] = grown
+        spare -= (grown - item.min_ctx) * item.slope
+    return assignment
+
+
+class Packer:
+    """
+    Fits several models on the GPU at once.
+
+    Each model's loaded size is measured alone at two contexts and fitted
+    as a line. The contexts are then allocated from the fitted sizes,
+    checked by loading every model together, and shrunk until all of them
+    report "100% GPU".
+    """
+
+    def __init__(
+        self,
+        client: OllamaClient,
+        items: list[PackItem],
+        capacity: int,
+        max_rounds: int = DEFAULT_MAX_ROUNDS,
+        granularity: int = DEFAULT_GRANULARITY,
+    ) -> None:
+        self.client = client
+        self.items = items
+        self.capacity = capacity
+        self.max_rounds = max_rounds
+        self.granularity = granularity
+        self.rounds = 0
+
+    def _load(self, model: str, num_ctx: int) -> None:
+        self.client.generate(
+            model, "", options={"num_ctx": num_ctx}, keep_alive=PACK_KEEP_ALIVE
+        )
+
+    def _loaded(self) -> dict[str, dict]:
+        return {
+            normalise_model_name(entry.get("name", "")): entry for entry in self.client.ps()
+        }
+
+    def measure(self) -> None:
+        """Fit size against num_ctx for every model, each loaded on its own."""
+        for item in self.items:
+            upper = item.target_ctx if item.target_ctx > item.min_ctx else item.min_ctx * 2
+            points = []
+            with span("pack.measure", model=item.model) as record:
+                for num_ctx in (item.min_ctx, upper):
+                    self._load(item.model, num_ctx)
+                    entry = self._loaded().get(normalise_model_name(item.model))
+                    if entry and entry.get("size"):
+                        points.append((num_ctx, int(entry["size"])))
+                self.client.unload(item.model)
+                if len(points) < 2:
+                    raise RuntimeError(f"Could not measure the loaded size of {item.model}")
+                item.intercept, item.slope = fit_line(points)
+                record["slope"] = item.slope
+            _log(
+                f"{item.model}: {item.intercept / 1024**3:.2f} GiB + "
+                f"{item.slope / 1024:.1f} KiB per context token"
+            )
+
+    def verify(self, assignment: dict[str, int]) -> tuple[bool, int]:
+        """
+        Load every model at its assigned context and check that all are
+        resident and entirely on the GPU.
+
+        Returns:
+            (all on GPU, bytes that spilled to the CPU)
+        """
+        with span("pack.verify", **assignment) as record:
+            for model in assignment:
+                self.client.unload(model)
+            for model, num_ctx in assignment.items():
+                self._load(model, num_ctx)
+
+            loaded = self._loaded()
+            spilled = 0
+            ok = True
+            for model in assignment:
+                entry = loaded.get(normalise_model_name(model))
+                if entry is None:
+                    _log(f"{model} was evicted while loading the others")
+                    ok = False
+                    continue
+                size, size_vram = int(entry.get("size", 0)), int(entry.get("size_vram", 0))
+                if processor_from_sizes(size, size_vram) != "100% GPU":
+                    ok = False
+                    spilled += size - size_vram
+            record["outcome"] = "fits" if ok else f"spilled {spilled}"
+            return (ok, spilled)
+
+    def pack(self) -> dict[str, int]:
+        """
+        Measure, allocate and verify until every model fits together.
+
+        Raises:
+            ValueError: if the minimum contexts do not fit
+            RuntimeError: if no verified assignment was found within max_rounds
+        """
+        if any(item.slope is None for item in self.items):
+            self.measure()
+
+        capacity = float(self.capacity)
+        for self.rounds in range(1, self.max_rounds + 1):
+            assignment = allocate(self.items, capacity, self.granularity)
+            _log(f"Round {self.rounds}: trying {assignment}")
+            ok, spilled = self.verify(assignment)
+            if ok:
+                for item in self.items:
+                    item.num_ctx = assignment[item.model]
+                return assignment
+            # Give up the bytes that spilled (plus one granule for every
+            # model), or a fixed share when nothing could be measured
+            shrink = spilled + sum(item.slope * self.granularity for item in self.items)
+            capacity -= shrink if spilled else capacity * FALLBACK_SHRINK
+        raise RuntimeError(
+            f"No assignment kept every model on the GPU after {self.max_rounds} rounds"
+        )
+
+    def save(self) -> dict[str, bool]:
+        """Save every packed model with its assigned context."""
+        saved = {}
+        for item in self.items:
+            controller = OllamaApiController(item.model, client=self.client)
+            try:
+                saved[item.model] = controller.save_model(item.num_ctx)
+            except (OllamaApiError, OSError, http.client.HTTPException) as e:
+                logger.error(f"Could not save {item.model}: {e}")
+                saved[item.model] = False
+        return saved
+
+
+def format_packing(items: list[PackItem], saved: dict[str, bool] | None = None) -> str:
+    width = max([len("MODEL")] + [len(item.model) for item in items])
+    lines = [
+        f"{'MODEL':<{width}}  {'WEIGHT':>6}  {'MIN':>8}  {'TARGET':>8}  {'NUM_CTX':>8}  {'SIZE':>9}  SAVED"
+    ]
+    for item in items:
+        size = f"{item.size_at(item.num_ctx) / 1024**3:.2f}GiB" if item.slope is not None else "-"
+        status = "-" if saved is None else ("yes" if saved.get(item.model) else "FAILED")
+        lines.append(
+            f"{item.model:<{width}}  {item.weight:>6g}  {item.min_ctx:>8}  {item.target_ctx:>8}  "
+            f"{item.num_ctx:>8}  {size:>9}  {status}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,195 @@
+import http.client
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from context_searcher import ContextSearcher
+from ollama_api import TIMEOUT_SET, OllamaApiController, OllamaApiError
+from tracing import span
+
+TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_HEALTH_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def _log(message: str) -> None:
+    logger.info(f"[{time.strftime(TIMEFORMAT)}] {message}")
+
+
+@dataclass
+class Endpoint:
+    host: str
+    controller: OllamaApiController
+    healthy: bool = True
+    reason: str | None = None
+
+
+class EndpointPool:
+    """
+    Ollama daemons on identical hardware that can each run a probe of the
+    same model. Endpoints that fail a health check or time out are excluded
+    for the rest of the run.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        hosts: list[str],
+        probe_timeout: float = TIMEOUT_SET,
+        health_timeout: float = DEFAULT_HEALTH_TIMEOUT,
+    ) -> None:
+        self.model_name = model_name
+        self.health_timeout = health_timeout
+        self.endpoints: list[Endpoint] = []
+        for host in dict.fromkeys(hosts):
+            controller = OllamaApiController(model_name, host=host)
+            controller.timeout = probe_timeout
+            self.endpoints.append(Endpoint(host, controller))
+
+    @property
+    def healthy(self) -> list[Endpoint]:
+        return [e for e in self.endpoints if e.healthy]
+
+    @property
+    def controllers(self) -> list[OllamaApiController]:
+        return [e.controller for e in self.endpoints]
+
+    def exclude(self, endpoint: Endpoint, reason: str) -> None:
+        endpoint.healthy = False
+        endpoint.reason = reason
+        endpoint.controller.client.close()
+        logger.warning(f"Excluding Ollama endpoint {endpoint.host}: {reason}")
+
+    def check(self, endpoint: Endpoint) -> bool:
+        """Confirm the daemon answers and has the model; exclude it if not."""
+        client = endpoint.controller.client
+        try:
+            client.version(timeout=self.health_timeout)
+            client.show(self.model_name, timeout=self.health_timeout)
+        except (OllamaApiError, OSError, http.client.HTTPException) as e:
+            self.exclude(endpoint, f"health check failed: {e}")
+            return False
+        return True
+
+    def check_health(self) -> list[Endpoint]:
+        """Check every endpoint concurrently; the ones still healthy."""
+        endpoints = self.healthy
+        if endpoints:
+            with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+                list(executor.map(self.check, endpoints))
+        return self.healthy
+
+    def still_healthy(self, endpoint: Endpoint, elapsed: float) -> bool:
+        """
+        After a failed probe, decide whether the endpoint or the size was at
+        fault. A probe that ran into its timeout excludes the endpoint.
+        """
+        if elapsed >= endpoint.controller.timeout:
+            self.exclude(endpoint, f"probe timed out after {elapsed:.1f}s")
+            return False
+        return self.check(endpoint)
+
+    def save_model(self, context_size: int) -> bool:
+        """Save the context size on every healthy endpoint."""
+        saved = [e.controller.save_model(context_size) for e in self.healthy]
+        return bool(saved) and all(saved)
+
+    def close(self) -> None:
+        for endpoint in self.endpoints:
+            endpoint.controller.close()
+
+
+class ParallelContextSearcher(ContextSearcher):
+    """
+    ContextSearcher that probes k sizes at once on a pool of k endpoints, so
+    every round splits the bracket into k+1 parts instead of two.
+    """
+
+    def __init__(self, pool: EndpointPool, **kwargs) -> None:
+        super().__init__(pool, **kwargs)
+        self.pool = pool
+        self.rounds = 0
+
+    def _search(self, low: int, high: int, last_good_size: int) -> int:
+        if len(self.pool.healthy) < 2:
+            return super()._search(low, high, last_good_size)
+        if self.strategy != "bisect":
+            logger.warning(
+                f"The {self.strategy} strategy probes one size at a time; "
+                f"using the k-ary search over {len(self.pool.healthy)} endpoints instead"
+            )
+        return self._kary_search(low, high, last_good_size)
+
+    def _probe(self, size: int, use_cache: bool = True) -> str | None:
+        return self._probe_many([size], use_cache)[size]
+
+    def _probe_many(self, sizes: list[int], use_cache: bool = True) -> dict[int, str | None]:
+        """
+        Probe the sizes concurrently, one per healthy endpoint. A size whose
+        endpoint is excluded mid-probe is retried on another endpoint.
+        """
+        results: dict[int, str | None] = {}
+        pending = []
+        for size in sizes:
+            cached = self._cached_probe(size) if use_cache else None
+            if cached is not None:
+                results[size] = cached
+            else:
+                pending.append(size)
+
+        while pending:
+            self._check_deadline()
+            endpoints = self.pool.healthy
+            if not endpoints:
+                raise RuntimeError(
+                    f"No healthy Ollama endpoints left for {self.pool.model_name}"
+                )
+            batch = list(zip(pending, endpoints))
+            pending = pending[len(batch):]
+            with ThreadPoolExecutor(max_workers=len(batch)) as executor:
+                futures = [
+                    (size, endpoint, executor.submit(self._probe_on, endpoint, size))
+                    for size, endpoint in batch
+                ]
+            for size, endpoint, future in futures:
+                success, monitor_results, elapsed = future.result()
+                if not success and not self.pool.still_healthy(endpoint, elapsed):
+                    _log(f"Retrying size {size} on another endpoint")
+                    pending.append(size)
+                    continue
+                results[size] = self._record(size, success, monitor_results, elapsed)
+        return results
+
+    def _probe_on(self, endpoint: Endpoint, size: int) -> tuple[bool, dict, float]:
+        with span(
+            "probe", model=self.pool.model_name, num_ctx=size, host=endpoint.host
+        ) as record:
+            success, monitor_results, elapsed = self._measure(endpoint.controller, size)
+            record["outcome"] = (
+                (monitor_results.get("processor") or "NOT_FOUND") if success else "failed"
+            )
+            record["cached"] = False
+            return (success, monitor_results, elapsed)
+
+    def _kary_search(self, low: int, high: int, last_good_size: int) -> int:
+        _log(f"Starting parallel search with range {low} to {high}")
+
+        while low <= high and (high - low) >= self.tolerance:
+            k = len(self.pool.healthy)
+            width = high - low + 1
+            candidates = sorted({low + width * i // (k + 1) for i in range(1, k + 1)})
+            self.rounds += 1
+            _log(f"Round {self.rounds}: testing context sizes {candidates}")
+
+            results = self._probe_many(candidates)
+            fits = [size for size in candidates if results[size] == "100% GPU"]
+            if fits:
+                last_good_size = max(fits)
+                low = last_good_size + 1
+            spills = [size for size in candidates if size >= low and results[size] != "100% GPU"]
+            if spills:
+                high = min(spills) - 1
+
+        _log(f"Parallel search completed, optimal size: {last_good_size}")
+        return last_good_size
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_INTERVAL = 0.25
+DEFAULT_CAPACITY = 64
+DEFAULT_STABLE_SAMPLES = 3
+DEFAULT_SETTLE_TIMEOUT = 30
+
+
+def _reading_key(reading: dict) -> tuple:
+    return (
+        reading.get("success"),
+        reading.get("processor"),
+        reading.get("context_size"),
+        reading.get("size"),
+    )
+
+
+class PlacementSampler:
+    """
+    Polls a placement reading (a monitor_context() style dict) on a background
+    thread into a bounded ring buffer, so callers can wait for the reading to
+    settle instead of sleeping for a fixed time.
+    """
+
+    def __init__(
+        self,
+        sample_fn: Callable[[], dict],
+        interval: float = DEFAULT_INTERVAL,
+        capacity: int = DEFAULT_CAPACITY,
+    ) -> None:
+        self.sample_fn = sample_fn
+        self.interval = interval
+        self._samples: deque[tuple[float, dict]] = deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "PlacementSampler":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="placement-sampler", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self) -> "PlacementSampler":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Stamp the sample with the time the query was issued, so a
+            # reading is never credited to after the load it raced with.
+            issued = time.monotonic()
+            try:
+                reading = self.sample_fn()
+            except Exception as e:
+                logger.debug(f"Placement sample failed: {e}")
+                reading = {"context_size": None, "processor": None, "success": False}
+            with self._cond:
+                self._samples.append((issued, reading))
+                self._cond.notify_all()
+            self._stop.wait(self.interval)
+
+    def samples(self, since: float | None = None) -> list[tuple[float, dict]]:
+        with self._cond:
+            return [(t, r) for t, r in self._samples if since is None or t >= since]
+
+    def latest(self) -> dict | None:
+        with self._cond:
+            return self._samples[-1][1] if self._samples else None
+
+    @staticmethod
+    def _settled(
+        samples: list[tuple[float, dict]],
+        stable_samples: int,
+        window: float | None,
+        now: float,
+    ) -> dict | None:
+        if not samples or not samples[-1][1].get("success"):
+            return None
+        key = _reading_key(samples[-1][1])
+        run_start = samples[-1][0]
+        run_length = 0
+        for issued, reading in reversed(samples):
+            if _reading_key(reading) != key:
+                break
+            run_start = issued
+            run_length += 1
+        if run_length >= stable_samples:
+            return samples[-1][1]
+        if window is not None and now - run_start >= window:
+            return samples[-1][1]
+        return None
+
+    def wait_stable(
+        self,
+        since: float | None = None,
+        stable_samples: int = DEFAULT_STABLE_SAMPLES,
+        window: float | None = None,
+        timeout: float = DEFAULT_SETTLE_TIMEOUT,
+    ) -> dict | None:
+        """
+        Block until the model is loaded and its placement has settled.
+
+        Settled means the last ``stable_samples`` readings taken after
+        ``since`` are identical, or, when ``window`` is given, the reading
+        has not changed for that many seconds. Returns as soon as either
+        holds.
+
+        Returns:
+            The settled reading; on timeout the latest reading after
+            ``since`` (or None if there is none)
+        """
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                recent = [
+                    (t, r) for t, r in self._samples if since is None or t >= since
+                ]
+                settled = self._settled(recent, stable_samples, window, now)
+                if settled is not None:
+                    return settled
+                remaining = deadline - now
+                if remaining <= 0 or self._stop.is_set():
+                    break
+                self._cond.wait(min(remaining, self.interval))
+
+        logger.warning(f"Placement did not settle within {timeout}s")
+        return recent[-1][1] if recent else None
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_ENTRIES = 4096
+TIMEOUT_SMI = 10
+CACHE_VERSION = 1
+
+# Serialises the read-merge-write of save() between caches in one process
+_SAVE_LOCK = threading.Lock()
+
+
+def default_cache_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "optimise-ollama-model", "probes.json")
+
+
+def detect_gpu_fingerprint() -> str:
+    """Describe the local GPUs as "name/MiB/driver" entries, or "unknown"."""
+    try:
+        result = subprocess.run(
+            [
+                "nvidia-smi",
+                "--query-gpu=name,memory.total,driver_version",
+                "--format=csv,noheader,nounits",
+            ],
+            capture_output=True,
+            text=True,
+            timeout=TIMEOUT_SMI,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"nvidia-smi unavailable: {e}")
+        return "unknown"
+    if result.returncode != 0 or not result.stdout.strip():
+        return "unknown"
+    gpus = [
+        "/".join(field.strip() for field in line.split(","))
+        for line in result.stdout.strip().splitlines()
+    ]
+    return "+".join(gpus)
+
+
+def make_fingerprint(model_digest: str, ollama_version: str, gpu_fingerprint: str) -> str:
+    """Identify the conditions a probe result is valid under."""
+    return f"{model_digest}|{ollama_version}|{gpu_fingerprint}"
+
+
+class ProbeCache:
+    """
+    On-disk LRU cache of probe outcomes keyed by fingerprint and num_ctx.
+
+    The file is rewritten atomically after every insert, so the probes of an
+    interrupted search survive and the next run can resume from them. Each
+    save merges in what other caches on the same file wrote since, so
+    concurrent searches do not drop each other's probes.
+    """
+
+    def __init__(
+        self, path: str | None = None, max_entries: int = DEFAULT_MAX_ENTRIES
+    ) -> None:
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._load()
+
+    @staticmethod
+    def _key(fingerprint: str, num_ctx: int) -> str:
+        return f"{fingerprint}|{num_ctx}"
+
+    def _load(self) -> None:
+        self._entries.update(self._read())
+        self._evict()
+
+    def _read(self) -> OrderedDict[str, dict]:
+        """The entries currently in the file."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return OrderedDict()
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable probe cache {self.path}: {e}")
+            return OrderedDict()
+        if data.get("version") != CACHE_VERSION:
+            logger.info(f"Ignoring probe cache with version {data.get('version')}")
+            return OrderedDict()
+        return OrderedDict((key, entry) for key, entry in data.get("entries", []))
+
+    def _merge(self, on_disk: OrderedDict[str, dict]) -> None:
+        """Add the file's entries, keeping the newer of two for the same key."""
+        merged = on_disk
+        for key, entry in self._entries.items():
+            other = merged.get(key)
+            if other is None or entry.get("recorded_at", 0) >= other.get("recorded_at", 0):
+                merged[key] = entry
+            merged.move_to_end(key)
+        self._entries = merged
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, fingerprint: str, num_ctx: int) -> dict | None:
+        key = self._key(fingerprint, num_ctx)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, fingerprint: str, num_ctx: int, result: dict) -> None:
+        key = self._key(fingerprint, num_ctx)
+        self._entries[key] = {
+            "fingerprint": fingerprint,
+            "num_ctx": num_ctx,
+            "recorded_at": time.time(),
+            **result,
+        }
+        self._entries.move_to_end(key)
+        self._evict()
+        self.save()
+
+    def entries_for(self, fingerprint: str) -> dict[int, dict]:
+        """All cached results for one fingerprint, keyed by num_ctx."""
+        return {
+            entry["num_ctx"]: entry
+            for entry in self._entries.values()
+            if entry.get("fingerprint") == fingerprint
+        }
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path) or "."
+        with _SAVE_LOCK:
+            self._merge(self._read())
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(
+                        {"version": CACHE_VERSION, "entries": list(self._entries.items())},
+                        f,
+                    )
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logger.warning(f"Could not write probe cache {self.path}: {e}")
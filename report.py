@@ -0,0 +1,101 @@
+import json
+from dataclasses import asdict, dataclass, field
+from context_searcher import ProbeSample
+
+# Exit codes of the command line tool
+EXIT_OK = 0
+# A usage error, or a search that could not find a size that fits
+EXIT_FAILED = 1
+# A size was found but could not be saved to the model
+EXIT_NOT_SAVED = 3
+EXIT_CANCELLED = 130
+
+
+@dataclass(slots=True)
+class ProbeRecord:
+    """One probe of a search: the size tried and what the daemon reported."""
+
+    num_ctx: int
+    placement: str | None
+    size: int | None = None
+    gpu_fraction: float | None = None
+    cached: bool = False
+    # Wall-clock seconds of the probe and the daemon's phases within it
+    elapsed: float | None = None
+    load_seconds: float | None = None
+    prompt_eval_seconds: float | None = None
+    eval_seconds: float | None = None
+    prompt_tps: float | None = None
+    eval_tps: float | None = None
+    error: str | None = None
+    # Options the probe ran with besides num_ctx, in a joint search
+    options: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_sample(cls, sample: ProbeSample, options: dict | None = None) -> "ProbeRecord":
+        return cls(
+            sample.num_ctx,
+            sample.processor,
+            sample.size,
+            sample.gpu_fraction,
+            sample.cached,
+            sample.elapsed,
+            sample.load_seconds,
+            sample.prompt_eval_seconds,
+            sample.eval_seconds,
+            sample.prompt_tps,
+            sample.eval_tps,
+            sample.error,
+            dict(options or {}),
+        )
+
+
+@dataclass(slots=True)
+class OptimiseReport:
+    """Everything one optimisation of a model did and decided."""
+
+    model: str
+    strategy: str
+    objective: str
+    min_size: int
+    max_size: int | None = None
+    # Where the search started from: the memory estimate or a saved num_ctx
+    predicted: int | None = None
+    hint: int | None = None
+    probes: list[ProbeRecord] = field(default_factory=list)
+    # The decision: the size chosen, the options and daemon configuration
+    # chosen with it in a joint search, and whether it was saved
+    num_ctx: int | None = None
+    options: dict = field(default_factory=dict)
+    server: str | None = None
+    saved: bool = False
+    elapsed: float = 0.0
+    error: str | None = None
+    cancelled: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.saved
+
+    @property
+    def exit_code(self) -> int:
+        if self.cancelled:
+            return EXIT_CANCELLED
+        if self.ok:
+            return EXIT_OK
+        if self.num_ctx is not None and self.error is None:
+            return EXIT_NOT_SAVED
+        return EXIT_FAILED
+
+    def record_probes(self, samples: list[ProbeSample], options: dict | None = None) -> None:
+        self.probes.extend(ProbeRecord.from_sample(sample, options) for sample in samples)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "ok": self.ok, "exit_code": self.exit_code}
+
+
+def format_json(reports: OptimiseReport | list[OptimiseReport]) -> str:
+    """A report, or a list of them, as indented JSON."""
+    if isinstance(reports, list):
+        return json.dumps([report.to_dict() for report in reports], indent=2)
+    return json.dumps(reports.to_dict(), indent=2)
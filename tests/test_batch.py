@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import MagicMock
+
+from batch import format_report, run_batch, schedule_models, select_models
+
+INSTALLED = [
+    "qwen3:8b",
+    "qwen3:30b",
+    "qwen3-coder:latest",
+    "llama3.1:latest",
+    "nomic-embed-text:latest",
+]
+
+
+class TestSelection(unittest.TestCase):
+    def test_globs_and_names(self):
+        self.assertEqual(
+            select_models(["qwen3:*", "llama3.1"], INSTALLED),
+            ["qwen3:8b", "qwen3:30b", "llama3.1:latest"],
+        )
+
+    def test_duplicates_dropped(self):
+        self.assertEqual(
+            select_models(["qwen3*", "qwen3:8b"], INSTALLED),
+            ["qwen3:8b", "qwen3:30b", "qwen3-coder:latest"],
+        )
+
+    def test_unknown_name_is_kept(self):
+        self.assertEqual(select_models(["missing"], INSTALLED), ["missing"])
+        self.assertEqual(select_models(["missing*"], INSTALLED), [])
+
+    def test_resident_models_first_then_smallest(self):
+        sizes = {"qwen3:8b": 5, "qwen3:30b": 18, "llama3.1:latest": 4}
+        order = schedule_models(
+            ["qwen3:30b", "qwen3:8b", "llama3.1:latest"], ["qwen3:30b"], sizes
+        )
+        self.assertEqual(order, ["qwen3:30b", "llama3.1:latest", "qwen3:8b"])
+
+
+class TestRunBatch(unittest.TestCase):
+    def test_failure_does_not_abort_batch(self):
+        def optimise(model):
+            if model == "bad":
+                raise TimeoutError("Search time budget exhausted after 3 probe(s)")
+            if model == "unsaved":
+                return (8192, False)
+            return (32768, True)
+
+        client = MagicMock()
+        results = run_batch(["good", "bad", "unsaved", "last"], optimise, client)
+
+        self.assertEqual([r.model for r in results], ["good", "bad", "unsaved", "last"])
+        self.assertEqual([r.ok for r in results], [True, False, False, True])
+        self.assertIn("time budget", results[1].error)
+        self.assertEqual(results[2].error, "save failed")
+        self.assertEqual(client.unload.call_count, 4)
+
+    def test_report(self):
+        results = run_batch(["a", "b"], lambda m: (4096, m == "a"))
+        report = format_report(results, 12.5)
+        self.assertIn("FAILED: save failed", report)
+        self.assertIn("2 model(s), 1 failed, total wall-clock 12.5s", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
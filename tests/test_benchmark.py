@@ -0,0 +1,73 @@
+import unittest
+
+from benchmark import run_benchmark, summarise
+from context_searcher import ContextSearcher
+from ollama_api import OllamaApiController
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+
+# Mean probe counts over the default matrix. Raise these only deliberately:
+# a higher count is a search-speed regression.
+MAX_MEAN_PROBES = {
+    "bisect": 7.5,
+    "interpolate": 5.0,
+    "bisect+estimate": 5.5,
+    "interpolate+estimate": 4.0,
+}
+
+
+class TestBenchmark(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = run_benchmark()
+        cls.summary = summarise(cls.results)
+
+    def test_every_result_fits_and_is_close(self):
+        for r in self.results:
+            with self.subTest(strategy=r.strategy, model=r.model, gpu=r.gpu):
+                self.assertGreaterEqual(r.error, 0)
+                self.assertLess(r.error, 1000)
+
+    def test_probe_counts_do_not_regress(self):
+        for strategy, limit in MAX_MEAN_PROBES.items():
+            with self.subTest(strategy=strategy):
+                self.assertLessEqual(self.summary[strategy]["mean_probes"], limit)
+
+    def test_deterministic(self):
+        self.assertEqual(run_benchmark(["interpolate"]), run_benchmark(["interpolate"]))
+
+
+class TestSimulatedServer(unittest.TestCase):
+    def test_api_backend_end_to_end(self):
+        model = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        sim = SimulatedOllama(SimulatedGPU("12GB", 12 * GiB), [model])
+        server = SimulatedOllamaServer(sim).start()
+        controller = OllamaApiController("llama3.1:8b", host=server.host)
+        try:
+            result = ContextSearcher(controller, strategy="interpolate").find_optimal_size(
+                4096, model.context_length
+            )
+        finally:
+            controller.close()
+            server.stop()
+        optimum = sim.optimum("llama3.1:8b")
+        self.assertLessEqual(result, optimum)
+        self.assertGreater(result, optimum - 1000)
+
+    def test_offload_is_layer_granular(self):
+        model = SimulatedModel("llama3.1:8b", int(4.9 * GiB), layers=32)
+        sim = SimulatedOllama(SimulatedGPU("8GB", 8 * GiB), [model])
+        entry = sim.load("llama3.1:8b", {"num_ctx": 131072})
+        layer = entry.size / 32
+        self.assertLess(entry.size_vram, 8 * GiB)
+        self.assertAlmostEqual(entry.size_vram / layer, round(entry.size_vram / layer))
+        self.assertIn("CPU/GPU", sim.ps_text())
+
+
+if __name__ == "__main__":
+    unittest.main()
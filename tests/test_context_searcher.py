@@ -0,0 +1,282 @@
+import os
+import tempfile
+import unittest
+
+from context_searcher import OVER_HEADROOM, ContextSearcher
+from probe_cache import ProbeCache
+
+
+class FakeController:
+    """Reports 100% GPU below a fixed boundary and MIXED above it."""
+
+    def __init__(self, boundary: int) -> None:
+        self.model_name = "fake-model"
+        self.boundary = boundary
+        self.probes: list[int] = []
+
+    def set_context(self, size: int) -> tuple[bool, dict]:
+        self.probes.append(size)
+        processor = "100% GPU" if size <= self.boundary else "MIXED"
+        return (True, {"context_size": size, "processor": processor, "success": True})
+
+
+class LinearController(FakeController):
+    """Model size grows linearly with num_ctx; past the VRAM limit whole
+    layers are offloaded, as the daemon does."""
+
+    WEIGHTS = 5_000_000_000
+    PER_TOKEN = 131072
+    LAYERS = 32
+
+    def __init__(self, vram: int) -> None:
+        super().__init__(boundary=(vram - self.WEIGHTS) // self.PER_TOKEN)
+        self.vram = vram
+
+    def set_context(self, size: int) -> tuple[bool, dict]:
+        self.probes.append(size)
+        total = self.WEIGHTS + self.PER_TOKEN * size
+        layer = total / self.LAYERS
+        on_gpu = min(total, int(self.vram // layer) * layer)
+        return (
+            True,
+            {
+                "context_size": size,
+                "processor": "100% GPU" if on_gpu >= total else "MIXED",
+                "success": True,
+                "size": total,
+                "gpu_fraction": on_gpu / total,
+            },
+        )
+
+
+class TestContextSearcher(unittest.TestCase):
+    def test_max_size_fits(self):
+        controller = FakeController(boundary=50000)
+        searcher = ContextSearcher(controller)
+        self.assertEqual(searcher.find_optimal_size(4096, 32768), 32768)
+        self.assertEqual(controller.probes, [32768])
+
+    def test_binary_search_converges(self):
+        controller = FakeController(boundary=70000)
+        searcher = ContextSearcher(controller)
+        result = searcher.find_optimal_size(4096, 131072)
+        self.assertLessEqual(result, 70000)
+        self.assertGreater(result, 70000 - 1000)
+
+    def test_deadline_stops_probing(self):
+        controller = FakeController(boundary=70000)
+        searcher = ContextSearcher(controller, deadline=0.0)
+        with self.assertRaises(TimeoutError):
+            searcher.find_optimal_size(4096, 131072)
+        self.assertEqual(controller.probes, [])
+
+    def test_nothing_fits_returns_min(self):
+        controller = FakeController(boundary=1000)
+        searcher = ContextSearcher(controller)
+        self.assertEqual(searcher.find_optimal_size(4096, 32768), 4096)
+
+
+class TestInterpolationSearch(unittest.TestCase):
+    def test_matches_bisection_with_fewer_probes(self):
+        for max_size in (131072, 1000000):
+            blind = LinearController(vram=16 * 1024**3)
+            expected = ContextSearcher(blind).find_optimal_size(4096, max_size)
+
+            controller = LinearController(vram=16 * 1024**3)
+            searcher = ContextSearcher(controller, strategy="interpolate")
+            result = searcher.find_optimal_size(4096, max_size)
+
+            self.assertLessEqual(result, controller.boundary)
+            self.assertGreater(result, controller.boundary - 1000)
+            self.assertLessEqual(abs(result - expected), 1000)
+            self.assertLessEqual(len(controller.probes), len(blind.probes))
+            if max_size == 1000000:
+                self.assertLess(len(controller.probes), len(blind.probes))
+
+    def test_records_every_probe(self):
+        controller = LinearController(vram=16 * 1024**3)
+        searcher = ContextSearcher(controller, strategy="interpolate")
+        searcher.find_optimal_size(4096, 131072)
+        self.assertEqual([s.num_ctx for s in searcher.samples], controller.probes)
+        self.assertTrue(all(s.size for s in searcher.samples))
+
+    def test_tolerance_controls_precision(self):
+        controller = LinearController(vram=16 * 1024**3)
+        searcher = ContextSearcher(controller, strategy="interpolate", tolerance=64)
+        result = searcher.find_optimal_size(4096, 131072)
+        self.assertGreater(result, controller.boundary - 64)
+
+    def test_falls_back_without_size_information(self):
+        controller = FakeController(boundary=70000)
+        searcher = ContextSearcher(controller, strategy="interpolate")
+        result = searcher.find_optimal_size(4096, 131072)
+        self.assertLessEqual(result, 70000)
+        self.assertGreater(result, 70000 - 1000)
+
+
+class ThroughputController(FakeController):
+    """Decodes at 50 tokens/s, slowing down over the last 20k tokens before
+    the VRAM boundary."""
+
+    def set_context(self, size: int) -> tuple[bool, dict]:
+        success, results = super().set_context(size)
+        slowdown = max(0, size - (self.boundary - 20000)) / 20000
+        results["eval_tps"] = 50.0 * (1 - 0.3 * slowdown)
+        return (success, results)
+
+
+class TestThroughputObjective(unittest.TestCase):
+    def test_picks_largest_size_near_peak(self):
+        controller = ThroughputController(boundary=100000)
+        searcher = ContextSearcher(controller)
+        boundary = searcher.find_optimal_size(4096, 131072)
+        chosen = searcher.select_by_throughput(4096, boundary, points=9, tolerance_pct=5)
+        self.assertLess(chosen, boundary)
+        self.assertGreaterEqual(chosen, 70000)
+        self.assertLessEqual(chosen, 83334)
+
+    def test_curve_is_sorted_and_gpu_only(self):
+        controller = ThroughputController(boundary=100000)
+        searcher = ContextSearcher(controller)
+        searcher.find_optimal_size(4096, 131072)
+        curve = searcher.throughput_curve()
+        sizes = [s.num_ctx for s in curve]
+        self.assertEqual(sizes, sorted(sizes))
+        self.assertTrue(all(size <= 100000 for size in sizes))
+
+    def test_large_tolerance_keeps_boundary(self):
+        controller = ThroughputController(boundary=100000)
+        searcher = ContextSearcher(controller)
+        boundary = searcher.find_optimal_size(4096, 131072)
+        self.assertEqual(
+            searcher.select_by_throughput(4096, boundary, tolerance_pct=50), boundary
+        )
+
+
+class TestSeededSearch(unittest.TestCase):
+    def test_accurate_prediction_needs_fewer_probes(self):
+        blind = FakeController(boundary=70000)
+        ContextSearcher(blind).find_optimal_size(4096, 1000000)
+
+        seeded = FakeController(boundary=70000)
+        result = ContextSearcher(seeded).find_optimal_size(
+            4096, 1000000, predicted=69000
+        )
+        self.assertLessEqual(result, 70000)
+        self.assertGreater(result, 70000 - 1000)
+        self.assertLess(len(seeded.probes), len(blind.probes))
+        self.assertEqual(seeded.probes[:2], [62100, 75900])
+
+    def test_underestimate_searches_above_bracket(self):
+        controller = FakeController(boundary=90000)
+        result = ContextSearcher(controller).find_optimal_size(
+            4096, 131072, predicted=50000
+        )
+        self.assertLessEqual(result, 90000)
+        self.assertGreater(result, 90000 - 1000)
+
+    def test_overestimate_searches_below_bracket(self):
+        controller = FakeController(boundary=20000)
+        result = ContextSearcher(controller).find_optimal_size(
+            4096, 131072, predicted=60000
+        )
+        self.assertLessEqual(result, 20000)
+        self.assertGreater(result, 20000 - 1000)
+
+
+class TestWarmStart(unittest.TestCase):
+    def assertNearBoundary(self, result: int, boundary: int) -> None:
+        self.assertLessEqual(result, boundary)
+        self.assertGreater(result, boundary - 1000)
+
+    def test_small_shift_takes_few_probes(self):
+        for strategy in ("bisect", "interpolate"):
+            for boundary in (68000, 69500, 71500, 72500, 73500):
+                with self.subTest(strategy=strategy, boundary=boundary):
+                    cold = FakeController(boundary)
+                    ContextSearcher(cold, strategy=strategy).find_optimal_size(4096, 131072)
+                    warm = FakeController(boundary)
+                    result = ContextSearcher(warm, strategy=strategy).find_optimal_size(
+                        4096, 131072, hint=70000
+                    )
+                    self.assertNearBoundary(result, boundary)
+                    self.assertEqual(warm.probes[0], 70000)
+                    self.assertLessEqual(len(warm.probes), 5)
+                    self.assertLess(len(warm.probes), len(cold.probes) / 1.5)
+
+    def test_far_hint_still_converges(self):
+        for boundary in (5000, 20000, 120000):
+            with self.subTest(boundary=boundary):
+                controller = FakeController(boundary=boundary)
+                result = ContextSearcher(controller).find_optimal_size(
+                    4096, 131072, hint=60000
+                )
+                self.assertNearBoundary(result, boundary)
+
+    def test_hint_at_limits(self):
+        controller = FakeController(boundary=200000)
+        self.assertEqual(
+            ContextSearcher(controller).find_optimal_size(4096, 131072, hint=131072),
+            131072,
+        )
+        self.assertEqual(controller.probes, [131072])
+
+        controller = FakeController(boundary=1000)
+        self.assertEqual(
+            ContextSearcher(controller).find_optimal_size(4096, 131072, hint=8192),
+            4096,
+        )
+
+
+class TestHeadroom(unittest.TestCase):
+    VRAM = 16 * 1024**3
+    HEADROOM = 2 * 1024**3
+
+    def expected(self) -> int:
+        limit = self.VRAM - self.HEADROOM
+        return (limit - LinearController.WEIGHTS) // LinearController.PER_TOKEN
+
+    def test_sizes_eating_into_headroom_do_not_fit(self):
+        for strategy in ("bisect", "interpolate"):
+            with self.subTest(strategy=strategy):
+                controller = LinearController(vram=self.VRAM)
+                searcher = ContextSearcher(
+                    controller, strategy=strategy, max_bytes=self.VRAM - self.HEADROOM
+                )
+                result = searcher.find_optimal_size(4096, 131072)
+                self.assertLessEqual(result, self.expected())
+                self.assertGreater(result, self.expected() - 1000)
+                self.assertIn(OVER_HEADROOM, {s.processor for s in searcher.samples})
+
+    def test_over_headroom_is_logged_as_such(self):
+        searcher = ContextSearcher(
+            LinearController(vram=self.VRAM), max_bytes=self.VRAM - self.HEADROOM
+        )
+        with self.assertLogs("context_searcher", "INFO") as logs:
+            searcher.find_optimal_size(4096, 131072)
+        output = "\n".join(logs.output)
+        self.assertIn("over the headroom", output)
+        self.assertNotIn("not found", output)
+
+    def test_cache_keeps_raw_placement(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ProbeCache(os.path.join(directory, "probes.json"))
+            controller = LinearController(vram=self.VRAM)
+            ContextSearcher(
+                controller, cache=cache, fingerprint="fp", max_bytes=self.VRAM - self.HEADROOM
+            ).find_optimal_size(4096, 131072)
+            self.assertNotIn(
+                OVER_HEADROOM, {e["processor"] for e in cache.entries_for("fp").values()}
+            )
+
+            # Without headroom the same probes bound the full-VRAM search
+            rerun = LinearController(vram=self.VRAM)
+            result = ContextSearcher(rerun, cache=cache, fingerprint="fp").find_optimal_size(
+                4096, 131072
+            )
+            self.assertGreater(result, rerun.boundary - 1000)
+            self.assertLess(len(rerun.probes), len(controller.probes))
+
+
+if __name__ == "__main__":
+    unittest.main()
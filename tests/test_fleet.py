@@ -0,0 +1,130 @@
+import unittest
+
+from context_searcher import ContextSearcher
+from fleet import Fleet, FleetHost, format_fleet_report, parse_fleet_host
+from ollama_api import OllamaApiController
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+
+SMALL = SimulatedGPU("12GB", 12 * GiB)
+LARGE = SimulatedGPU("24GB", 24 * GiB)
+
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.model = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        self.servers = []
+        self.searched = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def start(self, gpu: SimulatedGPU, label: str, version: str = "0.12.0") -> tuple[str, str]:
+        model = SimulatedModel(self.model.name, self.model.weights_bytes)
+        server = SimulatedOllamaServer(SimulatedOllama(gpu, [model], version=version)).start()
+        self.servers.append(server)
+        return (server.host, label)
+
+    def optimise(self, member: FleetHost) -> tuple[int, bool, str | None]:
+        self.searched.append(member.host)
+        controller = OllamaApiController(self.model.name, host=member.host)
+        try:
+            searcher = ContextSearcher(controller)
+            num_ctx = searcher.find_optimal_size(4096, 131072)
+            processor = next(s.processor for s in searcher.samples if s.num_ctx == num_ctx)
+            return (num_ctx, controller.save_model(num_ctx), processor)
+        finally:
+            controller.close()
+
+    def saved_num_ctx(self, host: str) -> int | None:
+        server = next(s for s in self.servers if s.host == host)
+        return server.sim.models[self.model.name].parameters.get("num_ctx")
+
+    def test_one_search_per_group_applied_to_the_rest(self):
+        small = [self.start(SMALL, "RTX4070") for _ in range(3)]
+        large = [self.start(LARGE, "RTX4090") for _ in range(2)]
+        hosts = Fleet(self.model.name, small + large, self.optimise).run()
+
+        self.assertEqual(sorted(self.searched), sorted([small[0][0], large[0][0]]))
+        self.assertTrue(all(m.ok for m in hosts), format_fleet_report(self.model.name, hosts))
+        for group, expected in ((small, SMALL), (large, LARGE)):
+            optimum = SimulatedOllama(expected, [self.model]).optimum(self.model.name, 131072)
+            results = {self.saved_num_ctx(host) for host, _ in group}
+            self.assertEqual(len(results), 1)
+            self.assertGreater(results.pop(), optimum - 1000)
+
+        # Hosts the result was applied to were probed once, then saved
+        for server in self.servers[1:3]:
+            generates = [r for r in server.requests if r[1] == "/api/generate"]
+            self.assertEqual(len(generates), 1)
+
+    def test_version_splits_a_group(self):
+        hosts = [self.start(SMALL, "RTX4070"), self.start(SMALL, "RTX4070", version="0.13.0")]
+        Fleet(self.model.name, hosts, self.optimise).run()
+        self.assertEqual(len(self.searched), 2)
+
+    def test_unlabelled_hosts_are_searched_alone(self):
+        hosts = [self.start(SMALL, "unknown"), self.start(LARGE, "unknown")]
+        result = Fleet(self.model.name, hosts, self.optimise).run()
+        self.assertEqual(len(self.searched), 2)
+        self.assertTrue(all(m.role == "searched" and m.ok for m in result))
+        self.assertNotEqual(self.saved_num_ctx(hosts[0][0]), self.saved_num_ctx(hosts[1][0]))
+
+    def test_searched_placement_is_reported(self):
+        hosts = [self.start(SMALL, "RTX4070")]
+        result = Fleet(
+            self.model.name, hosts, lambda member: (4096, True, "MIXED")
+        ).run()
+        self.assertEqual(result[0].processor, "MIXED")
+        self.assertFalse(result[0].ok)
+        self.assertIn("FAILED: search result: MIXED", format_fleet_report(self.model.name, result))
+
+    def test_check_probe_catches_a_mislabelled_host(self):
+        hosts = [self.start(LARGE, "RTX4090"), self.start(SMALL, "RTX4090")]
+        result = Fleet(self.model.name, hosts, self.optimise).run()
+        self.assertTrue(result[0].ok)
+        self.assertEqual(result[1].processor, "MIXED")
+        self.assertFalse(result[1].saved)
+        self.assertIsNone(self.saved_num_ctx(hosts[1][0]))
+        report = format_fleet_report(self.model.name, result)
+        self.assertIn("FAILED: check probe: MIXED", report)
+        self.assertIn("1 of 2 host(s) saved", report)
+
+    def test_isolate_frees_applied_hosts_around_the_check_probe(self):
+        hosts = [self.start(SMALL, "RTX4070"), self.start(SMALL, "RTX4070")]
+        other = SimulatedModel("qwen2.5:7b", int(4.7 * GiB))
+        applied = self.servers[1]
+        applied.sim.models[other.name] = other
+        applied.sim.generate(other.name, "", {"num_ctx": 16384}, keep_alive="10m")
+        result = Fleet(self.model.name, hosts, self.optimise, isolate=True).run()
+        self.assertTrue(all(m.ok for m in result), format_fleet_report(self.model.name, result))
+        unloads = [
+            payload["model"]
+            for _, path, payload in applied.requests
+            if path == "/api/generate" and payload.get("keep_alive") == 0
+        ]
+        self.assertEqual(unloads, [other.name])
+        loaded = {entry["name"]: entry["context_length"] for entry in applied.sim.ps()}
+        self.assertEqual(loaded[other.name], 16384)
+
+    def test_unreachable_host_is_reported(self):
+        hosts = [self.start(SMALL, "RTX4070"), ("127.0.0.1:1", "RTX4070")]
+        result = Fleet(self.model.name, hosts, self.optimise, fingerprint_timeout=1).run()
+        self.assertTrue(result[0].ok)
+        self.assertIn("unreachable", result[1].error)
+
+    def test_parse_fleet_host(self):
+        self.assertEqual(parse_fleet_host("gpu-1:11434=RTX4090"), ("gpu-1:11434", "RTX4090"))
+        self.assertEqual(parse_fleet_host("gpu-2:11434"), ("gpu-2:11434", "unknown"))
+        with self.assertRaises(ValueError):
+            parse_fleet_host("=RTX4090")
+
+
+if __name__ == "__main__":
+    unittest.main()
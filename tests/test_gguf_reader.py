@@ -0,0 +1,196 @@
+import json
+import os
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import gguf_reader
+import main
+from gguf_reader import (
+    MetadataCache,
+    manifest_path,
+    metadata_from_gguf,
+    read_gguf,
+    read_model_metadata,
+    resolve_blob,
+)
+
+DIGEST = "sha256:" + "ab" * 32
+
+
+def gguf_string(text: str) -> bytes:
+    data = text.encode()
+    return struct.pack("<Q", len(data)) + data
+
+
+def gguf_value(value) -> bytes:
+    """Type tag and payload of a metadata value."""
+    if isinstance(value, bool):
+        return struct.pack("<I?", 7, value)
+    if isinstance(value, int):
+        return struct.pack("<II", 4, value)
+    if isinstance(value, float):
+        return struct.pack("<If", 6, value)
+    if isinstance(value, str):
+        return struct.pack("<I", 8) + gguf_string(value)
+    if all(isinstance(v, str) for v in value):
+        items = b"".join(gguf_string(v) for v in value)
+        return struct.pack("<IIQ", 9, 8, len(value)) + items
+    return struct.pack("<IIQ", 9, 4, len(value)) + struct.pack(f"<{len(value)}I", *value)
+
+
+def make_gguf(metadata: dict, tensors: list, version: int = 3) -> bytes:
+    """A GGUF header followed by zeroed tensor data."""
+    data = b"GGUF" + struct.pack("<IQQ", version, len(tensors), len(metadata))
+    for key, value in metadata.items():
+        data += gguf_string(key) + gguf_value(value)
+    for name, shape, ggml_type in tensors:
+        data += gguf_string(name) + struct.pack("<I", len(shape))
+        data += struct.pack(f"<{len(shape)}Q", *shape) + struct.pack("<IQ", ggml_type, 0)
+    return data + b"\0" * 4096
+
+
+LLAMA = {
+    "general.architecture": "llama",
+    "general.name": "Synthetic",
+    "llama.block_count": 32,
+    "llama.context_length": 131072,
+    "llama.embedding_length": 4096,
+    "llama.attention.head_count": 32,
+    "llama.attention.head_count_kv": 8,
+    "tokenizer.ggml.tokens": [f"tok{i}" for i in range(5000)],
+}
+TENSORS = [
+    ("token_embd.weight", [4096, 1000], 12),  # Q4_K
+    ("blk.0.attn_q.weight", [4096, 4096], 8),  # Q8_0
+    ("output_norm.weight", [4096], 0),  # F32
+]
+
+
+class TestReadGGUF(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, data: bytes) -> str:
+        path = os.path.join(self.dir.name, "model.gguf")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_metadata_and_tensor_infos(self):
+        for version in (2, 3):
+            with self.subTest(version=version):
+                gguf = read_gguf(self.write(make_gguf(LLAMA, TENSORS, version)))
+                self.assertEqual(gguf.version, version)
+                self.assertEqual(gguf.architecture, "llama")
+                self.assertEqual(gguf.metadata["llama.context_length"], 131072)
+                # Long token lists are skipped, not decoded
+                self.assertNotIn("tokenizer.ggml.tokens", gguf.metadata)
+                self.assertEqual([t.name for t in gguf.tensors], [t[0] for t in TENSORS])
+                expected = 4096 * 1000 // 256 * 144 + 4096 * 4096 // 32 * 34 + 4096 * 4
+                self.assertEqual(gguf.weights_bytes, expected)
+
+    def test_per_layer_head_counts(self):
+        metadata = dict(LLAMA)
+        metadata["llama.block_count"] = 4
+        metadata["llama.attention.head_count_kv"] = [8, 0, 8, 0]
+        gguf = read_gguf(self.write(make_gguf(metadata, TENSORS)))
+        self.assertEqual(metadata_from_gguf(gguf, "f16").head_count_kv, [8, 0, 8, 0])
+
+    def test_header_larger_than_first_mapping(self):
+        path = self.write(make_gguf(LLAMA, TENSORS))
+        with patch.object(gguf_reader, "HEADER_MAP_BYTES", 64):
+            gguf = read_gguf(path)
+        self.assertEqual(len(gguf.tensors), len(TENSORS))
+
+    def test_rejects_other_files(self):
+        truncated = make_gguf(LLAMA, TENSORS)[:100]
+        for data in (b"GGML" + b"\0" * 64, make_gguf(LLAMA, TENSORS, version=1), truncated):
+            with self.subTest(data=data[:8]), self.assertRaises(ValueError):
+                read_gguf(self.write(data))
+
+    def test_estimator_metadata(self):
+        metadata = metadata_from_gguf(read_gguf(self.write(make_gguf(LLAMA, TENSORS))), "q8_0")
+        self.assertEqual(metadata.block_count, 32)
+        self.assertEqual(metadata.head_count_kv, 8)
+        self.assertEqual(metadata.key_length, 128)
+        self.assertEqual(metadata.context_length, 131072)
+        self.assertEqual(metadata.kv_cache_type, "q8_0")
+
+
+class TestModelStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.models = self.dir.name
+        self.cache_path = os.path.join(self.dir.name, "cache", "metadata.json")
+        self.install("llama3.1:8b", make_gguf(LLAMA, TENSORS))
+
+    def install(self, name: str, data: bytes) -> None:
+        manifest = manifest_path(name, self.models)
+        os.makedirs(os.path.dirname(manifest), exist_ok=True)
+        with open(manifest, "w") as f:
+            json.dump(
+                {
+                    "layers": [
+                        {"mediaType": "application/vnd.ollama.image.license", "digest": "sha256:0"},
+                        {"mediaType": gguf_reader.MODEL_MEDIA_TYPE, "digest": DIGEST},
+                    ]
+                },
+                f,
+            )
+        os.makedirs(os.path.join(self.models, "blobs"), exist_ok=True)
+        with open(os.path.join(self.models, "blobs", DIGEST.replace(":", "-")), "wb") as f:
+            f.write(data)
+
+    def test_manifest_paths(self):
+        cases = {
+            "llama3.1": "registry.ollama.ai/library/llama3.1/latest",
+            "llama3.1:8b": "registry.ollama.ai/library/llama3.1/8b",
+            "user/model:q4": "registry.ollama.ai/user/model/q4",
+            "hf.co/org/repo:Q4_K_M": "hf.co/org/repo/Q4_K_M",
+        }
+        for name, expected in cases.items():
+            with self.subTest(name=name):
+                expected_path = os.path.join("/m", "manifests", *expected.split("/"))
+                self.assertEqual(manifest_path(name, "/m"), expected_path)
+
+    def test_resolves_model_blob(self):
+        digest, path = resolve_blob("llama3.1:8b", self.models)
+        self.assertEqual(digest, DIGEST)
+        self.assertTrue(path.endswith("sha256-" + "ab" * 32))
+        self.assertIsNone(resolve_blob("missing:latest", self.models))
+
+    def test_metadata_is_cached_by_digest(self):
+        cache = MetadataCache(self.cache_path)
+        metadata = read_model_metadata("llama3.1:8b", self.models, cache, "f16")
+        self.assertEqual(metadata.context_length, 131072)
+        self.assertEqual(cache.get(DIGEST)["block_count"], 32)
+
+        # A later run answers from the cache without reading the blob
+        reloaded = MetadataCache(self.cache_path)
+        with patch("gguf_reader.read_gguf", side_effect=AssertionError("blob read")):
+            again = read_model_metadata("llama3.1:8b", self.models, reloaded, "f16")
+        self.assertEqual(again, metadata)
+
+    def test_context_length_without_the_daemon(self):
+        environ = {"OLLAMA_MODELS": self.models, "XDG_CACHE_HOME": self.dir.name}
+        with patch.dict(os.environ, environ), patch(
+            "subprocess.run", side_effect=AssertionError("ollama show")
+        ):
+            self.assertEqual(main.get_model_context_length("llama3.1:8b"), 131072)
+
+    def test_remote_host_is_asked_instead(self):
+        environ = {"OLLAMA_MODELS": self.models, "XDG_CACHE_HOME": self.dir.name}
+        with patch.dict(os.environ, environ), patch(
+            "gguf_reader.read_gguf", side_effect=AssertionError("local blob read")
+        ), patch("main.remote_context_length", return_value=32768) as remote:
+            length = main.get_model_context_length("llama3.1:8b", host="gpu-9:11434")
+        self.assertEqual(length, 32768)
+        remote.assert_called_once_with("llama3.1:8b", "gpu-9:11434")
+
+
+if __name__ == "__main__":
+    unittest.main()
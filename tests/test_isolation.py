@@ -0,0 +1,81 @@
+import unittest
+from datetime import datetime, timezone
+
+from isolation import Isolation, keep_alive_from
+from ollama_api import OllamaClient
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+
+GPU = SimulatedGPU("24GB", 24 * GiB)
+
+
+class TestKeepAlive(unittest.TestCase):
+    NOW = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+    def test_remaining_seconds(self):
+        self.assertEqual(keep_alive_from("2025-01-01T12:04:00Z", self.NOW), 240)
+        # Nanosecond precision and a local offset, as Ollama reports them
+        self.assertEqual(keep_alive_from("2025-01-01T04:10:00.123456789-08:00", self.NOW), 600)
+
+    def test_forever_expired_and_missing(self):
+        self.assertEqual(keep_alive_from("2318-01-01T00:00:00Z", self.NOW), -1)
+        self.assertEqual(keep_alive_from("2025-01-01T11:00:00Z", self.NOW), 1)
+        self.assertIsNone(keep_alive_from(None, self.NOW))
+        self.assertIsNone(keep_alive_from("soon", self.NOW))
+
+
+class TestIsolation(unittest.TestCase):
+    def setUp(self):
+        self.target = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        self.chat = SimulatedModel("qwen2.5:7b", int(4.7 * GiB))
+        self.embed = SimulatedModel("nomic-embed-text", int(0.3 * GiB), layers=12)
+        self.sim = SimulatedOllama(GPU, [self.target, self.chat, self.embed])
+        self.sim.generate(self.chat.name, "", {"num_ctx": 16384}, keep_alive="10m")
+        self.sim.generate(self.embed.name, "", {"num_ctx": 2048}, keep_alive=-1)
+        self.sim.generate(self.target.name, "", {"num_ctx": 4096})
+        self.server = SimulatedOllamaServer(self.sim).start()
+        self.client = OllamaClient(self.server.host)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def loaded(self) -> dict[str, int]:
+        return {entry["name"]: entry["context_length"] for entry in self.sim.ps()}
+
+    def assertRestored(self):
+        self.assertEqual(self.loaded()[self.chat.name], 16384)
+        self.assertEqual(self.loaded()[self.embed.name], 2048)
+        restores = {
+            payload["model"]: payload.get("keep_alive")
+            for _, path, payload in self.server.requests
+            if path == "/api/generate" and payload.get("keep_alive") != 0
+        }
+        self.assertEqual(restores[self.embed.name], -1)
+        self.assertAlmostEqual(restores[self.chat.name], 600, delta=5)
+
+    def test_others_are_unloaded_and_restored(self):
+        with Isolation(self.client, exclude=[self.target.name]) as isolation:
+            self.assertEqual(list(self.loaded()), [self.target.name])
+            self.assertEqual(len(isolation.resident), 2)
+            self.sim.generate(self.target.name, "", {"num_ctx": 65536})
+        self.assertRestored()
+        self.assertEqual(self.loaded()[self.target.name], 65536)
+
+    def test_restored_after_error_and_cancel(self):
+        for error in (RuntimeError("probe failed"), KeyboardInterrupt()):
+            with self.subTest(error=type(error).__name__):
+                with self.assertRaises(type(error)):
+                    with Isolation(self.client, exclude=[self.target.name]):
+                        self.assertEqual(list(self.loaded()), [self.target.name])
+                        raise error
+                self.assertRestored()
+
+
+if __name__ == "__main__":
+    unittest.main()
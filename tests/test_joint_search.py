@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import main
+from context_searcher import OVER_HEADROOM
+
+from joint_search import JointSearcher, Trial, format_trials, pareto_front, select_trial
+from ollama_api import OllamaApiController
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+
+GPU = SimulatedGPU("12GB", 12 * GiB)
+
+
+class TestParetoFront(unittest.TestCase):
+    def test_dominated_and_offloaded_trials_are_dropped(self):
+        big = Trial("a", {"num_batch": 256}, 60000, "100% GPU", 900.0, 50.0)
+        fast = Trial("a", {"num_batch": 1024}, 50000, "100% GPU", 1800.0, 50.0)
+        worse = Trial("a", {"num_batch": 512}, 49000, "100% GPU", 1200.0, 50.0)
+        spilled = Trial("b", {}, 90000, "MIXED", 2000.0, 60.0)
+        front = pareto_front([big, fast, worse, spilled])
+        self.assertEqual(front, [big, fast])
+
+    def test_select_prefers_context_within_tolerance(self):
+        big = Trial("a", {}, 60000, "100% GPU", 900.0, 48.0)
+        fast = Trial("a", {}, 50000, "100% GPU", 900.0, 60.0)
+        self.assertIs(select_trial([big, fast], tolerance_pct=5), fast)
+        self.assertIs(select_trial([big, fast], tolerance_pct=25), big)
+
+
+class TestJointSearcher(unittest.TestCase):
+    def setUp(self):
+        self.model = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        self.sims = {
+            "f16": SimulatedOllama(GPU, [self.model]),
+            "q8_0+fa": SimulatedOllama(
+                GPU, [self.model], kv_cache_type="q8_0", flash_attention=True
+            ),
+        }
+        self.servers = {name: SimulatedOllamaServer(sim).start() for name, sim in self.sims.items()}
+        self.controllers = {
+            name: OllamaApiController(self.model.name, host=server.host)
+            for name, server in self.servers.items()
+        }
+
+    def tearDown(self):
+        for controller in self.controllers.values():
+            controller.close()
+        for server in self.servers.values():
+            server.stop()
+
+    def test_finds_boundary_for_every_combination(self):
+        searcher = JointSearcher(self.controllers, {"num_batch": [256, 512, 1024]})
+        trials = searcher.run(4096, self.model.context_length)
+        self.assertEqual(len(trials), 6)
+        for trial in trials:
+            with self.subTest(server=trial.server, options=trial.options):
+                optimum = self.sims[trial.server].optimum(
+                    self.model.name, num_batch=trial.options["num_batch"]
+                )
+                self.assertLessEqual(trial.num_ctx, optimum)
+                self.assertGreater(trial.num_ctx, optimum - 1000)
+                self.assertEqual(trial.processor, "100% GPU")
+                self.assertIsNotNone(trial.eval_tps)
+
+        # Later combinations warm-start from the previous boundary
+        f16 = [t for t in trials if t.server == "f16"]
+        self.assertLess(max(t.probes for t in f16[1:]), f16[0].probes)
+
+    def test_front_trades_context_for_prefill_speed(self):
+        searcher = JointSearcher(self.controllers, {"num_batch": [256, 512, 1024]})
+        trials = searcher.run(4096, self.model.context_length)
+        front = pareto_front(trials)
+        self.assertGreater(len(front), 1)
+        self.assertTrue(all(t.server == "q8_0+fa" for t in front))
+        self.assertEqual(front[0].options["num_batch"], 256)
+        self.assertIn("Joint search for", format_trials(self.model.name, trials, front, front[0]))
+
+    def test_trials_over_the_headroom_are_not_chosen(self):
+        searcher = JointSearcher(self.controllers, {}, max_bytes=GiB)
+        trials = searcher.run(4096, self.model.context_length)
+        self.assertTrue(all(t.processor == OVER_HEADROOM for t in trials))
+        self.assertEqual(pareto_front(trials), [])
+
+    def test_save_writes_chosen_parameter_set(self):
+        controller = self.controllers["f16"]
+        self.assertTrue(controller.save_model(32768, {"num_batch": 1024}))
+        self.assertEqual(self.model.parameters, {"num_batch": 1024, "num_ctx": 32768})
+
+    def test_server_configs_do_not_share_cached_probes(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        servers = [(name, server.host) for name, server in self.servers.items()]
+        with patch("main.detect_gpu_fingerprint", return_value="12GB/12288/570.86"):
+            report = main.optimise(
+                self.model.name,
+                server_config=servers,
+                cache_path=os.path.join(tmpdir.name, "probes.json"),
+                no_estimate=True,
+                max=self.model.context_length,
+            )
+        self.assertTrue(report.ok, report.error)
+        for name, sim in self.sims.items():
+            with self.subTest(server=name):
+                probes = [p for p in report.probes if p.options["server"] == name]
+                self.assertTrue(any(not p.cached for p in probes))
+                fits = max(p.num_ctx for p in probes if p.placement == "100% GPU")
+                optimum = sim.optimum(self.model.name, self.model.context_length)
+                self.assertLessEqual(optimum - fits, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from kv_estimator import (
+    KVCacheEstimator,
+    ModelMetadata,
+    detect_vram_budget,
+    metadata_from_show,
+)
+
+# model_info recorded from `/api/show` for llama3.1:8b
+LLAMA31_8B_SHOW = {
+    "model_info": {
+        "general.architecture": "llama",
+        "general.parameter_count": 8030261248,
+        "llama.attention.head_count": 32,
+        "llama.attention.head_count_kv": 8,
+        "llama.attention.layer_norm_rms_epsilon": 1e-05,
+        "llama.block_count": 32,
+        "llama.context_length": 131072,
+        "llama.embedding_length": 4096,
+        "llama.feed_forward_length": 14336,
+        "llama.rope.freq_base": 500000,
+        "llama.vocab_size": 128256,
+    }
+}
+LLAMA31_8B_WEIGHTS = 4920753328
+
+# gemma3 reports explicit key/value lengths that differ from embedding/heads
+GEMMA3_12B_SHOW = {
+    "model_info": {
+        "general.architecture": "gemma3",
+        "gemma3.attention.head_count": 16,
+        "gemma3.attention.head_count_kv": 8,
+        "gemma3.attention.key_length": 256,
+        "gemma3.attention.value_length": 256,
+        "gemma3.block_count": 48,
+        "gemma3.context_length": 131072,
+        "gemma3.embedding_length": 3840,
+    }
+}
+
+
+class TestMetadata(unittest.TestCase):
+    def test_llama_kv_bytes_per_token(self):
+        metadata = metadata_from_show(LLAMA31_8B_SHOW, LLAMA31_8B_WEIGHTS, "f16")
+        self.assertEqual(metadata.key_length, 128)
+        self.assertEqual(metadata.context_length, 131072)
+        # 32 layers * 8 KV heads * (128 + 128) * 2 bytes
+        self.assertEqual(metadata.kv_bytes_per_token(), 131072)
+
+    def test_quantised_cache_is_smaller(self):
+        f16 = metadata_from_show(LLAMA31_8B_SHOW, LLAMA31_8B_WEIGHTS, "f16")
+        q8 = metadata_from_show(LLAMA31_8B_SHOW, LLAMA31_8B_WEIGHTS, "q8_0")
+        q4 = metadata_from_show(LLAMA31_8B_SHOW, LLAMA31_8B_WEIGHTS, "q4_0")
+        self.assertAlmostEqual(q8.kv_bytes_per_token(), 69632)
+        self.assertLess(q4.kv_bytes_per_token(), q8.kv_bytes_per_token())
+        self.assertLess(q8.kv_bytes_per_token(), f16.kv_bytes_per_token())
+
+    def test_explicit_key_length(self):
+        metadata = metadata_from_show(GEMMA3_12B_SHOW, 8_000_000_000, "f16")
+        self.assertEqual(metadata.key_length, 256)
+        self.assertEqual(metadata.kv_bytes_per_token(), 48 * 8 * 512 * 2)
+
+    def test_per_layer_head_counts(self):
+        metadata = ModelMetadata(
+            block_count=3,
+            head_count_kv=[8, 0, 8],
+            key_length=64,
+            value_length=64,
+            weights_bytes=0,
+        )
+        self.assertEqual(metadata.kv_bytes_per_token(), 16 * 128 * 2)
+
+    def test_missing_architecture(self):
+        with self.assertRaises(ValueError):
+            metadata_from_show({"model_info": {}}, 0)
+
+
+class TestEstimator(unittest.TestCase):
+    def setUp(self):
+        self.metadata = metadata_from_show(
+            LLAMA31_8B_SHOW, LLAMA31_8B_WEIGHTS, "f16"
+        )
+
+    def test_estimate_grows_linearly(self):
+        estimator = KVCacheEstimator(self.metadata, 24 * 1024**3)
+        delta = estimator.estimate_bytes(16384) - estimator.estimate_bytes(8192)
+        self.assertEqual(delta, 8192 * 131072)
+
+    def test_max_context_fits_budget(self):
+        estimator = KVCacheEstimator(self.metadata, 12 * 1024**3)
+        predicted = estimator.max_context()
+        self.assertLessEqual(estimator.estimate_bytes(predicted), 12 * 1024**3)
+        self.assertGreater(estimator.estimate_bytes(predicted + 1), 12 * 1024**3)
+
+    def test_max_context_capped_by_model(self):
+        estimator = KVCacheEstimator(self.metadata, 80 * 1024**3)
+        self.assertEqual(estimator.max_context(), 131072)
+
+    def test_budget_smaller_than_weights(self):
+        estimator = KVCacheEstimator(self.metadata, 2 * 1024**3)
+        self.assertEqual(estimator.max_context(), 0)
+
+    def test_detect_vram_budget_sums_gpus(self):
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(returncode=0, stdout="24576\n24576\n")
+            self.assertEqual(detect_vram_budget(), 2 * 24576 * 1024**2)
+
+    def test_detect_vram_budget_without_nvidia_smi(self):
+        with patch("subprocess.run", side_effect=FileNotFoundError):
+            self.assertIsNone(detect_vram_budget())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,314 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_api import (
+    OllamaApiController,
+    OllamaClient,
+    generation_rates,
+    parse_parameters,
+    processor_from_sizes,
+)
+from context_searcher import ContextSearcher
+from ollama_sim import GiB, SimulatedGPU, SimulatedModel, SimulatedOllama, SimulatedOllamaServer
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this every keep-alive
+    # response waits on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _record(self, payload: dict | None) -> None:
+        self.server.requests.append((self.command, self.path, payload))
+        self.server.connections.add(self.client_address)
+
+    def do_GET(self):
+        self._record(None)
+        if self.path == "/api/ps":
+            self._reply(200, {"models": self.server.loaded})
+        elif self.path == "/api/tags":
+            self._reply(200, {"models": [{"name": "granite4:latest", "digest": "abc123"}]})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    @staticmethod
+    def _entry(model: str, num_ctx: int, size: int, vram: int) -> list[dict]:
+        return [
+            {
+                "name": model,
+                "model": model,
+                "size": size,
+                "size_vram": min(size, vram),
+                "context_length": num_ctx,
+            }
+        ]
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self._record(payload)
+        if self.path == "/api/generate":
+            num_ctx = payload.get("options", {}).get("num_ctx", 4096)
+            size = 2_000_000_000 + num_ctx * 100_000
+            if self.server.vram_under_load is not None:
+                # Spill while the request runs, then settle back
+                self.server.loaded = self._entry(payload["model"], num_ctx, size, self.server.vram_under_load)
+                time.sleep(self.server.delay)
+            self.server.loaded = self._entry(payload["model"], num_ctx, size, self.server.vram)
+            self._reply(
+                200,
+                {
+                    "model": payload["model"],
+                    "response": "Hi",
+                    "done": True,
+                    "prompt_eval_count": 10,
+                    "prompt_eval_duration": 20_000_000,
+                    "eval_count": payload.get("options", {}).get("num_predict", 2),
+                    "eval_duration": 40_000_000,
+                },
+            )
+        elif self.path == "/api/show":
+            self._reply(200, {"parameters": self.server.parameters})
+        elif self.path == "/api/create":
+            self._reply(200, {"status": "success"})
+        else:
+            self._reply(404, {"error": "not found"})
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, vram: int) -> None:
+        super().__init__(("127.0.0.1", 0), StubOllamaHandler)
+        self.vram = vram
+        self.vram_under_load: int | None = None
+        self.delay = 0.0
+        self.parameters = ""
+        self.loaded: list[dict] = []
+        self.requests: list[tuple] = []
+        self.connections: set = set()
+
+
+class TestOllamaApiController(unittest.TestCase):
+    def setUp(self):
+        self.server = StubOllamaServer(vram=5_000_000_000)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        host = f"127.0.0.1:{self.server.server_address[1]}"
+        self.controller = OllamaApiController("granite4", host=host)
+
+    def tearDown(self):
+        self.controller.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_set_context_fits_on_gpu(self):
+        success, results = self.controller.set_context(8192)
+        self.assertTrue(success)
+        self.assertEqual(results["processor"], "100% GPU")
+        self.assertEqual(results["context_size"], 8192)
+        _, path, payload = self.server.requests[0]
+        self.assertEqual(path, "/api/generate")
+        self.assertEqual(payload["options"], {"num_ctx": 8192})
+
+    def test_set_context_offloaded(self):
+        success, results = self.controller.set_context(65536)
+        self.assertTrue(success)
+        self.assertEqual(results["processor"], "MIXED")
+
+    def test_probes_reuse_one_connection(self):
+        for size in (4096, 8192, 16384):
+            self.controller.set_context(size)
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_set_context_reports_rates(self):
+        self.controller.measure_tokens = 64
+        _, results = self.controller.set_context(8192)
+        self.assertEqual(self.server.requests[0][2]["options"]["num_predict"], 64)
+        self.assertAlmostEqual(results["prompt_tps"], 500.0)
+        self.assertAlmostEqual(results["eval_tps"], 1600.0)
+
+    def test_minimal_probe_only_loads(self):
+        self.controller.probe_mode = "minimal"
+        success, results = self.controller.set_context(8192)
+        self.assertTrue(success)
+        self.assertEqual(results["processor"], "100% GPU")
+        _, path, payload = self.server.requests[0]
+        self.assertEqual(payload["prompt"], "")
+        self.assertEqual(payload["keep_alive"], "5m")
+        self.assertEqual(payload["options"], {"num_ctx": 8192})
+
+    def test_parallel_probe_reports_aggregate_rate(self):
+        self.controller.parallel = 3
+        success, results = self.controller.set_context(8192)
+        self.assertTrue(success)
+        generates = [r for r in self.server.requests if r[1] == "/api/generate"]
+        self.assertEqual(len(generates), 4)
+        # The model is loaded alone first, with the same options
+        self.assertEqual(generates[0][2]["prompt"], "")
+        self.assertEqual(generates[0][2]["options"], generates[1][2]["options"])
+        self.assertEqual(generates[1][2]["options"]["num_predict"], 64)
+        # 3 x 64 tokens decoded side by side in 40 ms each
+        self.assertAlmostEqual(results["aggregate_tps"], 3 * 64 / 0.04)
+
+    def test_parallel_probe_keeps_placement_seen_under_load(self):
+        self.server.vram_under_load = 1_000_000_000
+        self.server.delay = 0.6
+        self.controller.parallel = 2
+        success, results = self.controller.set_context(8192)
+        self.assertTrue(success)
+        self.assertEqual(results["processor"], "MIXED")
+        # After the load the stub reports the model back on the GPU
+        self.assertEqual(self.controller.monitor_context()["processor"], "100% GPU")
+
+    def test_settling_reads_placement_from_sampler(self):
+        self.controller.enable_settling(stable_samples=2, interval=0.01, timeout=5)
+        success, results = self.controller.set_context(8192)
+        self.assertTrue(success)
+        self.assertEqual(results["processor"], "100% GPU")
+        self.assertIn("eval_tps", results)
+        ps_requests = [r for r in self.server.requests if r[1] == "/api/ps"]
+        self.assertGreaterEqual(len(ps_requests), 2)
+        # The sampler polls over its own connection
+        self.assertEqual(len(self.server.connections), 2)
+        # Sampling stops once the probe has settled
+        self.assertIsNone(self.controller.sampler._thread)
+        polled = len([r for r in self.server.requests if r[1] == "/api/ps"])
+        time.sleep(0.05)
+        self.assertEqual(
+            len([r for r in self.server.requests if r[1] == "/api/ps"]), polled
+        )
+
+    def test_monitor_context_model_not_loaded(self):
+        results = self.controller.monitor_context()
+        self.assertEqual(
+            results, {"context_size": None, "processor": None, "success": False}
+        )
+
+    def test_save_model_posts_create(self):
+        self.assertTrue(self.controller.save_model(12288))
+        _, path, payload = self.server.requests[-2]
+        self.assertEqual(path, "/api/create")
+        self.assertEqual(payload["from"], "granite4")
+        self.assertEqual(payload["parameters"], {"num_ctx": 12288})
+        self.assertEqual(self.controller.last_save["digest"], "abc123")
+
+    def test_save_model_replaces_existing_num_ctx(self):
+        self.server.parameters = 'num_ctx                        8192\nstop                           "<|im_end|>"'
+        self.assertTrue(self.controller.save_model(12288))
+        _, path, payload = self.server.requests[-2]
+        self.assertEqual(path, "/api/create")
+        self.assertEqual(
+            payload["parameters"], {"num_ctx": 12288, "stop": ["<|im_end|>"]}
+        )
+
+    def test_save_model_skips_unchanged(self):
+        self.server.parameters = "num_ctx                        12288"
+        self.assertTrue(self.controller.save_model(12288))
+        self.assertNotIn("/api/create", [r[1] for r in self.server.requests])
+        self.assertFalse(self.controller.last_save["changed"])
+
+    def test_connection_failure_reports_unsuccessful_probe(self):
+        controller = OllamaApiController("granite4", host="127.0.0.1:1")
+        success, results = controller.set_context(4096)
+        self.assertFalse(success)
+        self.assertFalse(results["success"])
+
+
+class TestHelpers(unittest.TestCase):
+    def test_processor_from_sizes(self):
+        self.assertEqual(processor_from_sizes(100, 100), "100% GPU")
+        self.assertEqual(processor_from_sizes(100, 40), "MIXED")
+        self.assertEqual(processor_from_sizes(100, 0), "CPU")
+        self.assertIsNone(processor_from_sizes(0, 0))
+
+    def test_generation_rates(self):
+        rates = generation_rates(
+            {"eval_count": 100, "eval_duration": 2_000_000_000, "prompt_eval_count": 0}
+        )
+        self.assertEqual(rates, {"prompt_tps": None, "eval_tps": 50.0})
+
+    def test_parse_parameters(self):
+        text = "\n".join(
+            [
+                'stop                           "<|start_header_id|>"',
+                'stop                           "<|end_header_id|>"',
+                "num_ctx                        8192",
+                "temperature                    0.6",
+            ]
+        )
+        self.assertEqual(
+            parse_parameters(text),
+            {
+                "stop": ["<|start_header_id|>", "<|end_header_id|>"],
+                "num_ctx": 8192,
+                "temperature": 0.6,
+            },
+        )
+
+    def test_client_host_parsing(self):
+        client = OllamaClient("http://gpu-box:8080")
+        self.assertEqual((client.host, client.port), ("gpu-box", 8080))
+        client = OllamaClient("10.0.0.5")
+        self.assertEqual((client.host, client.port), ("10.0.0.5", 11434))
+
+
+class TestSaveAgainstSimulator(unittest.TestCase):
+    def test_repeated_save_rebuilds_once(self):
+        model = SimulatedModel("llama3.1:8b", int(4.9 * GiB), parameters={"temperature": 0.6})
+        sim = SimulatedOllama(SimulatedGPU("12GB", 12 * GiB), [model])
+        server = SimulatedOllamaServer(sim).start()
+        controller = OllamaApiController("llama3.1:8b", host=server.host)
+        original = model.digest
+        try:
+            self.assertTrue(controller.save_model(32768))
+            first = controller.last_save
+            self.assertTrue(controller.save_model(32768))
+            second = controller.last_save
+        finally:
+            controller.close()
+            server.stop()
+        self.assertEqual(sim.creates, 1)
+        self.assertEqual(model.parameters, {"temperature": 0.6, "num_ctx": 32768})
+        self.assertNotEqual(first["digest"], original)
+        self.assertEqual(second["digest"], first["digest"])
+        self.assertFalse(second["changed"])
+
+
+class TestParallelAgainstSimulator(unittest.TestCase):
+    def test_boundary_accounts_for_parallel_slots(self):
+        model = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        sim = SimulatedOllama(SimulatedGPU("12GB", 12 * GiB), [model], num_parallel=4)
+        server = SimulatedOllamaServer(sim).start()
+        controller = OllamaApiController("llama3.1:8b", host=server.host)
+        controller.parallel = 4
+        try:
+            searcher = ContextSearcher(controller)
+            result = searcher.find_optimal_size(4096, model.context_length)
+        finally:
+            controller.close()
+            server.stop()
+        optimum = sim.optimum("llama3.1:8b")
+        self.assertLess(optimum, SimulatedOllama(sim.gpu, [model]).optimum("llama3.1:8b") / 3)
+        self.assertLessEqual(result, optimum)
+        self.assertGreater(result, optimum - 1000)
+        self.assertTrue(all(s.aggregate_tps for s in searcher.samples))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from ollama_controller import OllamaController, parse_gpu_fraction, parse_size
+from ollama_sim import GiB, SimulatedGPU, SimulatedModel, SimulatedOllama, SimulatedOllamaServer
+
+PS_OUTPUT = """NAME                         ID              SIZE      PROCESSOR          CONTEXT    UNTIL               
+granite4-custom:latest       500c8be7a076    2.4 GB    100% GPU           4343       59 minutes from now    
+qwen3-coder-custom:latest    2478a3f7c98a    34 GB     23%/77% CPU/GPU    262144     58 minutes from now    """
+
+
+def make_controller(model_name: str) -> OllamaController:
+    """Build a controller without spawning an interactive `ollama run`."""
+    controller = OllamaController.__new__(OllamaController)
+    controller.model_name = model_name
+    controller.monitor_process = None
+    controller.last_save = None
+    controller.probe_mode = "full"
+    controller._reply_limited = False
+    controller.sampler = None
+    return controller
+
+
+class TestMonitorContext(unittest.TestCase):
+    def test_reports_size_and_full_gpu(self):
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=PS_OUTPUT, returncode=0)
+            result = make_controller("granite4-custom:latest").monitor_context()
+        self.assertEqual(result["processor"], "100% GPU")
+        self.assertEqual(result["context_size"], 4343)
+        self.assertEqual(result["size"], 2_400_000_000)
+        self.assertEqual(result["gpu_fraction"], 1.0)
+
+    def test_settling_samples_only_while_the_probe_settles(self):
+        controller = make_controller("granite4-custom:latest")
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=PS_OUTPUT, returncode=0)
+            controller.enable_settling(stable_samples=2, interval=0.01, timeout=5)
+            self.assertEqual(mock_run.call_count, 0)
+            result = controller._settled_context(since=0)
+            polled = mock_run.call_count
+            time.sleep(0.05)
+        self.assertEqual(result["processor"], "100% GPU")
+        self.assertGreaterEqual(polled, 2)
+        self.assertEqual(mock_run.call_count, polled)
+
+    def test_reports_split_placement(self):
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=PS_OUTPUT, returncode=0)
+            result = make_controller("qwen3-coder-custom:latest").monitor_context()
+        self.assertEqual(result["processor"], "MIXED")
+        self.assertEqual(result["size"], 34_000_000_000)
+        self.assertAlmostEqual(result["gpu_fraction"], 0.77)
+
+
+class TestProbeModes(unittest.TestCase):
+    def probe(self, probe_mode: str, sizes: list[int]) -> list[str]:
+        controller = make_controller("granite4-custom:latest")
+        controller.probe_mode = probe_mode
+        controller.child = MagicMock()
+        with patch("subprocess.run") as mock_run:
+            mock_run.return_value = MagicMock(stdout=PS_OUTPUT, returncode=0)
+            for size in sizes:
+                success, results = controller.set_context(size)
+                self.assertTrue(success)
+                self.assertEqual(results["processor"], "100% GPU")
+        return [c.args[0] for c in controller.child.sendline.call_args_list]
+
+    def test_full_probe_sends_hello(self):
+        self.assertEqual(
+            self.probe("full", [4096]), ["/set parameter num_ctx 4096", "Hello"]
+        )
+
+    def test_minimal_probe_limits_reply_once(self):
+        self.assertEqual(
+            self.probe("minimal", [4096, 8192]),
+            [
+                "/set parameter num_predict 1",
+                "/set parameter num_ctx 4096",
+                "Hello",
+                "/set parameter num_ctx 8192",
+                "Hello",
+            ],
+        )
+
+
+class TestSaveModel(unittest.TestCase):
+    def test_saves_through_api_without_modelfile(self):
+        model = SimulatedModel("granite4:latest", 2 * GiB, parameters={"num_ctx": 4096})
+        sim = SimulatedOllama(SimulatedGPU("8GB", 8 * GiB), [model])
+        server = SimulatedOllamaServer(sim).start()
+        try:
+            with patch.dict(os.environ, {"OLLAMA_HOST": server.host}), patch(
+                "subprocess.run"
+            ) as mock_run:
+                controller = make_controller("granite4")
+                self.assertTrue(controller.save_model(16384))
+                self.assertTrue(controller.save_model(16384))
+        finally:
+            server.stop()
+        mock_run.assert_not_called()
+        self.assertEqual(model.parameters, {"num_ctx": 16384})
+        self.assertEqual(sim.creates, 1)
+        self.assertEqual(controller.last_save["digest"], model.digest)
+
+
+class TestParsers(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size("512 MB"), 512_000_000)
+        self.assertEqual(parse_size("1.5 TB"), 1_500_000_000_000)
+        self.assertIsNone(parse_size("GB"))
+
+    def test_parse_gpu_fraction(self):
+        self.assertEqual(parse_gpu_fraction("100% GPU"), 1.0)
+        self.assertEqual(parse_gpu_fraction("100% CPU"), 0.0)
+        self.assertAlmostEqual(parse_gpu_fraction("23%/77% CPU/GPU"), 0.77)
+        self.assertIsNone(parse_gpu_fraction("unknown"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import socket
+import unittest
+from unittest.mock import patch
+
+import main
+from ollama_api import OllamaClient
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+from packing import PackItem, Packer, allocate, fit_line, format_packing, parse_pack_spec
+
+GPU = SimulatedGPU("24GB", 24 * GiB)
+
+
+class TestAllocate(unittest.TestCase):
+    def item(self, model, min_ctx, target_ctx, weight, slope):
+        return PackItem(model, min_ctx, target_ctx, weight, intercept=1 * GiB, slope=slope)
+
+    def test_spare_bytes_go_to_most_weight_per_byte_first(self):
+        cheap = self.item("cheap", 4096, 65536, 1.0, 32768)
+        dear = self.item("dear", 4096, 65536, 1.0, 131072)
+        capacity = 2 * GiB + 4096 * (131072 + 32768) + 30000 * 32768
+        assignment = allocate([dear, cheap], capacity, granularity=1)
+        self.assertEqual(assignment["cheap"], 4096 + 30000)
+        self.assertEqual(assignment["dear"], 4096)
+
+    def test_weight_can_outrank_a_cheaper_kv_cache(self):
+        cheap = self.item("cheap", 4096, 65536, 1.0, 32768)
+        dear = self.item("dear", 4096, 16384, 10.0, 131072)
+        capacity = 2 * GiB + 4096 * (131072 + 32768) + 12288 * 131072
+        assignment = allocate([cheap, dear], capacity)
+        self.assertEqual(assignment["dear"], 16384)
+        self.assertEqual(assignment["cheap"], 4096)
+
+    def test_targets_cap_the_allocation(self):
+        a = self.item("a", 2048, 8192, 1.0, 1024)
+        assignment = allocate([a], 100 * GiB)
+        self.assertEqual(assignment, {"a": 8192})
+
+    def test_minimums_that_do_not_fit(self):
+        a = self.item("a", 4096, 8192, 1.0, 131072)
+        with self.assertRaises(ValueError):
+            allocate([a], 1 * GiB)
+
+
+class TestParsing(unittest.TestCase):
+    def test_pack_spec(self):
+        item = parse_pack_spec("qwen3:8b=4096,32768,2")
+        self.assertEqual(
+            (item.model, item.min_ctx, item.target_ctx, item.weight),
+            ("qwen3:8b", 4096, 32768, 2.0),
+        )
+        self.assertEqual(parse_pack_spec("embed=512,2048").weight, 1.0)
+        for bad in ("qwen3", "qwen3=4096", "qwen3=8192,4096", "qwen3=4096,8192,0"):
+            with self.subTest(spec=bad), self.assertRaises(ValueError):
+                parse_pack_spec(bad)
+
+    def test_fit_line_recovers_a_linear_size(self):
+        intercept, slope = fit_line([(4096, 1000 + 4096 * 3), (8192, 1000 + 8192 * 3)])
+        self.assertAlmostEqual(intercept, 1000)
+        self.assertAlmostEqual(slope, 3)
+
+
+class TestPacker(unittest.TestCase):
+    def setUp(self):
+        self.chat = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        self.coder = SimulatedModel(
+            "qwen2.5-coder:7b", int(4.7 * GiB), layers=28, head_count_kv=4
+        )
+        self.embed = SimulatedModel(
+            "nomic-embed-text", int(0.3 * GiB), layers=12, head_count_kv=12, head_dim=64
+        )
+        self.sim = SimulatedOllama(GPU, [self.chat, self.coder, self.embed])
+        self.server = SimulatedOllamaServer(self.sim).start()
+        self.client = OllamaClient(self.server.host)
+        self.items = [
+            PackItem(self.chat.name, 8192, 131072, 2.0),
+            PackItem(self.coder.name, 8192, 131072, 1.0),
+            PackItem(self.embed.name, 2048, 8192, 1.0),
+        ]
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def assertAllOnGpu(self):
+        loaded = {entry["name"]: entry for entry in self.sim.ps()}
+        self.assertEqual(set(loaded), {item.model for item in self.items})
+        for entry in loaded.values():
+            self.assertEqual(entry["size"], entry["size_vram"])
+
+    def test_packs_every_model_on_the_gpu(self):
+        packer = Packer(self.client, self.items, GPU.vram_bytes)
+        assignment = packer.pack()
+        self.assertEqual(packer.rounds, 1)
+        self.assertAllOnGpu()
+        self.assertEqual(assignment[self.embed.name], 8192)
+        for item in self.items:
+            self.assertGreaterEqual(item.num_ctx, item.min_ctx)
+            self.assertLessEqual(item.num_ctx, item.target_ctx)
+        # The spare VRAM is used up to within a granule of every model
+        used = sum(entry["size"] for entry in self.sim.ps())
+        self.assertLess(GPU.vram_bytes - used, 3 * 256 * self.chat.kv_bytes_per_token)
+
+    def test_measurements_are_reused_across_rounds(self):
+        packer = Packer(self.client, self.items, GPU.vram_bytes + 2 * GiB)
+        packer.pack()
+        self.assertGreater(packer.rounds, 1)
+        self.assertAllOnGpu()
+        measure_loads = 2 * len(self.items)
+        self.assertEqual(self.sim.loads, measure_loads + len(self.items) * packer.rounds)
+
+    def test_save_writes_each_assigned_context(self):
+        packer = Packer(self.client, self.items, GPU.vram_bytes)
+        packer.pack()
+        saved = packer.save()
+        self.assertTrue(all(saved.values()))
+        for item, model in zip(self.items, (self.chat, self.coder, self.embed)):
+            self.assertEqual(model.parameters["num_ctx"], item.num_ctx)
+        self.assertIn("nomic-embed-text", format_packing(self.items, saved))
+
+    def test_minimums_that_cannot_fit_together(self):
+        items = [
+            PackItem(self.chat.name, 131072, 131072),
+            PackItem(self.coder.name, 131072, 131072),
+        ]
+        with self.assertRaises(ValueError):
+            Packer(self.client, items, GPU.vram_bytes).pack()
+
+    def test_unreachable_daemon_exits_cleanly(self):
+        with socket.socket() as free:
+            free.bind(("127.0.0.1", 0))
+            host = f"127.0.0.1:{free.getsockname()[1]}"
+        argv = [
+            "main.py",
+            "--pack", f"{self.chat.name}=4096,8192",
+            "--backend", "api",
+            "--host", host,
+            "--vram-budget", "24",
+        ]
+        with patch("sys.argv", argv), self.assertLogs("main", "ERROR"):
+            with self.assertRaises(SystemExit) as exit:
+                main.main()
+        self.assertEqual(exit.exception.code, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
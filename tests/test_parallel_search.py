@@ -0,0 +1,126 @@
+import unittest
+
+import main
+
+from context_searcher import ContextSearcher
+from ollama_api import OllamaApiController
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+from parallel_search import EndpointPool, ParallelContextSearcher
+
+MODEL = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+GPU = SimulatedGPU("12GB", 12 * GiB)
+
+
+class TestParallelContextSearcher(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def start_servers(self, count: int, generate_delay: float = 0.0) -> list[str]:
+        hosts = []
+        for _ in range(count):
+            server = SimulatedOllamaServer(
+                SimulatedOllama(GPU, [MODEL]), generate_delay=generate_delay
+            ).start()
+            self.servers.append(server)
+            hosts.append(server.host)
+        return hosts
+
+    def search(self, pool: EndpointPool) -> tuple[int, ParallelContextSearcher]:
+        pool.check_health()
+        searcher = ParallelContextSearcher(pool)
+        try:
+            return (searcher.find_optimal_size(4096, MODEL.context_length), searcher)
+        finally:
+            pool.close()
+
+    def assertNearOptimum(self, result: int) -> None:
+        optimum = SimulatedOllama(GPU, [MODEL]).optimum(MODEL.name)
+        self.assertLessEqual(result, optimum)
+        self.assertGreater(result, optimum - 1000)
+
+    def test_kary_search_needs_fewer_rounds_than_bisect(self):
+        result, searcher = self.search(EndpointPool(MODEL.name, self.start_servers(3)))
+        self.assertNearOptimum(result)
+
+        sim = SimulatedOllama(GPU, [MODEL])
+        server = SimulatedOllamaServer(sim).start()
+        self.servers.append(server)
+        controller = OllamaApiController(MODEL.name, host=server.host)
+        bisect = ContextSearcher(controller)
+        bisect.find_optimal_size(4096, MODEL.context_length)
+        controller.close()
+        # One probe at max_size precedes the rounds in both searches
+        self.assertLess(searcher.rounds, len(bisect.samples) - 1)
+
+    def test_probes_are_spread_over_endpoints(self):
+        self.search(EndpointPool(MODEL.name, self.start_servers(3)))
+        for server in self.servers:
+            generates = [r for r in server.requests if r[1] == "/api/generate"]
+            self.assertGreater(len(generates), 0)
+
+    def test_unreachable_endpoint_is_excluded(self):
+        hosts = self.start_servers(2) + ["127.0.0.1:1"]
+        pool = EndpointPool(MODEL.name, hosts, health_timeout=1)
+        result, _ = self.search(pool)
+        self.assertNearOptimum(result)
+        dead = pool.endpoints[-1]
+        self.assertFalse(dead.healthy)
+        self.assertIn("health check failed", dead.reason)
+
+    def test_endpoint_that_times_out_is_excluded(self):
+        hosts = self.start_servers(2)
+        slow = SimulatedOllamaServer(
+            SimulatedOllama(GPU, [MODEL]), generate_delay=2
+        ).start()
+        self.servers.append(slow)
+        pool = EndpointPool(MODEL.name, [slow.host] + hosts, probe_timeout=0.5)
+        result, searcher = self.search(pool)
+        self.assertNearOptimum(result)
+        self.assertFalse(pool.endpoints[0].healthy)
+        self.assertIn("timed out", pool.endpoints[0].reason)
+        # The size the slow host dropped was measured elsewhere, not as a failure
+        self.assertTrue(all(s.processor is not None for s in searcher.samples))
+
+    def test_validation_runs_on_a_healthy_endpoint(self):
+        hosts = ["127.0.0.1:1"] + self.start_servers(2)
+        report = main.optimise(
+            MODEL.name,
+            endpoints=hosts,
+            validate=True,
+            max=MODEL.context_length,
+            no_cache=True,
+            no_estimate=True,
+        )
+        self.assertTrue(report.ok, report.error)
+        self.assertNearOptimum(report.num_ctx)
+
+    def test_interpolate_is_overridden_with_a_warning(self):
+        pool = EndpointPool(MODEL.name, self.start_servers(2))
+        pool.check_health()
+        searcher = ParallelContextSearcher(pool, strategy="interpolate")
+        try:
+            with self.assertLogs("parallel_search", "WARNING") as logs:
+                result = searcher.find_optimal_size(4096, MODEL.context_length)
+        finally:
+            pool.close()
+        self.assertNearOptimum(result)
+        self.assertIn("interpolate strategy", logs.output[0])
+
+    def test_no_healthy_endpoints(self):
+        pool = EndpointPool(MODEL.name, ["127.0.0.1:1"], health_timeout=1)
+        with self.assertRaises(RuntimeError):
+            self.search(pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
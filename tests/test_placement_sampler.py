@@ -0,0 +1,82 @@
+import threading
+import time
+import unittest
+
+from placement_sampler import PlacementSampler
+
+
+def reading(processor: str | None, context_size: int | None = 8192) -> dict:
+    return {
+        "context_size": context_size if processor else None,
+        "processor": processor,
+        "success": processor is not None,
+    }
+
+
+class ScriptedSource:
+    """Returns each scripted reading in turn, then repeats the last one."""
+
+    def __init__(self, readings: list[dict]) -> None:
+        self.readings = list(readings)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> dict:
+        with self._lock:
+            index = min(self.calls, len(self.readings) - 1)
+            self.calls += 1
+            return self.readings[index]
+
+
+class TestPlacementSampler(unittest.TestCase):
+    def test_waits_for_identical_samples(self):
+        source = ScriptedSource(
+            [reading(None), reading("MIXED"), reading("100% GPU")]
+        )
+        with PlacementSampler(source, interval=0.01) as sampler:
+            settled = sampler.wait_stable(stable_samples=3, timeout=5)
+        self.assertEqual(settled["processor"], "100% GPU")
+        self.assertGreaterEqual(source.calls, 5)
+
+    def test_not_loaded_is_never_settled(self):
+        source = ScriptedSource([reading(None)])
+        with PlacementSampler(source, interval=0.01) as sampler:
+            settled = sampler.wait_stable(stable_samples=2, timeout=0.2)
+        self.assertFalse(settled["success"])
+
+    def test_window_settles_before_sample_count(self):
+        source = ScriptedSource([reading("100% GPU")])
+        with PlacementSampler(source, interval=0.05) as sampler:
+            started = time.monotonic()
+            settled = sampler.wait_stable(stable_samples=1000, window=0.1, timeout=5)
+        self.assertEqual(settled["processor"], "100% GPU")
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_ignores_samples_before_since(self):
+        source = ScriptedSource([reading("100% GPU", 4096)])
+        with PlacementSampler(source, interval=0.01) as sampler:
+            sampler.wait_stable(stable_samples=2, timeout=5)
+            since = time.monotonic()
+            source.readings = [reading("MIXED", 65536)]
+            settled = sampler.wait_stable(since, stable_samples=2, timeout=5)
+        self.assertEqual(settled["context_size"], 65536)
+        self.assertTrue(all(t >= since for t, _ in sampler.samples(since)))
+
+    def test_buffer_is_bounded(self):
+        source = ScriptedSource([reading("100% GPU")])
+        with PlacementSampler(source, interval=0, capacity=4) as sampler:
+            while source.calls < 10:
+                time.sleep(0.01)
+        self.assertEqual(len(sampler.samples()), 4)
+
+    def test_sample_errors_are_unsuccessful_readings(self):
+        def failing():
+            raise OSError("connection refused")
+
+        with PlacementSampler(failing, interval=0.01) as sampler:
+            settled = sampler.wait_stable(timeout=0.1)
+        self.assertFalse(settled["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import main
+from context_searcher import ContextSearcher
+from probe_cache import ProbeCache, make_fingerprint
+from tests.test_context_searcher import FakeController
+
+FINGERPRINT = make_fingerprint("sha256:abc", "0.12.0", "RTX 4090/24564/570.86")
+
+
+class TestProbeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "probes.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_persists_between_instances(self):
+        ProbeCache(self.path).put(FINGERPRINT, 8192, {"processor": "100% GPU"})
+        entry = ProbeCache(self.path).get(FINGERPRINT, 8192)
+        self.assertEqual(entry["processor"], "100% GPU")
+
+    def test_concurrent_instances_keep_each_others_probes(self):
+        first, second = ProbeCache(self.path), ProbeCache(self.path)
+        other = make_fingerprint("sha256:def", "0.12.0", "L4/23034/570.86")
+        first.put(FINGERPRINT, 8192, {"processor": "100% GPU"})
+        second.put(other, 4096, {"processor": "MIXED"})
+        first.put(FINGERPRINT, 16384, {"processor": "MIXED"})
+        reloaded = ProbeCache(self.path)
+        self.assertEqual(list(reloaded.entries_for(FINGERPRINT)), [8192, 16384])
+        self.assertEqual(reloaded.get(other, 4096)["processor"], "MIXED")
+
+    def test_fingerprint_isolates_results(self):
+        cache = ProbeCache(self.path)
+        cache.put(FINGERPRINT, 8192, {"processor": "100% GPU"})
+        other = make_fingerprint("sha256:abc", "0.13.0", "RTX 4090/24564/570.86")
+        self.assertIsNone(cache.get(other, 8192))
+        self.assertEqual(list(cache.entries_for(FINGERPRINT)), [8192])
+
+    def test_lru_eviction(self):
+        cache = ProbeCache(self.path, max_entries=2)
+        cache.put(FINGERPRINT, 1, {"processor": "100% GPU"})
+        cache.put(FINGERPRINT, 2, {"processor": "100% GPU"})
+        cache.get(FINGERPRINT, 1)
+        cache.put(FINGERPRINT, 3, {"processor": "MIXED"})
+        self.assertIsNone(cache.get(FINGERPRINT, 2))
+        self.assertIsNotNone(cache.get(FINGERPRINT, 1))
+        self.assertEqual(len(ProbeCache(self.path, max_entries=2)), 2)
+
+    def test_unreadable_file_is_ignored(self):
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertEqual(len(ProbeCache(self.path)), 0)
+
+
+class TestCachedSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "probes.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def search(self, controller: FakeController) -> int:
+        searcher = ContextSearcher(
+            controller, cache=ProbeCache(self.path), fingerprint=FINGERPRINT
+        )
+        return searcher.find_optimal_size(4096, 131072)
+
+    def test_repeat_run_does_not_probe(self):
+        first = FakeController(boundary=70000)
+        expected = self.search(first)
+        self.assertTrue(first.probes)
+
+        second = FakeController(boundary=70000)
+        self.assertEqual(self.search(second), expected)
+        self.assertEqual(second.probes, [])
+
+    def test_interrupted_search_resumes(self):
+        class Interrupted(FakeController):
+            def set_context(self, size):
+                if len(self.probes) == 3:
+                    raise KeyboardInterrupt
+                return super().set_context(size)
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.search(Interrupted(boundary=70000))
+
+        resumed = FakeController(boundary=70000)
+        result = self.search(resumed)
+        self.assertLessEqual(result, 70000)
+        self.assertGreater(result, 70000 - 1000)
+
+        blind = FakeController(boundary=70000)
+        ContextSearcher(blind).find_optimal_size(4096, 131072)
+        self.assertEqual(len(resumed.probes), len(blind.probes) - 3)
+
+    def test_remote_host_needs_a_gpu_label(self):
+        tags = [{"name": "llama3.1:8b", "digest": "sha256:abc"}]
+        with patch("main.OllamaClient.tags", return_value=tags), patch(
+            "main.OllamaClient.version", return_value="0.12.0"
+        ), patch("main.detect_gpu_fingerprint", return_value="RTX 4090/24564/570.86"):
+            self.assertIsNone(main.resolve_fingerprint("llama3.1:8b", host="gpu-9:11434"))
+            self.assertEqual(
+                main.resolve_fingerprint("llama3.1:8b", host="gpu-9:11434", gpu="L4"),
+                make_fingerprint("sha256:abc", "0.12.0", "L4"),
+            )
+            self.assertEqual(
+                main.resolve_fingerprint("llama3.1:8b", host="localhost:11434"),
+                FINGERPRINT,
+            )
+
+    def test_no_fingerprint_disables_cache(self):
+        searcher = ContextSearcher(FakeController(boundary=70000), cache=ProbeCache(self.path))
+        searcher.find_optimal_size(4096, 131072)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
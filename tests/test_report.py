@@ -0,0 +1,177 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+
+import main
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+from report import EXIT_FAILED, EXIT_NOT_SAVED, EXIT_OK, OptimiseReport, ProbeRecord
+
+GPU = SimulatedGPU("24GB", 24 * GiB)
+
+
+class TestReport(unittest.TestCase):
+    def test_exit_codes(self):
+        report = OptimiseReport("llama3.1:8b", "bisect", "fit", 4096)
+        self.assertEqual(report.exit_code, EXIT_FAILED)
+        report.num_ctx = 65536
+        self.assertEqual(report.exit_code, EXIT_NOT_SAVED)
+        report.saved = True
+        self.assertEqual(report.exit_code, EXIT_OK)
+        report.cancelled = True
+        self.assertEqual(report.exit_code, 130)
+
+    def test_records_are_slotted(self):
+        record = ProbeRecord(4096, "100% GPU")
+        with self.assertRaises(AttributeError):
+            record.note = "x"
+
+
+class TestLibraryApi(unittest.TestCase):
+    def setUp(self):
+        self.model = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        self.sim = SimulatedOllama(GPU, [self.model])
+        self.server = SimulatedOllamaServer(self.sim).start()
+        self.options = {
+            "host": self.server.host,
+            "max": 131072,
+            "no_cache": True,
+            "no_estimate": True,
+        }
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_report_of_a_search(self):
+        report = main.optimise(self.model.name, **self.options)
+        self.assertTrue(report.ok, report.error)
+        self.assertEqual(report.exit_code, EXIT_OK)
+        self.assertEqual(report.strategy, "bisect")
+        optimum = self.sim.optimum(self.model.name, 131072)
+        self.assertLessEqual(optimum - report.num_ctx, 1000)
+        self.assertGreaterEqual(optimum, report.num_ctx)
+        self.assertIn(131072, [probe.num_ctx for probe in report.probes])
+        for probe in report.probes:
+            with self.subTest(num_ctx=probe.num_ctx):
+                self.assertIsNotNone(probe.placement)
+                self.assertIsNotNone(probe.load_seconds)
+                self.assertGreater(probe.elapsed, 0)
+        self.assertGreater(report.elapsed, 0)
+
+        data = json.loads(json.dumps(report.to_dict()))
+        self.assertEqual(data["num_ctx"], report.num_ctx)
+        self.assertEqual(len(data["probes"]), len(report.probes))
+
+    def test_failures_are_reported_not_raised(self):
+        report = main.optimise("missing:latest", **self.options)
+        self.assertFalse(report.ok)
+        self.assertIsNotNone(report.error)
+        self.assertEqual(report.exit_code, EXIT_FAILED)
+        self.assertTrue(all(probe.error for probe in report.probes))
+
+    def test_nothing_on_gpu_is_a_failure(self):
+        gpu = SimulatedGPU("8GB", 8 * GiB)
+        large = SimulatedModel("llama3.1:70b", 30 * GiB)
+        sim = SimulatedOllama(gpu, [large])
+        server = SimulatedOllamaServer(sim).start()
+        self.addCleanup(server.stop)
+        report = main.optimise(large.name, **{**self.options, "host": server.host})
+        self.assertFalse(report.saved)
+        self.assertIsNone(report.num_ctx)
+        self.assertIn("fit entirely on the GPU", report.error)
+        self.assertEqual(report.exit_code, EXIT_FAILED)
+        self.assertTrue(report.probes)
+        self.assertTrue(all(probe.placement != "100% GPU" for probe in report.probes))
+        self.assertEqual(sim.creates, 0)
+
+    def test_joint_search_fills_the_report(self):
+        report = main.optimise(self.model.name, num_batch=[256, 1024], **self.options)
+        self.assertTrue(report.ok, report.error)
+        self.assertIn(report.options["num_batch"], (256, 1024))
+        self.assertEqual(report.server, "default")
+        batches = {probe.options["num_batch"] for probe in report.probes}
+        self.assertEqual(batches, {256, 1024})
+        self.assertTrue(all(probe.options["server"] == "default" for probe in report.probes))
+
+    def test_unknown_budget_opens_no_controller(self):
+        args = main.build_parser().parse_args(
+            ["--model", self.model.name, "--backend", "api", "--headroom", "2", "--no-cache"]
+        )
+        with patch("main.detect_vram_budget", return_value=None), patch(
+            "main.OllamaApiController"
+        ) as controller:
+            report = main.optimise_report(self.model.name, args, 131072)
+        self.assertIn("VRAM budget", report.error)
+        controller.assert_not_called()
+
+    def test_unknown_option(self):
+        with self.assertRaises(TypeError):
+            main.optimise(self.model.name, colour="blue")
+
+    def test_options_are_checked_like_the_command_line(self):
+        invalid = [
+            {"min": 8192, "max": 4096},
+            {"headroom": -1.0},
+            {"tolerance": 0},
+            {"fill_levels": [150]},
+            {"backend": "cli"},
+        ]
+        for options in invalid:
+            with self.subTest(options=options), self.assertRaises(ValueError):
+                main.optimise(self.model.name, **{**self.options, **options})
+        self.assertEqual(self.server.requests, [])
+
+    def test_remote_host_needs_a_vram_budget(self):
+        remote = {**self.options, "host": "gpu-9:11434", "headroom": 2.0}
+        with patch("main.detect_vram_budget", return_value=24 * GiB) as detect:
+            with self.assertRaises(ValueError):
+                main.optimise(self.model.name, **remote)
+            self.assertIsNone(
+                main.estimate_max_context(self.model.name, None, "f16", host="gpu-9:11434")
+            )
+        detect.assert_not_called()
+        args = main.build_parser().parse_args(
+            ["--fleet", "gpu-9:11434", "--model", self.model.name, "--backend", "api", "--headroom", "2"]
+        )
+        with self.assertRaises(ValueError):
+            main.check_args(args)
+        args.vram_budget = 24.0
+        main.check_args(args)
+
+    def test_watch_cannot_isolate(self):
+        args = main.build_parser().parse_args(["--watch", "--isolate"])
+        with self.assertRaises(ValueError):
+            main.check_args(args)
+
+    def test_json_output_and_exit_code(self):
+        argv = [
+            "main.py",
+            "--model", self.model.name,
+            "--backend", "api",
+            "--host", self.server.host,
+            "--max", "131072",
+            "--no-cache",
+            "--no-estimate",
+            "--json",
+        ]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch("sys.argv", argv), redirect_stdout(stdout), redirect_stderr(stderr):
+            with self.assertRaises(SystemExit) as exit:
+                main.main()
+        self.assertEqual(exit.exception.code, EXIT_OK)
+        data = json.loads(stdout.getvalue())
+        self.assertEqual(data["model"], self.model.name)
+        self.assertTrue(data["saved"])
+        # The trace summary is moved out of the way of the JSON
+        self.assertIn("PHASE", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
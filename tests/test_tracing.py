@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import unittest
+
+from context_searcher import ContextSearcher
+from ollama_api import OllamaApiController
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+from tracing import TRACER, Tracer
+
+
+class TestTracer(unittest.TestCase):
+    def test_span_records_args_and_outcome(self):
+        tracer = Tracer()
+        with tracer.span("set_context", num_ctx=8192) as record:
+            record["outcome"] = "100% GPU"
+        (event,) = tracer.events
+        self.assertEqual(event["name"], "set_context")
+        self.assertEqual(event["args"], {"num_ctx": 8192, "outcome": "100% GPU"})
+        self.assertGreaterEqual(event["duration"], 0)
+
+    def test_exception_is_recorded_and_raised(self):
+        tracer = Tracer()
+        with self.assertRaises(TimeoutError):
+            with tracer.span("probe"):
+                raise TimeoutError("budget")
+        self.assertEqual(tracer.events[0]["args"]["outcome"], "error: TimeoutError: budget")
+
+    def test_disabled_tracer_records_nothing(self):
+        tracer = Tracer()
+        tracer.enabled = False
+        with tracer.span("probe"):
+            pass
+        self.assertEqual(tracer.events, [])
+
+    def test_summary_and_exports(self):
+        tracer = Tracer()
+        for size in (4096, 8192):
+            with tracer.span("probe", num_ctx=size):
+                pass
+        with tracer.span("save_model"):
+            pass
+        summary = tracer.summary()
+        self.assertEqual(list(summary), ["probe", "save_model"])
+        self.assertEqual(summary["probe"]["count"], 2)
+        self.assertIn("save_model", tracer.format_summary())
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            chrome_path = os.path.join(tmpdir, "trace.json")
+            jsonl_path = os.path.join(tmpdir, "trace.jsonl")
+            tracer.export_chrome(chrome_path)
+            tracer.export_jsonl(jsonl_path)
+            with open(chrome_path) as f:
+                events = json.load(f)["traceEvents"]
+            with open(jsonl_path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual([e["ph"] for e in events], ["X", "X", "X"])
+        self.assertEqual(events[1]["args"]["num_ctx"], 8192)
+        self.assertEqual(len(lines), 3)
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_search_phases_are_traced(self):
+        TRACER.reset()
+        model = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        sim = SimulatedOllama(SimulatedGPU("12GB", 12 * GiB), [model])
+        server = SimulatedOllamaServer(sim).start()
+        controller = OllamaApiController("llama3.1:8b", host=server.host)
+        try:
+            searcher = ContextSearcher(controller)
+            searcher.find_optimal_size(4096, 131072)
+            controller.save_model(4096)
+        finally:
+            controller.close()
+            server.stop()
+
+        summary = TRACER.summary()
+        probes = len(searcher.samples)
+        for phase in ("probe", "set_context", "set_context.generate", "monitor_context"):
+            self.assertEqual(summary[phase]["count"], probes)
+        self.assertEqual(summary["save_model"]["count"], 1)
+        first = next(e for e in TRACER.events if e["name"] == "probe")
+        self.assertEqual(first["args"]["num_ctx"], 131072)
+        self.assertEqual(first["args"]["outcome"], "MIXED")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from ollama_api import OllamaApiController
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+from validation import StressValidator, format_fill_curve, synthetic_prompt
+
+GPU = SimulatedGPU("24GB", 24 * GiB)
+
+
+class TestSyntheticPrompt(unittest.TestCase):
+    def test_length_and_unique_prefix(self):
+        first, second = synthetic_prompt(500, 1), synthetic_prompt(500, 2)
+        self.assertEqual(len(first.split()), 500)
+        self.assertNotEqual(first.split()[0], second.split()[0])
+
+
+class TestStressValidator(unittest.TestCase):
+    def setUp(self):
+        # 128 KiB of KV cache and 64 KiB of prefill scratch per token: 100k
+        # tokens load on the GPU, but only about 84k still fit when full
+        self.model = SimulatedModel(
+            "llama3.1:8b", 8 * GiB, prefill_bytes_per_token=64 * 1024
+        )
+        self.sim = SimulatedOllama(GPU, [self.model])
+        self.server = SimulatedOllamaServer(self.sim).start()
+        self.controller = OllamaApiController(self.model.name, host=self.server.host)
+
+    def tearDown(self):
+        self.controller.close()
+        self.server.stop()
+
+    def test_fill_levels_on_gpu(self):
+        validator = StressValidator(self.controller)
+        self.assertEqual(validator.run(65536, 4096), 65536)
+        self.assertEqual([r.level for r in validator.results], [0.25, 0.5, 0.9, 1.0])
+        for result in validator.results:
+            with self.subTest(level=result.level):
+                self.assertTrue(result.ok)
+                self.assertGreater(result.ttft, 0)
+                self.assertGreater(result.prefill_tps, 0)
+        # The 100% prompt fills the context up to the reserve
+        self.assertGreater(validator.results[-1].prompt_tokens, 65536 - 100)
+
+    def test_steps_down_until_full_prompt_fits(self):
+        validator = StressValidator(self.controller)
+        size = validator.run(100000, 4096)
+        self.assertLess(size, 100000)
+        full = self.model.weights_bytes + self.model.overhead_bytes + size * 192 * 1024
+        self.assertLessEqual(full, GPU.vram_bytes)
+        failed = [r for r in validator.results if not r.ok]
+        self.assertEqual(failed[0].num_ctx, 100000)
+        self.assertEqual(failed[0].processor, "MIXED")
+        self.assertTrue(all(r.ok for r in validator.results if r.num_ctx == size))
+        self.assertIn("MIXED", format_fill_curve(self.model.name, validator.results))
+
+    def test_gives_up_at_minimum(self):
+        validator = StressValidator(self.controller, max_steps=1)
+        with self.assertRaises(RuntimeError):
+            validator.run(100000, 4096)
+        with self.assertRaises(RuntimeError):
+            StressValidator(self.controller).run(100000, 99000)
+
+    def test_request_errors_fail_the_level(self):
+        controller = OllamaApiController("missing:latest", host=self.server.host)
+        self.addCleanup(controller.close)
+        validator = StressValidator(controller, max_steps=0)
+        with self.assertRaises(RuntimeError):
+            validator.run(8192, 4096)
+        self.assertIn("not found", validator.results[0].error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import urllib.request
+
+from ollama_api import OllamaClient
+from ollama_sim import (
+    GiB,
+    SimulatedGPU,
+    SimulatedModel,
+    SimulatedOllama,
+    SimulatedOllamaServer,
+)
+from tracing import Tracer
+from watch import MetricsServer, Watcher, latency_histograms
+
+GPU = SimulatedGPU("12GB", 12 * GiB)
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tuned = SimulatedModel("llama3.1:8b", int(4.9 * GiB))
+        self.other = SimulatedModel("qwen2.5:14b", int(8.9 * GiB), layers=48)
+        self.sim = SimulatedOllama(GPU, [self.tuned, self.other])
+        self.server = SimulatedOllamaServer(self.sim).start()
+        self.client = OllamaClient(self.server.host)
+        self.flagged = []
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def take_vram(self):
+        """Another model takes VRAM and the tuned one is reloaded around it."""
+        self.sim.unload(self.tuned.name)
+        self.sim.load(self.other.name, {"num_ctx": 4096})
+        self.sim.load(self.tuned.name, {"num_ctx": 16384})
+
+    def test_regression_from_gpu_is_flagged_once(self):
+        self.sim.load(self.tuned.name, {"num_ctx": 16384})
+        watcher = Watcher(self.client, on_regression=self.flagged.append)
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.states[self.tuned.name].processor, "100% GPU")
+
+        self.take_vram()
+        regressions = watcher.poll()
+        self.assertEqual([r.model for r in regressions], [self.tuned.name])
+        self.assertEqual(regressions[0].previous, "100% GPU")
+        self.assertEqual(regressions[0].processor, "MIXED")
+        self.assertEqual(regressions[0].context_length, 16384)
+        self.assertEqual(self.flagged, regressions)
+
+        # Still offloaded, but no new regression
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.regressions, {self.tuned.name: 1})
+
+    def test_only_matching_models_are_flagged(self):
+        self.sim.load(self.tuned.name, {"num_ctx": 16384})
+        watcher = Watcher(self.client, patterns=["qwen*"])
+        watcher.poll()
+        self.take_vram()
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.states[self.tuned.name].processor, "MIXED")
+
+    def test_one_request_per_poll_for_all_models(self):
+        self.sim.load(self.other.name, {"num_ctx": 4096})
+        self.sim.load(self.tuned.name, {"num_ctx": 4096})
+        watcher = Watcher(self.client, interval=0.01)
+        watcher.run(max_polls=3)
+        self.assertEqual(len(watcher.states), 2)
+        self.assertEqual([r[1] for r in self.server.requests], ["/api/ps"] * 3)
+
+    def test_metrics_endpoint(self):
+        self.sim.load(self.tuned.name, {"num_ctx": 16384})
+        watcher = Watcher(self.client)
+        watcher.poll()
+        metrics = MetricsServer(watcher, port=0, bind="127.0.0.1").start()
+        try:
+            with urllib.request.urlopen(f"http://{metrics.host}/metrics", timeout=5) as reply:
+                text = reply.read().decode()
+        finally:
+            metrics.stop()
+        self.assertIn('ollama_model_on_gpu{model="llama3.1:8b"} 1', text)
+        self.assertIn('ollama_model_context_length{model="llama3.1:8b"} 16384', text)
+        self.assertIn("# TYPE ollama_offload_regressions_total counter", text)
+        self.assertIn("ollama_watch_polls_total 1", text)
+
+
+class TestLatencyHistograms(unittest.TestCase):
+    def test_probe_spans_become_cumulative_buckets(self):
+        tracer = Tracer()
+        for duration in (0.2, 0.7, 3.0):
+            tracer.events.append({"name": "probe", "duration": duration})
+        counts, total, count = latency_histograms(tracer.events, (0.5, 1.0, 5.0))["probe"]
+        self.assertEqual(counts, [1, 2, 3])
+        self.assertAlmostEqual(total, 3.9)
+        self.assertEqual(count, 3)
+
+        watcher = Watcher(None, tracer=tracer)
+        text = watcher.format_metrics()
+        self.assertIn('optimise_span_seconds_bucket{phase="probe",le="1"} 2', text)
+        self.assertIn('optimise_span_seconds_bucket{phase="probe",le="+Inf"} 3', text)
+        self.assertIn('optimise_span_seconds_count{phase="probe"} 3', text)
+
+        # Spans are folded into the totals and no longer kept by the tracer
+        self.assertEqual(tracer.events, [])
+        tracer.events.append({"name": "probe", "duration": 0.1})
+        text = watcher.format_metrics()
+        self.assertEqual(tracer.events, [])
+        self.assertIn('optimise_span_seconds_bucket{phase="probe",le="0.05"} 0', text)
+        self.assertIn('optimise_span_seconds_bucket{phase="probe",le="0.1"} 1', text)
+        self.assertIn('optimise_span_seconds_count{phase="probe"} 4', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class Tracer:
+    """
+    Records timed spans for the phases of a run.
+
+    Spans can be exported as a Chrome trace-event file (chrome://tracing,
+    Perfetto) or as JSON lines, and summarised per phase.
+    """
+
+    def __init__(self) -> None:
+        self.events: list[dict] = []
+        self.enabled = True
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.events.clear()
+            self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[dict]:
+        """
+        Time the enclosed block as one span.
+
+        Yields a dict that the block can add fields to, for example the
+        "outcome" of the phase. An exception escaping the block is recorded
+        as the outcome and re-raised.
+        """
+        record = dict(args)
+        if not self.enabled:
+            yield record
+            return
+
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.setdefault("outcome", f"error: {type(e).__name__}: {e}")
+            raise
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "start": start - self._origin,
+                "end": end - self._origin,
+                "duration": end - start,
+                "thread": threading.get_ident(),
+                "args": record,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def drain(self) -> list[dict]:
+        """Remove and return the recorded spans, for consumers that fold them into totals."""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def summary(self) -> dict[str, dict]:
+        """Count, total, mean and max seconds per span name, in first-seen order."""
+        summary: dict[str, dict] = {}
+        for event in self.events:
+            row = summary.setdefault(
+                event["name"], {"count": 0, "total": 0.0, "max": 0.0}
+            )
+            row["count"] += 1
+            row["total"] += event["duration"]
+            row["max"] = max(row["max"], event["duration"])
+        for row in summary.values():
+            row["mean"] = row["total"] / row["count"]
+        return summary
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        width = max([len("PHASE")] + [len(name) for name in summary])
+        lines = [f"{'PHASE':<{width}}  {'COUNT':>5}  {'TOTAL':>9}  {'MEAN':>8}  {'MAX':>8}"]
+        for name, row in summary.items():
+            lines.append(
+                f"{name:<{width}}  {row['count']:>5}  {row['total']:>8.2f}s  "
+                f"{row['mean']:>7.2f}s  {row['max']:>7.2f}s"
+            )
+        return "\n".join(lines)
+
+    def export_chrome(self, path: str) -> None:
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": event["name"],
+                "cat": event["name"].split(".", 1)[0],
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": pid,
+                "tid": event["thread"],
+                "args": event["args"],
+            }
+            for event in self.events
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def export_jsonl(self, path: str) -> None:
+        with open(path, "w") as f:
+            for event in self.events:
+                f.write(json.dumps(event, default=str) + "\n")
+
+
+# Process-wide tracer that the controllers and searcher record into
+TRACER = Tracer()
+
+
+def span(name: str, **args):
+    """Shorthand for TRACER.span()."""
+    return TRACER.span(name, **args)
@@ -0,0 +1,180 @@
+import http.client
+import logging
+import time
+from dataclasses import dataclass
+from ollama_api import OllamaApiController, OllamaApiError, generation_rates
+from tracing import span
+
+TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+# Fractions of num_ctx the synthetic prompts fill
+DEFAULT_FILL_LEVELS = (0.25, 0.5, 0.9, 1.0)
+# Tokens decoded after each prompt; enough for a first token, little more
+VALIDATE_PREDICT_TOKENS = 8
+# Tokens left free for the prompt template and the reply at the 100% level
+FILL_RESERVE_TOKENS = 64
+# Fraction of num_ctx dropped each time a size fails validation
+DEFAULT_STEP_DOWN = 0.05
+DEFAULT_MAX_STEPS = 5
+
+# Filler vocabulary of common words, which tokenizers keep as single tokens
+_FILLER_WORDS = (
+    "the quick brown fox jumps over a lazy dog while river stones shine "
+    "under morning light and old trees grow near quiet green hills"
+).split()
+
+logger = logging.getLogger(__name__)
+
+
+def _log(message: str) -> None:
+    logger.info(f"[{time.strftime(TIMEFORMAT)}] {message}")
+
+
+@dataclass
+class FillResult:
+    """One synthetic prompt sent at a context fill level."""
+
+    level: float
+    num_ctx: int
+    prompt_tokens: int | None = None
+    # Seconds from the request to the first token: load plus prompt eval
+    ttft: float | None = None
+    prefill_tps: float | None = None
+    processor: str | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.processor == "100% GPU"
+
+
+def synthetic_prompt(words: int, seed: int = 0) -> str:
+    """
+    A filler prompt of about ``words`` words.
+
+    It opens with a marker unique to the seed so that no two prompts share
+    a prefix and Ollama cannot answer part of one from its prompt cache.
+    """
+    filler = (_FILLER_WORDS[(seed + i) % len(_FILLER_WORDS)] for i in range(max(words - 1, 0)))
+    return " ".join([f"[fill-{seed}-{time.monotonic_ns()}]", *filler])
+
+
+class StressValidator:
+    """
+    Fills a chosen context size with synthetic prompts before it is saved.
+
+    A size that loads on the GPU can still spill once a long prompt is
+    being processed. Each size is filled at the given levels in turn,
+    recording time-to-first-token and prefill speed, and the placement is
+    checked after every prompt. When a level leaves the GPU or fails, the
+    size is stepped down and validated again.
+    """
+
+    def __init__(
+        self,
+        controller: OllamaApiController,
+        levels: tuple[float, ...] = DEFAULT_FILL_LEVELS,
+        step_down: float = DEFAULT_STEP_DOWN,
+        min_step: int = 0,
+        max_steps: int = DEFAULT_MAX_STEPS,
+        timeout: float | None = None,
+    ) -> None:
+        self.controller = controller
+        self.levels = tuple(sorted(levels))
+        self.step_down = step_down
+        self.min_step = min_step
+        self.max_steps = max_steps
+        self.timeout = timeout
+        # Tokens per filler word, measured from the first response
+        self.tokens_per_word: float | None = None
+        self.results: list[FillResult] = []
+        self._prompts = 0
+
+    def fill(self, num_ctx: int, level: float) -> FillResult:
+        """Send one prompt filling ``level`` of num_ctx and check the placement."""
+        result = FillResult(level, num_ctx)
+        target = max(int(num_ctx * level) - VALIDATE_PREDICT_TOKENS - FILL_RESERVE_TOKENS, 1)
+        words = max(int(target / (self.tokens_per_word or 1.0)), 1)
+        self._prompts += 1
+        options = {"num_ctx": num_ctx, "num_predict": VALIDATE_PREDICT_TOKENS}
+        with span("validate.fill", num_ctx=num_ctx, level=level) as record:
+            started = time.monotonic()
+            try:
+                response = self.controller.client.generate(
+                    self.controller.model_name,
+                    synthetic_prompt(words, self._prompts),
+                    options=options,
+                    timeout=self.timeout,
+                )
+            except (OllamaApiError, OSError, http.client.HTTPException) as e:
+                result.error = str(e) or type(e).__name__
+                record["outcome"] = f"error: {result.error}"
+                return result
+            elapsed = time.monotonic() - started
+
+            result.prompt_tokens = response.get("prompt_eval_count")
+            if result.prompt_tokens and self.tokens_per_word is None:
+                self.tokens_per_word = result.prompt_tokens / words
+            phases = response.get("load_duration", 0) + response.get("prompt_eval_duration", 0)
+            result.ttft = phases / 1e9 if phases else elapsed
+            result.prefill_tps = generation_rates(response)["prompt_tps"]
+
+            reading = self.controller.monitor_context()
+            result.processor = reading["processor"] if reading["success"] else None
+            if result.processor is None:
+                result.error = "model not found after the prompt"
+            record["outcome"] = result.processor or "not_found"
+            record["prompt_tokens"] = result.prompt_tokens
+        return result
+
+    def validate(self, num_ctx: int) -> bool:
+        """Fill num_ctx at every level, stopping at the first that fails."""
+        _log(f"Validating num_ctx {num_ctx} at {len(self.levels)} fill level(s)")
+        for level in self.levels:
+            result = self.fill(num_ctx, level)
+            self.results.append(result)
+            if not result.ok:
+                logger.warning(
+                    f"num_ctx {num_ctx} failed at {level:.0%} fill: "
+                    f"{result.error or result.processor}"
+                )
+                return False
+        return True
+
+    def run(self, num_ctx: int, min_size: int) -> int:
+        """
+        Validate num_ctx, stepping down until a size holds at every level.
+
+        Returns:
+            The largest validated size
+
+        Raises:
+            RuntimeError: if no size down to min_size passes within max_steps
+        """
+        size = num_ctx
+        for _ in range(self.max_steps + 1):
+            if self.validate(size):
+                if size != num_ctx:
+                    _log(f"Stepped down from num_ctx {num_ctx} to {size}")
+                return size
+            size -= max(int(size * self.step_down), self.min_step, 1)
+            if size < min_size:
+                break
+        raise RuntimeError(
+            f"No context size from {num_ctx} down to {max(size, min_size)} "
+            "stayed on the GPU with a full prompt"
+        )
+
+
+def format_fill_curve(model_name: str, results: list[FillResult]) -> str:
+    lines = [
+        f"Fill validation for {model_name}:",
+        f"{'NUM_CTX':>8}  {'FILL':>5}  {'PROMPT':>8}  {'TTFT':>8}  {'PREFILL':>12}  PLACEMENT",
+    ]
+    for r in results:
+        ttft = f"{r.ttft:.2f}s" if r.ttft is not None else "-"
+        prefill = f"{r.prefill_tps:.1f} tok/s" if r.prefill_tps else "-"
+        lines.append(
+            f"{r.num_ctx:>8}  {r.level:>5.0%}  {r.prompt_tokens or '-':>8}  {ttft:>8}  "
+            f"{prefill:>12}  {r.error or r.processor}"
+        )
+    return "\n".join(lines)
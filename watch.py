@@ -0,0 +1,309 @@
+import fnmatch
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from ollama_api import OllamaClient, normalise_model_name, processor_from_sizes
+from tracing import TRACER, Tracer
+
+TIMEFORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_WATCH_INTERVAL = 5.0
+DEFAULT_METRICS_PORT = 9464
+# Upper bounds in seconds of the span latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _log(message: str) -> None:
+    logger.info(f"[{time.strftime(TIMEFORMAT)}] {message}")
+
+
+@dataclass
+class ModelState:
+    """The latest /api/ps reading for one loaded model."""
+
+    model: str
+    size: int = 0
+    size_vram: int = 0
+    context_length: int = 0
+    processor: str | None = None
+    regressions: int = 0
+
+
+@dataclass
+class Regression:
+    """A watched model that left the GPU while it stayed loaded."""
+
+    model: str
+    previous: str
+    processor: str
+    context_length: int
+    size: int
+    size_vram: int
+
+
+class Watcher:
+    """
+    Polls placement, size and context of every loaded model.
+
+    Each poll is a single /api/ps request covering all models, so watching
+    costs nothing per model and spawns no processes. A watched model that
+    goes from "100% GPU" to MIXED or CPU while it stays loaded, for example
+    because another workload took VRAM, is reported as a regression and
+    handed to on_regression.
+
+    Spans recorded by the tracer are drained into cumulative latency
+    histograms after every poll, so a long watch does not keep them all.
+    """
+
+    def __init__(
+        self,
+        client: OllamaClient,
+        interval: float = DEFAULT_WATCH_INTERVAL,
+        patterns: list[str] | None = None,
+        on_regression: Callable[[Regression], None] | None = None,
+        tracer: Tracer = TRACER,
+    ) -> None:
+        self.client = client
+        self.tracer = tracer
+        self.interval = interval
+        self.patterns = patterns or []
+        self.on_regression = on_regression
+        self.states: dict[str, ModelState] = {}
+        self.regressions: dict[str, int] = {}
+        self.polls = 0
+        self.poll_errors = 0
+        self.last_poll_seconds = 0.0
+        self.latency: dict[str, tuple[list[int], float, int]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def watches(self, model: str) -> bool:
+        """Whether regressions of model are flagged (every model when no patterns are given)."""
+        if not self.patterns:
+            return True
+        name = normalise_model_name(model)
+        return any(
+            fnmatch.fnmatchcase(name, normalise_model_name(pattern))
+            or fnmatch.fnmatchcase(model, pattern)
+            for pattern in self.patterns
+        )
+
+    def poll(self) -> list[Regression]:
+        """Read /api/ps once, update every model's state and return new regressions."""
+        started = time.monotonic()
+        try:
+            entries = self.client.ps()
+        except Exception as e:
+            with self._lock:
+                self.poll_errors += 1
+            logger.warning(f"Could not read loaded models: {e}")
+            self.fold_spans()
+            return []
+
+        regressions = []
+        states = {}
+        for entry in entries:
+            name = normalise_model_name(entry.get("name", ""))
+            size, size_vram = int(entry.get("size", 0)), int(entry.get("size_vram", 0))
+            with self._lock:
+                count = self.regressions.get(name, 0)
+            state = ModelState(
+                name,
+                size,
+                size_vram,
+                int(entry.get("context_length", 0)),
+                processor_from_sizes(size, size_vram),
+                count,
+            )
+            previous = self.states.get(name)
+            if (
+                previous is not None
+                and previous.processor == "100% GPU"
+                and state.processor in ("MIXED", "CPU")
+                and self.watches(name)
+            ):
+                state.regressions += 1
+                with self._lock:
+                    self.regressions[name] = state.regressions
+                regressions.append(
+                    Regression(
+                        name,
+                        previous.processor,
+                        state.processor,
+                        state.context_length,
+                        size,
+                        size_vram,
+                    )
+                )
+            states[name] = state
+
+        with self._lock:
+            self.states = states
+            self.polls += 1
+            self.last_poll_seconds = time.monotonic() - started
+
+        for regression in regressions:
+            _log(
+                f"Regression: {regression.model} moved from {regression.previous} to "
+                f"{regression.processor} at num_ctx {regression.context_length} "
+                f"({regression.size_vram / 1024**3:.2f} of {regression.size / 1024**3:.2f} GiB in VRAM)"
+            )
+            if self.on_regression is not None:
+                self.on_regression(regression)
+                # The handler may have reloaded the model; start from a fresh reading
+                with self._lock:
+                    self.states.pop(regression.model, None)
+        self.fold_spans()
+        return regressions
+
+    def fold_spans(self) -> None:
+        """Move the tracer's spans into the latency histograms."""
+        events = self.tracer.drain()
+        with self._lock:
+            latency_histograms(events, into=self.latency)
+
+    def run(self, max_polls: int | None = None) -> None:
+        """Poll every interval until stop() is called or max_polls is reached."""
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.poll()
+            if max_polls is not None and self.polls >= max_polls:
+                break
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def format_metrics(self) -> str:
+        """All readings, counters and span latency histograms in the Prometheus text format."""
+        self.fold_spans()
+        with self._lock:
+            states = list(self.states.values())
+            regressions = dict(self.regressions)
+            polls, errors, seconds = self.polls, self.poll_errors, self.last_poll_seconds
+            latency = {
+                phase: (list(counts), total, count)
+                for phase, (counts, total, count) in self.latency.items()
+            }
+
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+        def model(name: str) -> str:
+            return '{model="' + _escape(name) + '"}'
+
+        gauges = [
+            ("ollama_model_size_bytes", "Loaded size of the model.", lambda s: s.size),
+            ("ollama_model_vram_bytes", "Part of the loaded size held in VRAM.", lambda s: s.size_vram),
+            (
+                "ollama_model_gpu_ratio",
+                "Share of the loaded size held in VRAM.",
+                lambda s: s.size_vram / s.size if s.size else 0.0,
+            ),
+            ("ollama_model_context_length", "num_ctx the model is loaded with.", lambda s: s.context_length),
+            (
+                "ollama_model_on_gpu",
+                "1 if the model is loaded entirely on the GPU.",
+                lambda s: 1 if s.processor == "100% GPU" else 0,
+            ),
+        ]
+        for name, help_text, value in gauges:
+            metric(name, "gauge", help_text, [(model(s.model), value(s)) for s in states])
+        metric(
+            "ollama_offload_regressions_total",
+            "counter",
+            "Times a watched model moved from 100% GPU to MIXED or CPU.",
+            [(model(name), count) for name, count in regressions.items()],
+        )
+        metric("ollama_watch_polls_total", "counter", "/api/ps polls made.", [("", polls)])
+        metric("ollama_watch_poll_errors_total", "counter", "/api/ps polls that failed.", [("", errors)])
+        metric("ollama_watch_poll_seconds", "gauge", "Duration of the last /api/ps poll.", [("", seconds)])
+
+        histogram = []
+        for phase, (counts, total, count) in latency.items():
+            phase = _escape(phase)
+            for bound, cumulative in zip(LATENCY_BUCKETS, counts):
+                histogram.append((f'_bucket{{phase="{phase}",le="{bound:g}"}}', cumulative))
+            histogram.append((f'_bucket{{phase="{phase}",le="+Inf"}}', count))
+            histogram.append((f'_sum{{phase="{phase}"}}', total))
+            histogram.append((f'_count{{phase="{phase}"}}', count))
+        metric(
+            "optimise_span_seconds",
+            "histogram",
+            "Duration of the probe, load, placement and save phases of optimisation runs.",
+            histogram,
+        )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def latency_histograms(
+    events: list[dict],
+    buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    into: dict[str, tuple[list[int], float, int]] | None = None,
+) -> dict[str, tuple[list[int], float, int]]:
+    """
+    Cumulative bucket counts, total seconds and count of the spans, per span
+    name. With into, the spans are added to those histograms.
+    """
+    histograms = into if into is not None else {}
+    for event in events:
+        counts, total, count = histograms.get(event["name"], ([0] * len(buckets), 0.0, 0))
+        for i, bound in enumerate(buckets):
+            if event["duration"] <= bound:
+                counts[i] += 1
+        histograms[event["name"]] = (counts, total + event["duration"], count + 1)
+    return histograms
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.watcher.format_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Serves a Watcher's readings at /metrics for Prometheus to scrape."""
+
+    daemon_threads = True
+
+    def __init__(self, watcher: Watcher, port: int = DEFAULT_METRICS_PORT, bind: str = "") -> None:
+        super().__init__((bind, port), _MetricsHandler)
+        self.watcher = watcher
+        self._thread: threading.Thread | None = None
+
+    @property
+    def host(self) -> str:
+        return f"{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()